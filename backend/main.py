@@ -9,6 +9,7 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from routes import tracker
 from routes import forms as public_forms
 from routes.admin import forms as admin_forms
+from routes.admin import scoring as admin_scoring
 from routes import leads
 from routes import dashboard
 from routes import links
@@ -19,36 +20,51 @@ from routes import analytics
 from routes import oauth
 from routes import creatives
 from routes import billing
+from routes.billing import reconcile_subscription_metrics
 from routes import logs
-from services.meta_sync import sync_meta_account
-from database import get_supabase
+from routes import webhooks
+from services.meta_sync_scheduler import meta_sync_scheduler, TICK_SECONDS as META_SYNC_TICK_SECONDS
+from services.attribution import backfill_lead_attribution
+from services.logger import log_pipeline
+from services.log_retention import run_log_retention
+from services.webhook_dispatcher import webhook_dispatcher, purge_webhook_outbox
+from services.meta_capi import capi_sender
+from services.scheduler_leases import scheduler_leases
+from services.scanner_ingest import scanner_pipeline
 
 load_dotenv()
 
 app = FastAPI(title="Funila API", version="1.0.0")
 scheduler = AsyncIOScheduler()
 
-async def sync_all_accounts():
-    try:
-        supabase = get_supabase()
-        if supabase:
-            # Fetch distinct client_ids that have ad_accounts
-            res = supabase.table('ad_accounts').select('client_id').execute()
-            if res.data:
-                client_ids = set(acc['client_id'] for acc in res.data)
-                for cid in client_ids:
-                    await sync_meta_account(cid)
-    except Exception as e:
-        print(f"Scheduler Sync Error: {e}")
-
 @app.on_event('startup')
 async def startup_event():
     try:
-        scheduler.add_job(sync_all_accounts, 'interval', hours=4)
+        # Cada job só executa no worker que tem o lease dele (scheduler_leases)
+        # Sync Meta escalonado por cliente (meta_sync_schedule); o tick só sincroniza os vencidos
+        scheduler.add_job(scheduler_leases.job("meta_sync", meta_sync_scheduler.run_due), 'interval',
+                          seconds=META_SYNC_TICK_SECONDS, max_instances=1, coalesce=True)
+        scheduler.add_job(scheduler_leases.job("lead_attribution_backfill", backfill_lead_attribution), 'interval', hours=24)
+        scheduler.add_job(scheduler_leases.job("subscription_metrics", reconcile_subscription_metrics), 'cron', hour=3)
+        scheduler.add_job(scheduler_leases.job("log_retention", run_log_retention), 'cron', hour=4)
+        scheduler.add_job(scheduler_leases.job("webhook_outbox_purge", purge_webhook_outbox), 'cron', hour=4, minute=30)
+        scheduler_leases.start()
         scheduler.start()
     except Exception as e:
         print(f"Scheduler startup error: {e}")
 
+    # Entrega de webhooks do outbox em background
+    webhook_dispatcher.start()
+
+@app.on_event('shutdown')
+async def shutdown_event():
+    await scheduler_leases.stop()
+    await webhook_dispatcher.stop()
+    await capi_sender.stop()
+    # Grava os logs e eventos do scanner ainda em buffer antes de encerrar o worker
+    await log_pipeline.stop()
+    await scanner_pipeline.stop()
+
 # CORS Configuration
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "https://funila-app.onrender.com,http://localhost:3000").split(",")
 
@@ -58,6 +74,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Total das listagens paginadas (/links, /admin/master/clients)
+    expose_headers=["X-Total-Count"],
 )
 
 @app.get("/health")
@@ -70,6 +88,7 @@ def health():
 app.include_router(tracker.router)
 app.include_router(public_forms.router)
 app.include_router(admin_forms.router)
+app.include_router(admin_scoring.router)
 app.include_router(leads.router)
 app.include_router(dashboard.router)
 app.include_router(links.router)
@@ -81,6 +100,7 @@ app.include_router(oauth.router)
 app.include_router(creatives.router)
 app.include_router(billing.router)
 app.include_router(logs.router)
+app.include_router(webhooks.router)
 
 # ------------------------------------------------------------------------------
 # STATIC FILES (Frontend)
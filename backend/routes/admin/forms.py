@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, Body
 from database import get_supabase
 from dependencies import require_client
+from services.form_config import rebuild_public_form_config
 
 router = APIRouter(prefix="/admin/forms", tags=["Admin Forms"])
 
@@ -53,7 +54,13 @@ def update_form_config(
 
     try:
         supabase.table("client_form_config").upsert(upsert_data, on_conflict="client_id, field_id").execute()
-        return {"status": "success"}
     except Exception as e:
         print(f"Erro ao salvar config: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+    # Formulário público pré-renderizado
+    try:
+        rebuild_public_form_config(client_id, supabase)
+    except Exception as e:
+        print(f"Erro ao reconstruir config pública do formulário: {e}")
+    return {"status": "success"}
@@ -1,8 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from database import get_supabase
 from dependencies import require_master
+from services.cache import response_cache, ROUTE_TTLS
+from services.logger import log_pipeline
+from services.webhook_dispatcher import webhook_dispatcher
+from services.webhook_registry import registry_stats
+from services.meta_capi import capi_sender
+from services.meta_sync_scheduler import meta_sync_scheduler
+from services.scheduler_leases import scheduler_leases
+from services.form_config import rebuild_public_form_config, form_config_stats
+from services.scanner_ingest import active_clients, scanner_stats
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime, timedelta
 from jose import jwt
 import os
@@ -31,6 +40,46 @@ class ClientUpdate(BaseModel):
 def get_master_metrics(user_profile: dict = Depends(require_master)):
     supabase = get_supabase()
 
+    # Snapshot mantido incrementalmente pelo billing (apply_subscription_transition)
+    # e reconciliado todas as noites; não varre subscriptions.
+    try:
+        snap_res = supabase.table("subscription_metrics").select("mrr_cents, active_count").eq("id", 1).execute()
+        snapshot = snap_res.data[0] if snap_res.data else None
+    except Exception as e:
+        logger.error(f"Erro ao ler subscription_metrics: {e}")
+        snapshot = None
+
+    if snapshot is None:
+        return _master_metrics_from_subscriptions(supabase)
+
+    since = (datetime.utcnow() - timedelta(days=30)).date().isoformat()
+    history = supabase.table("subscription_metrics_daily")\
+        .select("day, mrr_cents, active_count, cancellations")\
+        .gte("day", since)\
+        .order("day")\
+        .execute().data or []
+
+    mrr = (snapshot["mrr_cents"] or 0) / 100
+    active_count = snapshot["active_count"] or 0
+    cancelled_count = sum(d["cancellations"] or 0 for d in history)
+
+    # Churn: cancelled / (active + cancelled), mesma fórmula de antes
+    base = active_count + cancelled_count
+    churn_rate = round((cancelled_count / base) * 100, 2) if base > 0 else 0
+
+    return {
+        "mrr": mrr,
+        "arr": mrr * 12,
+        "churn_rate": churn_rate,
+        "total_clients": active_count, # Active clients paying
+        "mrr_history": [
+            {"date": d["day"], "mrr": (d["mrr_cents"] or 0) / 100, "active": d["active_count"]}
+            for d in history
+        ]
+    }
+
+def _master_metrics_from_subscriptions(supabase):
+    """Cálculo direto sobre subscriptions (antes da migration de subscription_metrics)."""
     # Fetch active subscriptions for MRR/ARR
     subs_res = supabase.table("subscriptions").select("mrr_cents").eq("status", "active").execute()
     active_subs = subs_res.data or []
@@ -38,11 +87,6 @@ def get_master_metrics(user_profile: dict = Depends(require_master)):
     mrr = sum(sub['mrr_cents'] for sub in active_subs) / 100
     arr = mrr * 12
 
-    # Calculate Churn (Cancelled last 30 days / Active 30 days ago)
-    # Active 30 days ago approx = current active + cancelled last 30 days - new last 30 days.
-    # Simplified: Base = Active + Cancelled (assuming all cancelled were active 30 days ago).
-    # Precise formula: cancelled_last_30_days / active_at_start_of_period
-
     # Fetch cancelled in last 30 days
     thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
 
@@ -56,7 +100,6 @@ def get_master_metrics(user_profile: dict = Depends(require_master)):
     # Active count
     active_count = len(active_subs)
 
-    # Base active 30 days ago ~ active_count + cancelled_count (ignoring new subs for simplicity or fetching creation date)
     # Let's use strict formula: cancelled / (active + cancelled)
     base = active_count + cancelled_count
     churn_rate = round((cancelled_count / base) * 100, 2) if base > 0 else 0
@@ -65,36 +108,92 @@ def get_master_metrics(user_profile: dict = Depends(require_master)):
         "mrr": mrr,
         "arr": arr,
         "churn_rate": churn_rate,
-        "total_clients": active_count # Active clients paying
+        "total_clients": active_count, # Active clients paying
+        "mrr_history": []
     }
 
+@router.get("/cache/stats")
+def get_cache_stats(user_profile: dict = Depends(require_master)):
+    """
+    Estatísticas do cache de respostas de analytics (hits, misses, 304s, invalidações)
+    por rota. Valores locais ao worker que atendeu a requisição.
+    """
+    return {**response_cache.stats(), "public_forms": form_config_stats()}
+
+@router.get("/logs/pipeline")
+def get_log_pipeline_stats(user_profile: dict = Depends(require_master)):
+    """
+    Contadores do pipeline de logs (enfileirados, gravados, amostrados, descartados,
+    spill local) do worker que atendeu a requisição.
+    """
+    return log_pipeline.stats()
+
+@router.get("/scanner/pipeline")
+def get_scanner_pipeline_stats(user_profile: dict = Depends(require_master)):
+    """
+    Ingestão do scanner.js: eventos enfileirados/gravados/spill do buffer de
+    external_events e cache de clientes ativos do worker que atendeu.
+    """
+    return scanner_stats()
+
+@router.get("/webhooks/outbox")
+def get_webhook_outbox_stats(user_profile: dict = Depends(require_master)):
+    """
+    Entregas de webhooks: profundidade da fila (global), latência de entrega,
+    falhas, circuitos abertos e contadores do dispatcher e do registro de webhooks
+    deste worker.
+    """
+    return {**webhook_dispatcher.stats(), "registry": registry_stats()}
+
+@router.get("/capi/stats")
+def get_capi_stats(user_profile: dict = Depends(require_master)):
+    """
+    Envio em lote para a Conversions API: eventos enfileirados, deduplicados, enviados
+    e com falha, tamanho dos lotes e latência dos POSTs do worker que atendeu.
+    """
+    return capi_sender.stats()
+
+@router.get("/meta/sync-schedule")
+def get_meta_sync_schedule(user_profile: dict = Depends(require_master)):
+    """
+    Agenda do sync Meta: próximo horário, duração e status do último sync de cada
+    cliente, e contadores de ticks/syncs do worker que atendeu.
+    """
+    return meta_sync_scheduler.stats()
+
+@router.get("/scheduler")
+def get_scheduler_status(user_profile: dict = Depends(require_master)):
+    """
+    Jobs agendados: instância que mantém o lease de cada job, validade do lease e
+    última execução (quem rodou, duração, status).
+    """
+    return scheduler_leases.status()
+
 @router.get("/clients")
-def list_clients(user_profile: dict = Depends(require_master)):
+def list_clients(
+    response: Response,
+    page: Optional[int] = Query(None, ge=1),
+    limit: int = Query(200, ge=1, le=500),
+    user_profile: dict = Depends(require_master)
+):
+    """Clientes com health score. Paginado só com `page` (total em X-Total-Count); sem ele, todos."""
     supabase = get_supabase()
-    clients = supabase.table("clients").select("*").order("created_at", desc=True).execute().data
 
-    # Calculate health score for each client (last 24h errors)
-    # This is an N+1 query, optimization: fetch all error logs in last 24h grouped by client
-    # For now, simplistic approach or just fetch counts
-
-    twenty_four_hours_ago = (datetime.utcnow() - timedelta(hours=24)).isoformat()
+    query = supabase.table("clients").select("*", count="exact").order("created_at", desc=True)
+    if page is not None:
+        start = (page - 1) * limit
+        query = query.range(start, start + limit - 1)
+    res = query.execute()
+    clients = res.data or []
+    response.headers["X-Total-Count"] = str(res.count if res.count is not None else len(clients))
 
+    # Health score (erros nas últimas 24h): uma consulta agrupada para a página inteira,
+    # reaproveitada por alguns segundos entre recarregamentos do painel.
     try:
-        # Fetch error counts per client in one go if possible, or loop (simple for now)
-        # Supabase doesn't support easy GROUP BY via JS/Python client without RPC
-        # We will do a lightweight loop for now, assuming < 100 clients.
-        # Production: Use RPC function `get_client_health_metrics`
+        errors_by_client = _client_health_metrics([c["id"] for c in clients], page, limit, supabase)
 
         for client in clients:
-            # Check recent errors
-            err_res = supabase.table("logs")\
-                .select("id", count="exact")\
-                .eq("client_id", client["id"])\
-                .eq("level", "error")\
-                .gte("created_at", twenty_four_hours_ago)\
-                .execute()
-
-            client["recent_errors"] = err_res.count or 0
+            client["recent_errors"] = errors_by_client.get(client["id"], 0)
 
             # Determine status
             if client["recent_errors"] > 10:
@@ -112,6 +211,26 @@ def list_clients(user_profile: dict = Depends(require_master)):
 
     return clients
 
+
+def _client_health_metrics(client_ids: List[str], page: Optional[int], limit: int, supabase) -> Dict[str, int]:
+    if not client_ids:
+        return {}
+
+    params = {"page": page, "limit": limit}
+    entry = response_cache.get("client_health", "master", params)
+    if entry is not None:
+        return entry.payload
+
+    twenty_four_hours_ago = (datetime.utcnow() - timedelta(hours=24)).isoformat()
+    rows = supabase.rpc("get_client_health_metrics", {
+        "p_since":      twenty_four_hours_ago,
+        "p_client_ids": client_ids,
+    }).execute().data or []
+
+    errors_by_client = {r["client_id"]: r["recent_errors"] or 0 for r in rows}
+    response_cache.set("client_health", "master", params, errors_by_client, ROUTE_TTLS["client_health"])
+    return errors_by_client
+
 @router.post("/clients")
 def create_client(client: ClientCreate, user_profile: dict = Depends(require_master)):
     supabase = get_supabase()
@@ -185,6 +304,8 @@ def create_client(client: ClientCreate, user_profile: dict = Depends(require_mas
 
         raise HTTPException(status_code=500, detail="Erro ao configurar permissões do usuário.")
 
+    # Scanner passa a aceitar eventos do novo cliente sem esperar o TTL
+    active_clients.invalidate()
     return new_client
 
 @router.patch("/clients/{client_id}")
@@ -194,11 +315,22 @@ def update_client(client_id: str, update: ClientUpdate, user_profile: dict = Dep
     if not data:
         return {"status": "sem alterações"}
     try:
-        return supabase.table("clients").update(data).eq("id", client_id).execute().data
+        updated = supabase.table("clients").update(data).eq("id", client_id).execute().data
     except Exception as e:
         logger.error(f"Erro ao atualizar cliente {client_id}: {e}")
         raise HTTPException(status_code=500, detail="Erro ao atualizar cliente.")
 
+    if "active" in data:
+        active_clients.invalidate()
+
+    # Plano e status ativo fazem parte do formulário público pré-renderizado
+    if data.keys() & {"plan", "active"}:
+        try:
+            rebuild_public_form_config(client_id, supabase)
+        except Exception as e:
+            logger.error(f"Erro ao reconstruir formulário público de {client_id}: {e}")
+    return updated
+
 @router.post("/impersonate/{client_id}")
 def impersonate_client(client_id: str, user_profile: dict = Depends(require_master)):
     supabase = get_supabase()
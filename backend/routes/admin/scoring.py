@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timezone
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+from database import get_supabase
+from dependencies import require_client
+from services.cache import invalidate_client_cache
+from services.scoring_engine import (
+    DEFAULT_RULES, RESCORE_TAIL_MARGIN, VERSION_CHECK_INTERVAL,
+    invalidate_scorer, load_rules, rescore_client, rescore_recent, validate_rules,
+)
+
+router = APIRouter(prefix="/admin/scoring", tags=["Admin Scoring"])
+
+
+class ScoringRules(BaseModel):
+    rules: Dict[str, Any]
+
+
+def _rescore(client_id: str, saved_at: Optional[str] = None):
+    try:
+        started = time.monotonic()
+        summary = rescore_client(client_id)
+        print(f"Leads repontuados para {client_id}: {summary}")
+        if saved_at:
+            # Outros workers só percebem a nova versão em até VERSION_CHECK_INTERVAL:
+            # leads criados nessa janela são repontuados depois que ela fecha.
+            wait = VERSION_CHECK_INTERVAL + RESCORE_TAIL_MARGIN - (time.monotonic() - started)
+            if wait > 0:
+                time.sleep(wait)
+            tail = rescore_recent(client_id, saved_at)
+            print(f"Leads recentes repontuados para {client_id}: {tail}")
+        invalidate_client_cache(client_id)
+    except Exception as e:
+        print(f"Erro ao repontuar leads de {client_id}: {e}")
+
+
+@router.get("/")
+def get_scoring_rules(user_profile: dict = Depends(require_client)):
+    client_id = user_profile["client_id"]
+    rules, version = load_rules(client_id)
+    return {"rules": rules, "version": version, "is_default": rules is DEFAULT_RULES}
+
+
+@router.put("/")
+def update_scoring_rules(
+    payload: ScoringRules,
+    background_tasks: BackgroundTasks,
+    user_profile: dict = Depends(require_client)
+):
+    """Salva as regras do cliente e repontua todos os leads em background."""
+    client_id = user_profile["client_id"]
+    error = validate_rules(payload.rules)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+    _, version = load_rules(client_id)
+    saved_at = datetime.now(timezone.utc).isoformat()
+    try:
+        get_supabase().table("client_scoring_rules").upsert({
+            "client_id": client_id,
+            "rules":     payload.rules,
+            "version":   version + 1,
+        }, on_conflict="client_id").execute()
+    except Exception as e:
+        print(f"Erro ao salvar regras de scoring: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao salvar regras")
+
+    invalidate_scorer(client_id)
+    background_tasks.add_task(_rescore, client_id, saved_at)
+    return {"status": "success", "version": version + 1}
+
+
+@router.post("/rescore")
+def rescore_leads(background_tasks: BackgroundTasks, user_profile: dict = Depends(require_client)):
+    background_tasks.add_task(_rescore, user_profile["client_id"])
+    return {"status": "scheduled"}
@@ -1,13 +1,24 @@
 import httpx
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import List, Dict
 from database import get_supabase
 from dependencies import require_client
+from services.cache import cached_json_response
+from services.creative_metrics import get_creative_summary
+from utils.period import period_start
 
 router = APIRouter(tags=["Analytics"])
 
 @router.get("/metrics/retention")
-def get_retention_metrics(user_profile: dict = Depends(require_client)):
+def get_retention_metrics(request: Request, user_profile: dict = Depends(require_client)):
+    client_id = user_profile["client_id"]
+    return cached_json_response(
+        request, "metrics_retention", client_id, None,
+        lambda: _build_retention_metrics(client_id)
+    )
+
+
+def _build_retention_metrics(client_id: str):
     """
     Retorna métricas calculadas por criativo (utm_content).
     Fórmulas obrigatórias:
@@ -17,87 +28,28 @@ def get_retention_metrics(user_profile: dict = Depends(require_client)):
     - Conversão final: completed / total_clicks
     - Taxa de venda: converted / completed
     """
-    client_id = user_profile["client_id"]
-    supabase = get_supabase()
-
-    # Busca creative_metrics
     try:
-        res = supabase.table("creative_metrics").select("*").eq("client_id", client_id).execute()
-        metrics = res.data or []
-
-        results = []
-        for m in metrics:
-            clicks = m.get("total_clicks", 0)
-            step_1 = m.get("step_1", 0)
-            step_2 = m.get("step_2", 0)
-            step_3 = m.get("step_3", 0)
-            completed = m.get("completed", 0)
-            converted = m.get("converted", 0)
-
-            # Cálculos (evitar divisão por zero)
-            def safe_div(n, d):
-                return round(n / d, 4) if d > 0 else 0.0
-
-            retention_1 = safe_div(step_1, clicks)
-            retention_2 = safe_div(step_2, step_1)
-            retention_3 = safe_div(step_3, step_2)
-            final_conversion = safe_div(completed, clicks)
-            sales_rate = safe_div(converted, completed)
-
-            results.append({
-                "utm_content": m.get("utm_content", "N/A"),
-                "clicks": clicks,
-                "step_1": step_1,
-                "step_2": step_2,
-                "step_3": step_3,
-                "completed": completed,
-                "converted": converted,
-                "retention_1": retention_1,
-                "retention_2": retention_2,
-                "retention_3": retention_3,
-                "final_conversion": final_conversion,
-                "sales_rate": sales_rate
-            })
-
-        return results
-
+        return get_creative_summary(client_id)["creatives"]
     except Exception as e:
         print(f"Erro retention metrics: {e}")
         return []
 
 @router.get("/metrics/abandonment")
-def get_abandonment_metrics(user_profile: dict = Depends(require_client)):
+def get_abandonment_metrics(request: Request, user_profile: dict = Depends(require_client)):
+    client_id = user_profile["client_id"]
+    return cached_json_response(
+        request, "metrics_abandonment", client_id, None,
+        lambda: _build_abandonment_metrics(client_id)
+    )
+
+
+def _build_abandonment_metrics(client_id: str):
     """
     Taxa de abandono por etapa global.
     Calculado como inverso da retenção.
     """
-    # Reuse logic from leads.py but based on creative_metrics aggregation if possible?
-    # Or keep the simplified one from leads.py?
-    # Module 5 says "Todos com cálculo explícito".
-    # Let's aggregate creative_metrics for global view.
-
-    client_id = user_profile["client_id"]
-    supabase = get_supabase()
-
     try:
-        res = supabase.table("creative_metrics").select("*").eq("client_id", client_id).execute()
-        metrics = res.data or []
-
-        total_clicks = sum(m.get("total_clicks", 0) for m in metrics)
-        total_step_1 = sum(m.get("step_1", 0) for m in metrics)
-        total_step_2 = sum(m.get("step_2", 0) for m in metrics)
-        total_step_3 = sum(m.get("step_3", 0) for m in metrics)
-
-        def drop_rate(curr, prev):
-            if prev == 0: return 0.0
-            return round((prev - curr) / prev, 4)
-
-        return {
-            "step_1_drop_rate": drop_rate(total_step_1, total_clicks),
-            "step_2_drop_rate": drop_rate(total_step_2, total_step_1),
-            "step_3_drop_rate": drop_rate(total_step_3, total_step_2)
-        }
-
+        return get_creative_summary(client_id)["drop_rates"]
     except Exception as e:
         print(f"Erro abandonment metrics: {e}")
         return {
@@ -107,72 +59,85 @@ def get_abandonment_metrics(user_profile: dict = Depends(require_client)):
         }
 
 @router.get("/analytics/full")
-def get_full_analytics(period: str = 'month', user_profile: dict = Depends(require_client)):
+def get_full_analytics(request: Request, period: str = 'month', user_profile: dict = Depends(require_client)):
     client_id = user_profile["client_id"]
-    supabase = get_supabase()
+    return cached_json_response(
+        request, "analytics_full", client_id, {"period": period},
+        lambda: _build_full_analytics(client_id, period)
+    )
 
-    # 1. Funnel Data (Reuse /metrics/abandonment logic or fetch detailed)
-    # We want absolute numbers for the funnel chart
-    # Fetch funnel_events or aggregate creative_metrics?
-    # funnel_events is more granular.
 
-    # For simplicity, we use creative_metrics aggregation
-    res = supabase.table("creative_metrics").select("*").eq("client_id", client_id).execute()
-    metrics = res.data or []
+def _build_full_analytics(client_id: str, period: str):
+    # 1. Funnel Data + 2. Creative Performance
+    # Mesma agregação de creative_metrics usada por /metrics/retention e /metrics/abandonment
+    summary = get_creative_summary(client_id)
+    totals  = summary["totals"]
 
     funnel_data = {
-        "clicks": sum(m.get("total_clicks", 0) for m in metrics),
-        "step_1": sum(m.get("step_1", 0) for m in metrics),
-        "step_2": sum(m.get("step_2", 0) for m in metrics),
-        "step_3": sum(m.get("step_3", 0) for m in metrics),
-        "completed": sum(m.get("completed", 0) for m in metrics),
-        "converted": sum(m.get("converted", 0) for m in metrics)
+        "clicks":    totals["total_clicks"],
+        "step_1":    totals["step_1"],
+        "step_2":    totals["step_2"],
+        "step_3":    totals["step_3"],
+        "completed": totals["completed"],
+        "converted": totals["converted"]
     }
 
-    # 2. Creative Performance
-    # Same as /metrics/retention
-    creative_performance = []
-    for m in metrics:
-        clicks = m.get("total_clicks", 0)
-        cpl = 0 # Need spend from 'creatives' table. Join?
-        # creative_metrics uses utm_content. creatives table uses external_id.
-        # Ideally we join. For now, basic metrics.
-        creative_performance.append({
-            "name": m.get("utm_content"),
-            "clicks": clicks,
-            "leads": m.get("completed", 0),
-            "conversion": round(m.get("completed", 0) / clicks * 100, 2) if clicks > 0 else 0
-        })
-
-    # 3. Abandonment by Device
-    # We need to query 'clicks' table or 'leads' with device_type.
-    # Let's use 'leads' for abandonment (status='abandoned')
-    leads_res = supabase.table("leads").select("device_type, status").eq("client_id", client_id).execute()
-    leads = leads_res.data or []
-
-    abandoned_mobile = sum(1 for l in leads if l.get('status') == 'abandoned' and l.get('device_type') == 'mobile')
-    abandoned_desktop = sum(1 for l in leads if l.get('status') == 'abandoned' and l.get('device_type') == 'desktop')
-
-    abandonment_by_device = {
-        "mobile": abandoned_mobile,
-        "desktop": abandoned_desktop
-    }
+    # cpl: creative_metrics usa utm_content e creatives usa external_id; sem spend aqui.
+    creative_performance = [{
+        "name":       c["utm_content"],
+        "clicks":     c["clicks"],
+        "leads":      c["completed"],
+        "conversion": round(c["completed"] / c["clicks"] * 100, 2) if c["clicks"] > 0 else 0
+    } for c in summary["creatives"]]
 
-    # 4. Platform Comparison (Meta vs Google)
-    # Based on ad_accounts platform linked to campaigns linked to creatives...
-    # Or just utm_source?
-    # Simple UTM source aggregation from leads
-    meta_leads = sum(1 for l in leads if 'facebook' in (l.get('utm_source') or '').lower() or 'instagram' in (l.get('utm_source') or '').lower())
-    google_leads = sum(1 for l in leads if 'google' in (l.get('utm_source') or '').lower())
-
-    platform_comparison = {
-        "meta": meta_leads,
-        "google": google_leads
-    }
+    # 3. Abandonment by Device + 4. Platform Comparison (Meta vs Google)
+    breakdowns = _lead_breakdowns(client_id, period_start(period))
 
     return {
         "funnel_data": funnel_data,
         "creative_performance": creative_performance,
-        "abandonment_by_device": abandonment_by_device,
-        "platform_comparison": platform_comparison
+        "abandonment_by_device": breakdowns["abandonment_by_device"],
+        "platform_comparison": breakdowns["platform_comparison"]
     }
+
+
+def _source_platform(utm_source: str) -> str:
+    # Mesma normalização da função get_lead_breakdowns no banco
+    src = (utm_source or "").lower()
+    if "facebook" in src or "instagram" in src or src in ("fb", "ig", "meta"):
+        return "meta"
+    if "google" in src:
+        return "google"
+    return "other"
+
+
+def _lead_breakdowns(client_id: str, start_date=None) -> Dict:
+    """
+    Abandono por dispositivo e leads por plataforma via RPC get_lead_breakdowns
+    (contagens agrupadas no banco). Fallback: contagem em Python apenas do período.
+    """
+    supabase = get_supabase()
+    since = start_date.isoformat() if start_date else None
+
+    try:
+        res = supabase.rpc("get_lead_breakdowns", {"p_client_id": client_id, "p_since": since}).execute()
+        if res.data:
+            return res.data
+    except Exception as e:
+        print(f"Erro RPC get_lead_breakdowns, usando fallback: {e}")
+
+    query = supabase.table("leads").select("device_type, status, utm_source").eq("client_id", client_id)
+    if since:
+        query = query.gte("created_at", since)
+    leads = query.execute().data or []
+
+    by_device   = {"mobile": 0, "desktop": 0}
+    by_platform = {"meta": 0, "google": 0}
+    for l in leads:
+        if l.get("status") == "abandoned" and l.get("device_type") in by_device:
+            by_device[l["device_type"]] += 1
+        platform = _source_platform(l.get("utm_source"))
+        if platform in by_platform:
+            by_platform[platform] += 1
+
+    return {"abandonment_by_device": by_device, "platform_comparison": by_platform}
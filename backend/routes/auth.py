@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from dependencies import get_current_user_role
 from database import get_supabase
+from services.form_config import rebuild_public_form_config
 from pydantic import BaseModel
 from typing import Optional
 import logging
@@ -12,6 +13,8 @@ router = APIRouter(prefix="/auth", tags=["Auth"])
 class ProfileUpdate(BaseModel):
     name: Optional[str] = None
     whatsapp: Optional[str] = None
+    brand_logo_url: Optional[str] = None
+    brand_primary_color: Optional[str] = None
 
 @router.get("/me")
 def get_me(user_profile: dict = Depends(get_current_user_role)):
@@ -78,4 +81,11 @@ def update_profile(update: ProfileUpdate, user_profile: dict = Depends(get_curre
             logger.error(f"Error updating client profile: {e}")
             raise HTTPException(status_code=500, detail="Error updating profile")
 
+        # Nome e marca aparecem no formulário público pré-renderizado
+        if data.keys() & {"name", "brand_logo_url", "brand_primary_color"}:
+            try:
+                rebuild_public_form_config(client_id, supabase)
+            except Exception as e:
+                logger.error(f"Error rebuilding public form config: {e}")
+
     return {"status": "success"}
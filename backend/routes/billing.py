@@ -1,23 +1,45 @@
 from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
 from database import get_supabase
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter(tags=["Billing"])
 
-def activate_subscription(asaas_sub_id: str):
+def _transition_subscription(asaas_sub_id: str, status: str, next_billing_at: str = None):
+    """
+    Muda o status via RPC apply_subscription_transition, que também ajusta o snapshot
+    de MRR/churn (subscription_metrics) na mesma transação.
+    """
     supabase = get_supabase()
-    supabase.table('subscriptions').update({
-        'status': 'active',
-        'next_billing_at': (datetime.now() + timedelta(days=30)).isoformat()
-    }).eq('asaas_sub_id', asaas_sub_id).execute()
+    try:
+        supabase.rpc('apply_subscription_transition', {
+            'p_asaas_sub_id':    asaas_sub_id,
+            'p_status':          status,
+            'p_next_billing_at': next_billing_at
+        }).execute()
+    except Exception as e:
+        # Sem a RPC o snapshot fica defasado até a reconciliação noturna
+        print(f"Erro RPC apply_subscription_transition ({asaas_sub_id}): {e}")
+        # updated_at marca o dia da mudança: a reconciliação conta o churn por ele
+        data = {'status': status, 'updated_at': datetime.now(timezone.utc).isoformat()}
+        if next_billing_at:
+            data['next_billing_at'] = next_billing_at
+        supabase.table('subscriptions').update(data).eq('asaas_sub_id', asaas_sub_id).execute()
+
+def activate_subscription(asaas_sub_id: str):
+    _transition_subscription(asaas_sub_id, 'active', (datetime.now() + timedelta(days=30)).isoformat())
 
 def suspend_subscription(asaas_sub_id: str):
-    supabase = get_supabase()
-    supabase.table('subscriptions').update({'status': 'suspended'}).eq('asaas_sub_id', asaas_sub_id).execute()
+    _transition_subscription(asaas_sub_id, 'suspended')
 
 def cancel_subscription(asaas_sub_id: str):
-    supabase = get_supabase()
-    supabase.table('subscriptions').update({'status': 'cancelled'}).eq('asaas_sub_id', asaas_sub_id).execute()
+    _transition_subscription(asaas_sub_id, 'cancelled')
+
+def reconcile_subscription_metrics():
+    """Job noturno (03:00): recalcula o snapshot de MRR a partir de subscriptions e fecha o dia anterior."""
+    try:
+        get_supabase().rpc('reconcile_subscription_metrics', {}).execute()
+    except Exception as e:
+        print(f"Erro na reconciliação de métricas de assinatura: {e}")
 
 @router.post('/billing/webhook')
 async def billing_webhook(payload: dict, background_tasks: BackgroundTasks):
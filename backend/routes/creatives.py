@@ -1,55 +1,38 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
+from typing import Dict, List
 from database import get_supabase
 from dependencies import require_client
+from services.cache import cached_json_response
 
 router = APIRouter(tags=["Creatives"])
 
 @router.get('/creatives')
-def get_creatives(user=Depends(require_client)):
+def get_creatives(request: Request, user=Depends(require_client)):
     client_id = user['client_id']
+    return cached_json_response(request, 'creatives', client_id, None, lambda: _build_creatives(client_id))
+
+
+def _build_creatives(client_id: str):
     supabase = get_supabase()
 
     # Busca criativos
     # Include campaign name via join? Supabase select allows nested: *, campaign:campaigns(name)
     res = supabase.table('creatives').select('*, campaigns(name)').eq('client_id', client_id).execute()
-    creatives = res.data
-
-    # Para cada criativo, calcula score médio dos leads associados
-    # Optimization: Perform one query for all leads of this client and aggregate in Python
-    # instead of N queries.
-
-    leads_res = supabase.table('leads').select('internal_score, creative_id, utm_content').eq('client_id', client_id).execute()
-    leads = leads_res.data
-
-    # Map leads by creative_id OR utm_content (external_id)
-    leads_by_creative = {}
-
-    for lead in leads:
-        cid = lead.get('creative_id')
-        utm = lead.get('utm_content')
-
-        # We try to match by creative_id first
-        if cid:
-            if cid not in leads_by_creative: leads_by_creative[cid] = []
-            leads_by_creative[cid].append(lead)
+    creatives = res.data or []
 
-        # If not linked by ID, we could match by external_id (utm_content)
-        # But for get_creatives loop, we iterate creatives which have ID and External ID.
-        # So let's build a map of external_id -> creative_id to help matching?
-        # Actually, let's just stick to what we have.
+    # Score médio e volume de leads por criativo: agregado no banco (RPC get_creative_lead_stats).
+    # Fallback: uma única leitura dos leads indexada em memória.
+    stats = _fetch_creative_lead_stats(client_id, supabase)
+    if stats is None:
+        leads_res = supabase.table('leads').select('internal_score, creative_id, utm_content').eq('client_id', client_id).execute()
+        stats = aggregate_lead_stats(creatives, leads_res.data or [])
 
     for c in creatives:
-        c_leads = leads_by_creative.get(c['id'], [])
+        c_stats = stats.get(c['id'])
 
-        # Fallback: if 0 leads linked by ID, try matching by utm_content == external_id
-        if not c_leads and c.get('external_id'):
-             c_leads = [l for l in leads if l.get('utm_content') == c['external_id']]
-
-        if c_leads:
-            scores = [l['internal_score'] for l in c_leads if l.get('internal_score') is not None]
-            avg_score = round(sum(scores) / len(scores)) if scores else 0
-            c['avg_score'] = avg_score
-            c['leads_generated'] = len(c_leads)
+        if c_stats and c_stats['leads_generated']:
+            c['avg_score'] = c_stats['avg_score']
+            c['leads_generated'] = c_stats['leads_generated']
         else:
             c['avg_score'] = None
             c['leads_generated'] = 0
@@ -61,3 +44,64 @@ def get_creatives(user=Depends(require_client)):
             c['campaign_name'] = None
 
     return {'creatives': creatives}
+
+
+def _fetch_creative_lead_stats(client_id: str, supabase):
+    try:
+        res = supabase.rpc('get_creative_lead_stats', {'p_client_id': client_id}).execute()
+    except Exception as e:
+        print(f"Erro RPC get_creative_lead_stats, usando fallback: {e}")
+        return None
+
+    stats = {}
+    for row in res.data or []:
+        avg = row.get('avg_score')
+        stats[row['creative_id']] = {
+            'leads_generated': row.get('leads_generated') or 0,
+            'avg_score':       round(float(avg)) if avg is not None else 0,
+        }
+    return stats
+
+
+def aggregate_lead_stats(creatives: List[Dict], leads: List[Dict]) -> Dict[str, Dict]:
+    """
+    Agrega leads por criativo em O(criativos + leads).
+    Leads vinculados por creative_id têm prioridade; criativos sem nenhum usam os
+    leads cujo utm_content é o external_id do anúncio.
+    """
+    by_creative: Dict[str, List[int]] = {}
+    by_utm: Dict[str, List[int]] = {}
+    counts_creative: Dict[str, int] = {}
+    counts_utm: Dict[str, int] = {}
+
+    # Índices construídos em uma única passada sobre os leads
+    for lead in leads:
+        score = lead.get('internal_score')
+        cid = lead.get('creative_id')
+        utm = lead.get('utm_content')
+
+        if cid:
+            counts_creative[cid] = counts_creative.get(cid, 0) + 1
+            scores = by_creative.setdefault(cid, [])
+            if score is not None:
+                scores.append(score)
+        if utm:
+            counts_utm[utm] = counts_utm.get(utm, 0) + 1
+            scores = by_utm.setdefault(utm, [])
+            if score is not None:
+                scores.append(score)
+
+    stats = {}
+    for c in creatives:
+        if c['id'] in counts_creative:
+            total, scores = counts_creative[c['id']], by_creative[c['id']]
+        elif c.get('external_id') in counts_utm:
+            total, scores = counts_utm[c['external_id']], by_utm[c['external_id']]
+        else:
+            continue
+
+        stats[c['id']] = {
+            'leads_generated': total,
+            'avg_score':       round(sum(scores) / len(scores)) if scores else 0,
+        }
+    return stats
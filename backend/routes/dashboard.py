@@ -1,27 +1,29 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from database import get_supabase
 from dependencies import require_client
-from datetime import datetime, timedelta
+from services.cache import cached_json_response
+from utils.period import period_start
 
 router = APIRouter(tags=["Dashboard"])
 
 @router.get("/metrics")
 def get_dashboard_metrics(
+    request: Request,
     period: str = "today",
     link_id: str = None,
     user_profile: dict = Depends(require_client)
 ):
     client_id = user_profile["client_id"]
+    return cached_json_response(
+        request, "metrics", client_id, {"period": period, "link_id": link_id},
+        lambda: _build_dashboard_metrics(client_id, period, link_id)
+    )
+
+
+def _build_dashboard_metrics(client_id: str, period: str, link_id: str = None):
     supabase = get_supabase()
 
-    now = datetime.now()
-    start_date = None
-    if period == "today":
-        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == "week":
-        start_date = now - timedelta(days=7)
-    elif period == "month":
-        start_date = now - timedelta(days=30)
+    start_date = period_start(period)
 
     clicks_query = supabase.table("clicks")\
         .select("id, created_at, link_id, links!inner(client_id)")\
@@ -98,21 +100,22 @@ def get_dashboard_metrics(
 
 @router.get("/funnel")
 def get_funnel_stats(
+    request: Request,
     period: str = "today",
     link_id: str = None,
     user_profile: dict = Depends(require_client)
 ):
     client_id = user_profile["client_id"]
+    return cached_json_response(
+        request, "funnel", client_id, {"period": period, "link_id": link_id},
+        lambda: _build_funnel_stats(client_id, period, link_id)
+    )
+
+
+def _build_funnel_stats(client_id: str, period: str, link_id: str = None):
     supabase = get_supabase()
 
-    now = datetime.now()
-    start_date = None
-    if period == "today":
-        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == "week":
-        start_date = now - timedelta(days=7)
-    elif period == "month":
-        start_date = now - timedelta(days=30)
+    start_date = period_start(period)
 
     # Buscar eventos de funil
     # Filtrar por link_id se fornecido, ou links do cliente
@@ -1,46 +1,25 @@
-from fastapi import APIRouter, HTTPException
-from database import get_supabase
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from services.cache import etag_matches
+from services.form_config import CACHE_CONTROL, get_public_form_blob
 
 router = APIRouter(tags=["Public Forms"])
 
-@router.get("/forms/config/{client_id}")
-def get_public_form_config(client_id: str):
-    supabase = get_supabase()
-
-    client_res = supabase.table("clients").select("id, name, active, plan, brand_logo_url, brand_primary_color").eq("id", client_id).single().execute()
-    if not client_res.data or not client_res.data["active"]:
-        raise HTTPException(status_code=404, detail="Cliente não encontrado")
-
-    client_data = client_res.data
+# Payload pré-renderizado por cliente (services.form_config), servido com ETag forte e
+# Cache-Control público para o navegador/CDN reaproveitarem entre carregamentos.
 
+@router.get("/forms/config/{client_id}")
+def get_public_form_config(client_id: str, request: Request):
     try:
-        response = supabase.table("client_form_config")\
-            .select("*, form_fields(*)")\
-            .eq("client_id", client_id)\
-            .eq("active", True)\
-            .order("order_position")\
-            .execute()
-
-        fields = []
-        for item in response.data:
-            field_def = item["form_fields"]
-            fields.append({
-                "field_id":  field_def["id"],
-                "field_key": field_def["field_key"],
-                "type":      field_def["type"],
-                "label":     item["label_custom"] or field_def["label_default"],
-                "required":  item["required"],
-                "options":   field_def.get("options"),
-                "order":     item["order_position"]
-            })
-
-        return {
-            "client_name": client_data["name"],
-            "plan":        client_data["plan"],
-            "brand_logo_url": client_data.get("brand_logo_url"),
-            "brand_primary_color": client_data.get("brand_primary_color"),
-            "fields":      fields
-        }
+        blob = get_public_form_blob(client_id)
     except Exception as e:
         print(f"Erro ao buscar config do formulário: {e}")
         raise HTTPException(status_code=500, detail="Erro interno")
+
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Cliente não encontrado")
+
+    headers = {"ETag": blob.etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), blob.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=blob.body, media_type=JSONResponse.media_type, headers=headers)
@@ -1,20 +1,25 @@
 import urllib.parse
+import re
 import csv
 import io
 import asyncio
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, Depends, Body
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, Depends, Body, Query
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 from database import get_supabase
 from utils.security import encrypt_cpf
 from services.scorer import calculate_score
+from services.scoring_engine import status_for_score
 from services.email import send_lead_alert
 from dependencies import require_client
 from services.enrichment import enrich_lead_data
-from services.webhooks import trigger_webhooks
-from services.meta_capi import send_conversion_event
+from services.webhooks import trigger_webhooks, trigger_webhooks_batch
+from services.meta_capi import send_conversion_event, send_conversion_events
+from services.cache import invalidate_client_cache
+from services.attribution import resolve_creative_id
 from utils.device import parse_device
+from utils.cursor import encode_cursor, decode_cursor
 
 router = APIRouter(tags=["Leads"])
 
@@ -39,6 +44,18 @@ class LeadPartialSubmit(BaseModel):
 class LeadStatusUpdate(BaseModel):
     status: str
 
+class LeadStatusMove(BaseModel):
+    lead_id: str
+    status: str
+
+class LeadBulkStatusUpdate(BaseModel):
+    moves: List[LeadStatusMove]
+
+# Kanban
+KANBAN_COLUMNS = ('hot', 'warm', 'cold', 'abandoned', 'negotiation', 'converted', 'trash')
+BOARD_CARD_COLUMNS = "id, name, phone, status, internal_score, external_score, serasa_score, step_reached, device_type, utm_content, consent_given, created_at"
+MAX_BULK_MOVES = 500
+
 # Helper to call RPC
 def _increment_creative_metric(client_id, utm_content, step, is_click=False, is_conversion=False):
     if not utm_content:
@@ -52,6 +69,7 @@ def _increment_creative_metric(client_id, utm_content, step, is_click=False, is_
             "p_is_click": is_click,
             "p_is_conversion": is_conversion
         }).execute()
+        invalidate_client_cache(client_id)
     except Exception as e:
         print(f"Error updating creative metrics: {e}")
 
@@ -82,6 +100,11 @@ async def submit_lead_partial(payload: LeadPartialSubmit, background_tasks: Back
         "device_type":    device_type
     }
 
+    # Atribuição ao criativo resolvida uma vez na ingestão (não sobrescreve com None)
+    creative_id = resolve_creative_id(payload.client_id, utm_content)
+    if creative_id:
+        lead_data["creative_id"] = creative_id
+
     if payload.name:
         lead_data["name"] = payload.name
     if payload.phone:
@@ -137,6 +160,8 @@ async def submit_lead_partial(payload: LeadPartialSubmit, background_tasks: Back
             if utm_content:
                 background_tasks.add_task(_increment_creative_metric, payload.client_id, utm_content, step_val)
 
+        invalidate_client_cache(payload.client_id)
+
         # Enrichment Trigger
         if cpf_val:
              background_tasks.add_task(enrich_lead_data, lead_id, cpf_val, payload.client_id, background_tasks)
@@ -176,15 +201,9 @@ async def submit_lead(payload: LeadSubmit, background_tasks: BackgroundTasks, re
     cpf = form_data.get("cpf")
     cpf_encrypted = encrypt_cpf(cpf) if cpf else None
 
-    internal_score, external_score, serasa_score_raw = await calculate_score(form_data, [], client_plan)
+    internal_score, external_score, serasa_score_raw = await calculate_score(form_data, [], client_plan, payload.client_id)
     final_score = internal_score + external_score
-
-    if final_score >= 70:
-        status = "hot"
-    elif final_score >= 40:
-        status = "warm"
-    else:
-        status = "cold"
+    status = status_for_score(final_score)
 
     name      = form_data.get("full_name", "")
     has_clt   = form_data.get("has_clt", "")
@@ -233,6 +252,10 @@ async def submit_lead(payload: LeadSubmit, background_tasks: BackgroundTasks, re
         "device_type":    device_type
     }
 
+    creative_id = resolve_creative_id(payload.client_id, utm_content)
+    if creative_id:
+        lead_data["creative_id"] = creative_id
+
     try:
         lead_id = payload.lead_id
         is_new = True
@@ -265,6 +288,8 @@ async def submit_lead(payload: LeadSubmit, background_tasks: BackgroundTasks, re
             "metadata":   {"score": final_score, "status": status}
         }).execute()
 
+        invalidate_client_cache(payload.client_id)
+
         # Update Creative Metrics (Completed = 99)
         if utm_content:
             background_tasks.add_task(_increment_creative_metric, payload.client_id, utm_content, 99)
@@ -315,6 +340,7 @@ async def update_lead_status(
             raise HTTPException(status_code=404, detail="Lead não encontrado ou acesso negado")
 
         lead = res.data[0]
+        invalidate_client_cache(client_id)
 
         # Check conversion for creative metrics
         if payload.status == "converted":
@@ -336,6 +362,45 @@ async def update_lead_status(
         raise HTTPException(status_code=500, detail="Erro ao atualizar lead")
 
 
+# Busca de leads (migration 17): nome e telefone (phone_digits) via índices trigram,
+# ambos por substring. Sem a migration aplicada, cai no ilike original em name/phone.
+def search_filter(search: str):
+    """Retorna (coluna, operador, padrão) para o termo de busca."""
+    term = search.strip()
+    digits = re.sub(r"\D", "", term)
+    if digits and not any(c.isalpha() for c in term):
+        # Telefones são gravados sem o código do país
+        if digits.startswith("55") and len(digits) >= 12:
+            digits = digits[2:]
+        return "phone_digits", "like", f"%{digits}%"
+    return "name", "ilike", f"%{term}%"
+
+
+def _leads_query(supabase, client_id, status, search, legacy_search=False, count=None):
+    query = supabase.table("leads").select("*", count=count).eq("client_id", client_id).order("created_at", desc=True)
+
+    if status:
+        query = query.eq("status", status)
+
+    if search:
+        if legacy_search:
+            query = query.or_(f"name.ilike.%{search}%,phone.ilike.%{search}%")
+        else:
+            column, op, pattern = search_filter(search)
+            query = getattr(query, op)(column, pattern)
+    return query
+
+
+def _execute_search(build, search):
+    try:
+        return build(False).execute()
+    except Exception as e:
+        if not search:
+            raise
+        print(f"Erro na busca indexada de leads, usando ilike: {e}")
+        return build(True).execute()
+
+
 # Endpoints de exportação e listagem (mantidos mas simplificados no paste para brevidade se não houve alteração lógica, mas mantendo código original)
 @router.get("/leads/export")
 def export_leads(
@@ -346,15 +411,7 @@ def export_leads(
     client_id = user_profile["client_id"]
     supabase = get_supabase()
 
-    query = supabase.table("leads").select("*").eq("client_id", client_id).order("created_at", desc=True)
-
-    if status:
-        query = query.eq("status", status)
-
-    if search:
-        query = query.or_(f"name.ilike.%{search}%,phone.ilike.%{search}%")
-
-    leads = query.execute().data
+    leads = _execute_search(lambda legacy: _leads_query(supabase, client_id, status, search, legacy), search).data
 
     output = io.StringIO()
     writer = csv.writer(output)
@@ -379,29 +436,177 @@ def export_leads(
         headers={"Content-Disposition": "attachment; filename=leads.csv"}
     )
 
+@router.get("/leads/board")
+def get_kanban_board(
+    per_column: int = Query(50, ge=1, le=200),
+    user_profile: dict = Depends(require_client)
+):
+    """
+    Board do Kanban: os `per_column` leads mais recentes de cada coluna e o total
+    de cada coluna, em uma única consulta agrupada (RPC get_kanban_board).
+    """
+    client_id = user_profile["client_id"]
+    supabase = get_supabase()
+
+    try:
+        res = supabase.rpc("get_kanban_board", {"p_client_id": client_id, "p_per_column": per_column}).execute()
+        board = res.data or {}
+    except Exception as e:
+        print(f"Erro RPC get_kanban_board, usando fallback: {e}")
+        leads_res = supabase.table("leads").select(BOARD_CARD_COLUMNS).eq("client_id", client_id)\
+            .order("created_at", desc=True).execute()
+        board = build_kanban_board(leads_res.data or [], per_column)
+
+    counts = board.get("counts") or {}
+    columns = board.get("columns") or {}
+    return {
+        "columns": {c: columns.get(c) or [] for c in KANBAN_COLUMNS},
+        "counts":  {c: counts.get(c) or 0 for c in KANBAN_COLUMNS},
+        "per_column": per_column
+    }
+
+
+def kanban_column(lead: Dict[str, Any]) -> str:
+    """Coluna do board para o lead (mesmo mapeamento de kanban_column no banco e do kanban.js)."""
+    status = lead.get("status")
+    if status == "cold" and not lead.get("consent_given") and lead.get("name"):
+        return "abandoned"
+    if status == "started":
+        return "abandoned"
+    return status if status in KANBAN_COLUMNS else "cold"
+
+
+def build_kanban_board(leads: List[Dict[str, Any]], per_column: int) -> Dict[str, Any]:
+    """Agrupa leads já ordenados por created_at desc em colunas limitadas + contagens."""
+    columns: Dict[str, List[Dict[str, Any]]] = {}
+    counts: Dict[str, int] = {}
+    for lead in leads:
+        col = kanban_column(lead)
+        counts[col] = counts.get(col, 0) + 1
+        if counts[col] <= per_column:
+            columns.setdefault(col, []).append(lead)
+    return {"columns": columns, "counts": counts}
+
+
+@router.post("/leads/bulk-status")
+async def bulk_update_lead_status(
+    payload: LeadBulkStatusUpdate,
+    background_tasks: BackgroundTasks,
+    user_profile: dict = Depends(require_client)
+):
+    """
+    Aplica vários movimentos do Kanban em um único UPDATE (RPC bulk_update_lead_status).
+    Webhooks e conversões CAPI dos leads movidos são disparados em lote.
+    """
+    client_id = user_profile["client_id"]
+    supabase = get_supabase()
+
+    # Um movimento por lead: o último vence
+    moves = {m.lead_id: m.status for m in payload.moves}
+    if not moves:
+        return {"status": "success", "updated": []}
+    if len(moves) > MAX_BULK_MOVES:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BULK_MOVES} leads por requisição")
+
+    try:
+        try:
+            res = supabase.rpc("bulk_update_lead_status", {
+                "p_client_id": client_id,
+                "p_moves": [{"lead_id": lead_id, "status": status} for lead_id, status in moves.items()]
+            }).execute()
+            leads = res.data or []
+        except Exception as e:
+            print(f"Erro RPC bulk_update_lead_status, usando fallback: {e}")
+            # Um UPDATE por status de destino
+            by_status: Dict[str, List[str]] = {}
+            for lead_id, status in moves.items():
+                by_status.setdefault(status, []).append(lead_id)
+            leads = []
+            for status, ids in by_status.items():
+                upd = supabase.table("leads").update({"status": status}).in_("id", ids).eq("client_id", client_id).execute()
+                leads.extend(upd.data or [])
+    except Exception as e:
+        print(f"Erro ao atualizar leads em massa: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao atualizar leads")
+
+    if leads:
+        invalidate_client_cache(client_id)
+
+        converted = [lead for lead in leads if lead.get("status") == "converted"]
+        for lead in converted:
+            if lead.get("utm_content"):
+                background_tasks.add_task(_increment_creative_metric, client_id, lead["utm_content"], 99, False, True)
+        if converted:
+            background_tasks.add_task(send_conversion_events, converted, client_id)
+
+        background_tasks.add_task(trigger_webhooks_batch, "status_change", leads, client_id)
+
+    return {"status": "success", "updated": [lead["id"] for lead in leads]}
+
+
 @router.get("/leads/{lead_id}")
 def get_lead_details(
     lead_id: str,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
     user_profile: dict = Depends(require_client)
 ):
+    """
+    Lead, respostas e timeline (events + logs do lead) mais recente primeiro.
+    A timeline é limitada a `limit` itens; use next_cursor para carregar os anteriores.
+    """
     client_id = user_profile["client_id"]
     supabase = get_supabase()
+    before, before_id = decode_cursor(cursor) if cursor else (None, None)
 
-    # Select lead with creative details
-    lead_res = supabase.table("leads").select("*, creatives(name, thumbnail_url)").eq("id", lead_id).eq("client_id", client_id).single().execute()
-    if not lead_res.data:
+    # Lead + respostas + timeline mesclada e ordenada em uma única chamada (RPC get_lead_timeline)
+    try:
+        res = supabase.rpc("get_lead_timeline", {
+            "p_lead_id":   lead_id,
+            "p_client_id": client_id,
+            "p_limit":     limit,
+            "p_before":    before,
+            "p_before_id": before_id,
+        }).execute()
+        data = res.data
+    except Exception as e:
+        print(f"Erro RPC get_lead_timeline, usando fallback: {e}")
+        data = _lead_details_fallback(lead_id, client_id, limit, before, before_id, supabase)
+
+    if not data or not data.get("lead"):
         raise HTTPException(status_code=404, detail="Lead não encontrado")
 
-    lead = lead_res.data
+    lead = data["lead"]
     # Flatten creative info
     if lead.get('creatives'):
         lead['creative_name'] = lead['creatives'].get('name')
         lead['creative_thumbnail'] = lead['creatives'].get('thumbnail_url')
 
+    timeline = data.get("timeline") or []
+    next_cursor = None
+    if len(timeline) > limit:
+        timeline = timeline[:limit]
+        next_cursor = encode_cursor(timeline[-1]["created_at"], timeline[-1]["id"])
+
+    return {
+        "lead": lead,
+        "responses": data.get("responses") or [],
+        "timeline": timeline,
+        "next_cursor": next_cursor
+    }
+
+
+def _lead_details_fallback(lead_id, client_id, limit, before, before_id, supabase):
+    """Mesma resposta da RPC get_lead_timeline, montada com consultas separadas."""
+    lead_res = supabase.table("leads").select("*, creatives(name, thumbnail_url)")\
+        .eq("id", lead_id).eq("client_id", client_id).maybe_single().execute()
+    if not lead_res or not lead_res.data:
+        return None
+
     # Robust handling for associated tables
     try:
         responses_res = supabase.table("lead_responses")\
-            .select("response_value, form_fields(label)")\
+            .select("response_value, form_fields(label:label_default)")\
             .eq("lead_id", lead_id)\
             .execute()
         responses = responses_res.data or []
@@ -409,17 +614,20 @@ def get_lead_details(
         print(f"Erro ao buscar respostas do lead {lead_id}: {e}")
         responses = []
 
-    try:
-        events_res = supabase.table("events").select("*").eq("lead_id", lead_id).order("created_at", desc=True).execute()
-        timeline = events_res.data or []
+    def page_query(table):
+        query = supabase.table(table).select("*").eq("lead_id", lead_id)\
+            .order("created_at", desc=True).order("id", desc=True)
+        if before:
+            query = query.or_(f'created_at.lt."{before}",and(created_at.eq."{before}",id.lt.{before_id})')
+        return query.limit(limit + 1).execute().data or []
 
-        # Fetch system logs related to this lead (errors, webhooks)
-        logs_res = supabase.table("logs").select("*").eq("lead_id", lead_id).order("created_at", desc=True).execute()
-        logs = logs_res.data or []
+    try:
+        timeline = page_query("events")
 
         # Normalize logs to match event structure for the timeline
-        for log in logs:
+        for log in page_query("logs"):
             timeline.append({
+                "id": log["id"],
                 "event_type": f"log_{log['level']}", # e.g. log_error, log_info
                 "created_at": log["created_at"],
                 "metadata": {
@@ -430,18 +638,13 @@ def get_lead_details(
                 "is_log": True # Flag to frontend
             })
 
-        # Re-sort combined timeline
-        timeline.sort(key=lambda x: x["created_at"], reverse=True)
-
+        timeline.sort(key=lambda x: (x["created_at"], x["id"]), reverse=True)
+        timeline = timeline[:limit + 1]
     except Exception as e:
         print(f"Erro ao buscar timeline do lead {lead_id}: {e}")
         timeline = []
 
-    return {
-        "lead": lead,
-        "responses": responses,
-        "timeline": timeline
-    }
+    return {"lead": lead_res.data, "responses": responses, "timeline": timeline}
 
 
 @router.get("/leads")
@@ -455,19 +658,13 @@ def list_leads(
     client_id = user_profile["client_id"]
     supabase = get_supabase()
 
-    query = supabase.table("leads").select("*", count="exact").eq("client_id", client_id).order("created_at", desc=True)
-
-    if status:
-        query = query.eq("status", status)
-
-    if search:
-        query = query.or_(f"name.ilike.%{search}%,phone.ilike.%{search}%")
-
     start = (page - 1) * limit
     end   = start + limit - 1
-    query = query.range(start, end)
 
-    res = query.execute()
+    res = _execute_search(
+        lambda legacy: _leads_query(supabase, client_id, status, search, legacy, count="exact").range(start, end),
+        search
+    )
 
     return {
         "data": res.data,
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
 from database import get_supabase
 from dependencies import require_client
 from pydantic import BaseModel
-from typing import Optional, Literal, Dict, Any
-import uuid
+from typing import Optional, Literal, Dict, Any, List
+from utils.period import period_start
+from services.slugs import slug_registry, slug_base, candidate_slug, is_unique_violation
 import logging
 
 # Configure logging
@@ -36,69 +37,102 @@ class LinkUpdate(BaseModel):
     metadata:     Optional[Dict[str, Any]] = None
 
 
+LINK_COLUMNS = {
+    "id", "client_id", "name", "slug", "destination", "funnel_type", "capture_url", "active",
+    "utm_source", "utm_campaign", "utm_medium", "utm_content", "metadata", "created_at",
+}
+
+
 @router.get("/links")
-def list_links(user_profile: dict = Depends(require_client)):
+def list_links(
+    response: Response,
+    page: Optional[int] = Query(None, ge=1),
+    limit: int = Query(200, ge=1, le=500),
+    fields: Optional[str] = None,
+    with_stats: bool = False,
+    user_profile: dict = Depends(require_client)
+):
+    """
+    Lista os links do cliente (total no header X-Total-Count).
+    Com `page`, devolve `limit` links por página; sem ele, todos (como a tela de links usa).
+    fields: colunas separadas por vírgula (ex.: "id,name,slug").
+    with_stats: embute cliques, sessões, leads e conversões de cada link.
+    """
     client_id = user_profile["client_id"]
     supabase  = get_supabase()
 
+    columns = "*"
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        invalid = [f for f in requested if f not in LINK_COLUMNS]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Campos inválidos: {', '.join(invalid)}")
+        columns = ", ".join(dict.fromkeys(["id"] + requested))
+
     logger.info(f"Listing links for client_id: {client_id}")
 
     try:
-        res = supabase.table("links").select("*").eq("client_id", client_id).order("created_at", desc=True).execute()
-        links = res.data
+        query = supabase.table("links").select(columns, count="exact").eq("client_id", client_id)\
+            .order("created_at", desc=True)
+        if page is not None:
+            start = (page - 1) * limit
+            query = query.range(start, start + limit - 1)
+        res = query.execute()
+        links = res.data or []
         logger.info(f"Found {len(links)} links")
-        return links
     except Exception as e:
         logger.error(f"Error listing links: {e}")
         # Return empty list on error to prevent UI crash, but log it
         # Or re-raise 500
         raise HTTPException(status_code=500, detail="Erro ao carregar campanhas.")
 
+    response.headers["X-Total-Count"] = str(res.count if res.count is not None else len(links))
 
-@router.post("/links")
-def create_link(link: LinkCreate, user_profile: dict = Depends(require_client)):
-    client_id = user_profile["client_id"]
-    supabase  = get_supabase()
+    if with_stats and links:
+        stats = _fetch_links_stats(client_id, [l["id"] for l in links], supabase)
+        for link in links:
+            link["stats"] = stats.get(link["id"], _empty_link_stats())
+
+    return links
+
+
+def _empty_link_stats() -> Dict[str, Any]:
+    return {"clicks": 0, "sessions": 0, "leads": 0, "converted": 0, "conversion_rate": 0}
+
+
+def _fetch_links_stats(client_id: str, link_ids: list, supabase) -> Dict[str, Dict[str, Any]]:
+    """Contagens por link via RPC get_links_stats (uma consulta agrupada para a página inteira)."""
+    try:
+        rows = supabase.rpc("get_links_stats", {"p_client_id": client_id, "p_link_ids": link_ids}).execute().data or []
+    except Exception as e:
+        logger.error(f"Error fetching links stats: {e}")
+        return {}
+
+    stats = {}
+    for row in rows:
+        sessions = row.get("sessions") or 0
+        leads    = row.get("leads") or 0
+        stats[row["link_id"]] = {
+            "clicks":          row.get("clicks") or 0,
+            "sessions":        sessions,
+            "leads":           leads,
+            "converted":       row.get("converted") or 0,
+            # Mesma fórmula de /links/{id}/analytics: leads / sessões
+            "conversion_rate": round((leads / sessions) * 100, 1) if sessions > 0 else 0,
+        }
+    return stats
+
+
+MAX_SLUG_ATTEMPTS = 5
+MAX_BULK_LINKS    = 500
 
+
+def _link_payload(link: LinkCreate, client_id: str) -> Dict[str, Any]:
     # Validação: modo capture exige capture_url
     if link.funnel_type == "capture" and not link.capture_url:
         raise HTTPException(status_code=400, detail="Modo 'Página própria' exige a URL da página de captura")
 
-    # Gera slug se não informado (Retry logic)
-    slug = link.slug
-    if not slug:
-        base = link.name.lower().replace(" ", "-")
-        base = "".join(c for c in base if c.isalnum() or c == "-")
-        if not base: base = "link"
-
-        # Retry up to 3 times for collision
-        for i in range(3):
-            suffix = str(uuid.uuid4())[:4] if i == 0 else str(uuid.uuid4())[:6]
-            candidate = f"{base}-{suffix}"
-            try:
-                existing = supabase.table("links").select("id").eq("slug", candidate).execute()
-                if not existing.data:
-                    slug = candidate
-                    break
-            except Exception as e:
-                logger.error(f"Error checking slug collision: {e}")
-                # If table check fails, we might have bigger issues, but assume no collision for now or fail
-                pass
-
-        if not slug:
-             raise HTTPException(status_code=500, detail="Erro ao gerar link único. Tente novamente.")
-    else:
-        # Check for slug uniqueness (Manual slug)
-        try:
-            existing = supabase.table("links").select("id").eq("slug", slug).execute()
-            if existing.data:
-                raise HTTPException(status_code=400, detail="Slug já existe")
-        except Exception as e:
-            logger.error(f"Error checking manual slug: {e}")
-            pass
-
     data = link.model_dump()
-    data["slug"]      = slug
     data["client_id"] = client_id
 
     # Ensure metadata is at least empty dict if None
@@ -106,26 +140,123 @@ def create_link(link: LinkCreate, user_profile: dict = Depends(require_client)):
         data["metadata"] = {}
 
     # Remove keys that are None to allow DB defaults
-    # And specifically remove utm_medium/content if they are None to avoid issues if column missing?
-    # No, if column is missing, even passing None might fail if Supabase is strict.
-    # But usually insert payload should match columns.
-    # We filter out None values generally.
-    data = {k: v for k, v in data.items() if v is not None}
+    return {k: v for k, v in data.items() if v is not None}
 
-    logger.info(f"Creating link with data: {data}")
 
-    try:
-        res = supabase.table("links").insert(data).execute()
+def _raise_insert_error(e: Exception):
+    logger.error(f"Erro criando link: {e}")
+    # Try to give a helpful error message
+    msg = str(e)
+    if "column" in msg.lower() and "does not exist" in msg.lower():
+        raise HTTPException(status_code=500, detail="Erro de esquema no banco de dados. Coluna faltando.")
+    raise HTTPException(status_code=500, detail="Erro interno ao criar link.")
+
+
+def _insert_link(data: Dict[str, Any], supabase) -> Dict[str, Any]:
+    """
+    Insere o link confiando no índice único de links.slug.
+    Slug manual em conflito -> 400; slug gerado em conflito -> novo candidato.
+    """
+    manual = bool(data.get("slug"))
+    base = slug_base(data["name"])
+
+    for attempt in range(1 if manual else MAX_SLUG_ATTEMPTS):
+        row = dict(data)
+        if not manual:
+            row["slug"] = candidate_slug(base, attempt)
+
+        try:
+            res = supabase.table("links").insert(row).execute()
+        except Exception as e:
+            if is_unique_violation(e):
+                slug_registry.add(row["slug"])
+                if manual:
+                    raise HTTPException(status_code=400, detail="Slug já existe")
+                logger.info(f"Slug collision on {row['slug']}, retrying")
+                continue
+            _raise_insert_error(e)
+
         if not res.data:
-             raise HTTPException(status_code=500, detail="Erro interno ao criar link (sem dados retornados).")
+            raise HTTPException(status_code=500, detail="Erro interno ao criar link (sem dados retornados).")
+        slug_registry.add(row["slug"])
         return res.data[0]
-    except Exception as e:
-        logger.error(f"Erro criando link: {e}")
-        # Try to give a helpful error message
-        msg = str(e)
-        if "column" in msg.lower() and "does not exist" in msg.lower():
-            raise HTTPException(status_code=500, detail="Erro de esquema no banco de dados. Coluna faltando.")
-        raise HTTPException(status_code=500, detail="Erro interno ao criar link.")
+
+    raise HTTPException(status_code=500, detail="Erro ao gerar link único. Tente novamente.")
+
+
+@router.post("/links")
+def create_link(link: LinkCreate, user_profile: dict = Depends(require_client)):
+    client_id = user_profile["client_id"]
+    supabase  = get_supabase()
+
+    data = _link_payload(link, client_id)
+    slug_registry.ensure_loading(supabase)
+
+    logger.info(f"Creating link with data: {data}")
+    return _insert_link(data, supabase)
+
+
+@router.post("/links/bulk")
+def create_links_bulk(links: List[LinkCreate], user_profile: dict = Depends(require_client)):
+    """
+    Cria vários links de campanha em uma chamada (agências).
+    Insere tudo em um único statement; se houver colisão de slug, cai para
+    inserção individual com nova tentativa apenas para o lote afetado.
+    """
+    client_id = user_profile["client_id"]
+    supabase  = get_supabase()
+
+    if not links:
+        return {"created": [], "errors": []}
+    if len(links) > MAX_BULK_LINKS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BULK_LINKS} links por requisição")
+
+    slug_registry.ensure_loading(supabase)
+
+    errors  = []
+    pending = []  # (índice original, payload)
+    seen_slugs = set()
+
+    for idx, link in enumerate(links):
+        try:
+            data = _link_payload(link, client_id)
+        except HTTPException as he:
+            errors.append({"index": idx, "detail": he.detail})
+            continue
+
+        if data.get("slug"):
+            if data["slug"] in seen_slugs:
+                errors.append({"index": idx, "detail": "Slug duplicado na requisição"})
+                continue
+        else:
+            data["slug"] = candidate_slug(slug_base(data["name"]))
+            while data["slug"] in seen_slugs:
+                data["slug"] = candidate_slug(slug_base(data["name"]), 1)
+        seen_slugs.add(data["slug"])
+        pending.append((idx, data))
+
+    created = []
+    if pending:
+        try:
+            res = supabase.table("links").insert([data for _, data in pending]).execute()
+            created = res.data or []
+            for row in created:
+                slug_registry.add(row.get("slug", ""))
+        except Exception as e:
+            if not is_unique_violation(e):
+                _raise_insert_error(e)
+
+            logger.info(f"Bulk insert slug collision, falling back to per-link insert: {e}")
+            for idx, data in pending:
+                # Slugs gerados são descartados e realocados; manuais são mantidos
+                if not links[idx].slug:
+                    data = {k: v for k, v in data.items() if k != "slug"}
+                try:
+                    created.append(_insert_link(data, supabase))
+                except HTTPException as he:
+                    errors.append({"index": idx, "detail": he.detail})
+
+    return {"created": created, "errors": errors}
 
 
 @router.patch("/links/{link_id}")
@@ -162,65 +293,95 @@ def delete_link(link_id: str, user_profile: dict = Depends(require_client)):
 
 
 @router.get("/links/{link_id}/analytics")
-def link_analytics(link_id: str, user_profile: dict = Depends(require_client)):
+def link_analytics(link_id: str, period: str = "all", user_profile: dict = Depends(require_client)):
     """
-    Retorna funil de conversão completo do link
+    Retorna funil de conversão completo do link.
+    period: today | week | month | all — limita o histórico considerado.
     """
     client_id = user_profile["client_id"]
     supabase  = get_supabase()
+    start_date = period_start(period)
+    since = start_date.isoformat() if start_date else None
 
     try:
-        # Verifica posse do link
-        link_res = supabase.table("links").select("id, name, funnel_type")\
-            .eq("id", link_id).eq("client_id", client_id).single().execute()
-        if not link_res.data:
-            raise HTTPException(status_code=404, detail="Link não encontrado")
-
-        # Basic counts - trying to be robust
-        # Supabase-py count implementation varies. Using execute(count='exact') usually helps.
-        # But select(count='exact', head=True) is better for just count.
-
-        clicks = supabase.table("clicks").select("id", count="exact").eq("link_id", link_id).execute()
-        total_clicks = clicks.count or 0
-
-        sessions = supabase.table("visitor_sessions").select("id", count="exact").eq("link_id", link_id).execute()
-        total_sessions  = sessions.count or 0
-
-        leads = supabase.table("leads").select("id", count="exact").eq("link_id", link_id).execute()
-        total_converted = leads.count or 0
-
-        # Eventos de funil
-        events = supabase.table("funnel_events").select("*").eq("link_id", link_id).execute().data or []
-
-        event_counts = {}
-        field_abandons = {}
-        step_completes = {}
-
-        for e in events:
-            t = e.get("event_type")
-            if t:
-                event_counts[t] = event_counts.get(t, 0) + 1
+        # Posse do link + contagens agrupadas em uma única chamada (RPC get_link_analytics)
+        try:
+            res = supabase.rpc("get_link_analytics", {
+                "p_link_id":   link_id,
+                "p_client_id": client_id,
+                "p_since":     since,
+            }).execute()
+            data = res.data
+        except Exception as e:
+            logger.error(f"RPC get_link_analytics failed, using fallback: {e}")
+            data = _link_analytics_fallback(link_id, client_id, since, supabase)
 
-            if t == "form_abandon" and e.get("field_key"):
-                fk = e["field_key"]
-                field_abandons[fk] = field_abandons.get(fk, 0) + 1
+        if not data:
+            raise HTTPException(status_code=404, detail="Link não encontrado")
 
-            if t == "step_complete" and e.get("step"):
-                s = str(e["step"])
-                step_completes[s] = step_completes.get(s, 0) + 1
+        total_sessions  = data.get("sessions") or 0
+        total_converted = data.get("converted") or 0
 
         return {
-            "link": link_res.data,
+            "link": data["link"],
             "funnel": {
-                "clicks":           total_clicks,
+                "clicks":           data.get("clicks") or 0,
                 "sessions":         total_sessions,
                 "converted":        total_converted,
                 "conversion_rate":  round((total_converted / total_sessions) * 100, 1) if total_sessions > 0 else 0,
             },
-            "step_completion":   step_completes,
-            "field_abandons":    field_abandons,
-            "event_breakdown":   event_counts,
+            "step_completion":   data.get("step_completion") or {},
+            "field_abandons":    data.get("field_abandons") or {},
+            "event_breakdown":   data.get("event_breakdown") or {},
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching analytics: {e}")
         raise HTTPException(status_code=500, detail="Erro ao carregar analytics.")
+
+
+def _link_analytics_fallback(link_id: str, client_id: str, since: Optional[str], supabase) -> Optional[Dict[str, Any]]:
+    """Mesmo payload da RPC get_link_analytics, montado com consultas separadas."""
+    link_res = supabase.table("links").select("id, name, funnel_type")\
+        .eq("id", link_id).eq("client_id", client_id).execute()
+    if not link_res.data:
+        return None
+
+    def count(table):
+        q = supabase.table(table).select("id", count="exact").eq("link_id", link_id)
+        if since:
+            q = q.gte("created_at", since)
+        return q.limit(1).execute().count or 0
+
+    events_q = supabase.table("funnel_events").select("event_type, step, field_key").eq("link_id", link_id)
+    if since:
+        events_q = events_q.gte("created_at", since)
+    events = events_q.execute().data or []
+
+    event_counts = {}
+    field_abandons = {}
+    step_completes = {}
+
+    for e in events:
+        t = e.get("event_type")
+        if t:
+            event_counts[t] = event_counts.get(t, 0) + 1
+
+        if t == "form_abandon" and e.get("field_key"):
+            fk = e["field_key"]
+            field_abandons[fk] = field_abandons.get(fk, 0) + 1
+
+        if t == "step_complete" and e.get("step"):
+            s = str(e["step"])
+            step_completes[s] = step_completes.get(s, 0) + 1
+
+    return {
+        "link":            link_res.data[0],
+        "clicks":          count("clicks"),
+        "sessions":        count("visitor_sessions"),
+        "converted":       count("leads"),
+        "event_breakdown": event_counts,
+        "field_abandons":  field_abandons,
+        "step_completion": step_completes,
+    }
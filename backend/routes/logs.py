@@ -1,27 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Query
 from database import get_supabase
 from dependencies import require_client
 from typing import Optional
+from utils.cursor import encode_cursor, decode_cursor
 
 router = APIRouter(prefix="/logs", tags=["Logs"])
 
+# Paginação por cursor (keyset) sobre (created_at, id): cada página é uma busca no
+# índice idx_logs_client_created, sem OFFSET nem count exato da tabela inteira.
+
+
 @router.get("")
 def list_logs(
-    page: int = 1,
-    limit: int = 50,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
     source: Optional[str] = None,
     level: Optional[str] = None,
     lead_id: Optional[str] = None,
     user_profile: dict = Depends(require_client)
 ):
     """
-    Fetch system logs for the authenticated client.
+    Fetch system logs for the authenticated client, newest first.
     Supports filtering by source (webhook, api) and level (error, info).
+    Pass the returned next_cursor to fetch the following page.
     """
     client_id = user_profile["client_id"]
     supabase = get_supabase()
 
-    query = supabase.table("logs").select("*", count="exact").eq("client_id", client_id).order("created_at", desc=True)
+    query = supabase.table("logs").select("*").eq("client_id", client_id)\
+        .order("created_at", desc=True).order("id", desc=True)
 
     if source:
         query = query.eq("source", source)
@@ -29,20 +36,27 @@ def list_logs(
         query = query.eq("level", level)
     if lead_id:
         query = query.eq("lead_id", lead_id)
+    if cursor:
+        created_at, log_id = decode_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{log_id})'
+        )
 
-    start = (page - 1) * limit
-    end = start + limit - 1
-    query = query.range(start, end)
+    # Uma linha extra indica se existe próxima página
+    query = query.limit(limit + 1)
 
     try:
         res = query.execute()
+        rows = res.data or []
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if has_more else None
         return {
-            "data": res.data,
-            "total": res.count,
-            "page": page,
+            "data": rows,
+            "next_cursor": next_cursor,
             "limit": limit
         }
     except Exception as e:
         print(f"Error fetching logs: {e}")
         # Return empty list instead of crashing if table doesn't exist yet
-        return {"data": [], "total": 0, "page": page, "limit": limit}
+        return {"data": [], "next_cursor": None, "limit": limit}
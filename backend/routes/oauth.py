@@ -8,6 +8,7 @@ from database import get_supabase
 from dependencies import require_client
 from utils.security import encrypt_aes256
 from services.meta_sync import sync_meta_account
+from services.meta_capi import capi_sender
 
 router = APIRouter(tags=["OAuth"])
 
@@ -109,6 +110,7 @@ async def meta_callback(code: str, state: str, background_tasks: BackgroundTasks
             'access_token': encrypted_token,
             'status':      'active'
         }, on_conflict='client_id, platform, account_id').execute()
+        capi_sender.invalidate_pixel(client_id)
 
         # Trigger sync
         background_tasks.add_task(sync_meta_account, client_id)
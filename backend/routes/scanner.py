@@ -1,33 +1,64 @@
 from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
-from database import get_supabase
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, Dict, Any, List
+from services.scanner_ingest import (
+    ingest_scanner_events, clean_metadata, clean_text,
+    MAX_EVENTS_PER_BATCH, MAX_EVENT_TYPE_LENGTH, MAX_PAGE_URL_LENGTH,
+)
 from collections import defaultdict
 import time
 
 router = APIRouter(tags=["Scanner"])
 
+# Os eventos são validados contra o cache de clientes ativos e gravados em lote por um
+# buffer write-behind (services.scanner_ingest); as rotas não fazem I/O por evento.
+
 # --- Simple in-memory rate limiter (per IP, max 60 events/min) ---
 _rate_store: Dict[str, list] = defaultdict(list)
 RATE_LIMIT = 60
 WINDOW = 60  # seconds
 
-def check_rate_limit(ip: str) -> bool:
+def check_rate_limit(ip: str, events: int = 1) -> bool:
     now = time.time()
     hits = _rate_store[ip]
     # Remove old hits
     _rate_store[ip] = [t for t in hits if now - t < WINDOW]
-    if len(_rate_store[ip]) >= RATE_LIMIT:
+    if len(_rate_store[ip]) + events > RATE_LIMIT:
         return False
-    _rate_store[ip].append(now)
+    _rate_store[ip].extend([now] * events)
     return True
 
-class ScannerEvent(BaseModel):
-    client_id: str
+class ScannerBatchEvent(BaseModel):
+    # Vem da internet: texto sem NUL e com tamanho limitado, metadata podado
     event_type: str
     page_url: str
     metadata: Optional[Dict[str, Any]] = None
 
+    @field_validator("event_type")
+    @classmethod
+    def _clean_event_type(cls, v: str) -> str:
+        v = clean_text(v, MAX_EVENT_TYPE_LENGTH)
+        if not v:
+            raise ValueError("event_type vazio")
+        return v
+
+    @field_validator("page_url")
+    @classmethod
+    def _clean_page_url(cls, v: str) -> str:
+        return clean_text(v, MAX_PAGE_URL_LENGTH)
+
+    @field_validator("metadata")
+    @classmethod
+    def _clean_metadata(cls, v: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return clean_metadata(v)
+
+class ScannerEvent(ScannerBatchEvent):
+    client_id: str
+
+class ScannerBatch(BaseModel):
+    client_id: str
+    events: List[ScannerBatchEvent] = Field(..., max_length=MAX_EVENTS_PER_BATCH)
+
 @router.post("/scanner/event")
 async def track_scanner_event(event: ScannerEvent, request: Request):
     """
@@ -38,24 +69,26 @@ async def track_scanner_event(event: ScannerEvent, request: Request):
     if not check_rate_limit(ip):
         raise HTTPException(status_code=429, detail="Rate limit exceeded")
 
-    supabase = get_supabase()
-
     try:
-        # Validate client exists (lightweight check to avoid data pollution)
-        client_check = supabase.table("clients").select("id").eq("id", event.client_id).eq("active", True).execute()
-        if not client_check.data:
-            return {"status": "ok"}  # Silent ignore for unknown clients
-
-        data = {
-            "client_id":  event.client_id,
-            "event_type": event.event_type,
-            "page_url":   event.page_url,
-            "metadata":   event.metadata or {}
-        }
+        # Clientes desconhecidos/inativos são ignorados em silêncio
+        await ingest_scanner_events(event.client_id, [event.model_dump(exclude={"client_id"})])
+    except Exception as e:
+        print(f"Erro no scanner: {e}")
+    return {"status": "ok"}  # Beacon mode — always return success to client
 
-        supabase.table("external_events").insert(data).execute()
-        return {"status": "ok"}
+@router.post("/scanner/events")
+async def track_scanner_events(batch: ScannerBatch, request: Request):
+    """
+    Lote de eventos de uma página (scanner.js agrupa e envia em um beacon).
+    O rate limit conta cada evento do lote.
+    """
+    ip = request.client.host or "unknown"
+    if not check_rate_limit(ip, len(batch.events)):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
 
+    accepted = 0
+    try:
+        accepted = await ingest_scanner_events(batch.client_id, [e.model_dump() for e in batch.events])
     except Exception as e:
         print(f"Erro no scanner: {e}")
-        return {"status": "ok"}  # Beacon mode — always return success to client
+    return {"status": "ok", "accepted": accepted}
@@ -9,8 +9,8 @@ from pydantic import BaseModel
 from typing import Optional
 from database import get_supabase
 from utils.device import parse_device
-import ipaddress
-from urllib.parse import urlparse
+from services.cache import invalidate_client_cache
+from utils.url_safety import is_safe_url
 
 router = APIRouter(tags=["Tracker"])
 
@@ -33,31 +33,6 @@ class FunnelEvent(BaseModel):
 
 
 # ─── Helpers ───────────────────────────────────────────────────────────────────
-def _is_safe_url(url: str) -> bool:
-    """Valida se a URL é segura para proxy (evita SSRF)"""
-    try:
-        parsed = urlparse(url)
-        if parsed.scheme not in ('http', 'https'):
-            return False
-
-        hostname = parsed.hostname
-        if not hostname:
-            return False
-
-        # Check IP address
-        try:
-            ip = ipaddress.ip_address(hostname)
-            if ip.is_private or ip.is_loopback or ip.is_link_local:
-                return False
-        except ValueError:
-            # Not an IP, check localhost
-            if hostname in ('localhost', '127.0.0.1', '::1'):
-                return False
-
-        return True
-    except Exception:
-        return False
-
 def _build_params(link: dict, extra: dict = {}) -> str:
     params = {
         "l": link["id"],
@@ -107,6 +82,7 @@ def track_and_redirect(slug: str, request: Request):
             "os":          os_family,
             "referrer":    referrer,
         }).execute()
+        invalidate_client_cache(link.get("client_id"))
     except Exception as e:
         print(f"Erro ao registrar clique: {e}")
 
@@ -201,7 +177,7 @@ async def proxy_capture_page(slug: str, request: Request):
     if not capture_url:
         raise HTTPException(status_code=400, detail="URL de captura não configurada")
 
-    if not _is_safe_url(capture_url):
+    if not is_safe_url(capture_url):
         raise HTTPException(status_code=400, detail="URL de captura inválida ou não permitida")
 
     # Parâmetros passados pela URL (session_id, link_id, etc.)
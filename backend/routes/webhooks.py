@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import Optional
+from database import get_supabase
+from dependencies import require_client
+from services.webhook_registry import invalidate_webhooks
+from utils.url_safety import is_safe_url
+
+router = APIRouter(tags=["Webhooks"])
+
+# Toda alteração invalida o registro de webhooks do cliente (services.webhook_registry)
+
+
+class WebhookCreate(BaseModel):
+    url:            str
+    active:         bool = True
+    batch_delivery: bool = False
+
+class WebhookUpdate(BaseModel):
+    url:            Optional[str] = None
+    active:         Optional[bool] = None
+    batch_delivery: Optional[bool] = None
+
+
+def _validate_url(url: str):
+    if not url.startswith(("https://", "http://")):
+        raise HTTPException(status_code=400, detail="URL do webhook deve começar com http:// ou https://")
+    if not is_safe_url(url):
+        raise HTTPException(status_code=400, detail="URL do webhook não pode apontar para endereço local ou de rede interna")
+
+
+@router.get("/webhooks")
+def list_webhooks(user_profile: dict = Depends(require_client)):
+    client_id = user_profile["client_id"]
+    res = get_supabase().table("webhooks").select("*").eq("client_id", client_id)\
+        .order("created_at", desc=True).execute()
+    return res.data or []
+
+
+@router.post("/webhooks")
+def create_webhook(webhook: WebhookCreate, user_profile: dict = Depends(require_client)):
+    client_id = user_profile["client_id"]
+    _validate_url(webhook.url)
+
+    try:
+        res = get_supabase().table("webhooks").insert({**webhook.dict(), "client_id": client_id}).execute()
+    except Exception as e:
+        print(f"Erro criando webhook: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao criar webhook")
+
+    invalidate_webhooks(client_id)
+    return res.data[0] if res.data else None
+
+
+@router.patch("/webhooks/{webhook_id}")
+def update_webhook(webhook_id: str, update: WebhookUpdate, user_profile: dict = Depends(require_client)):
+    client_id = user_profile["client_id"]
+
+    data = {k: v for k, v in update.dict().items() if v is not None}
+    if not data:
+        return {"status": "sem alterações"}
+    if "url" in data:
+        _validate_url(data["url"])
+
+    try:
+        res = get_supabase().table("webhooks").update(data)\
+            .eq("id", webhook_id).eq("client_id", client_id).execute()
+    except Exception as e:
+        print(f"Erro atualizando webhook: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao atualizar webhook")
+
+    if not res.data:
+        raise HTTPException(status_code=404, detail="Webhook não encontrado")
+    invalidate_webhooks(client_id)
+    return res.data[0]
+
+
+@router.delete("/webhooks/{webhook_id}")
+def delete_webhook(webhook_id: str, user_profile: dict = Depends(require_client)):
+    client_id = user_profile["client_id"]
+    try:
+        get_supabase().table("webhooks").delete().eq("id", webhook_id).eq("client_id", client_id).execute()
+    except Exception as e:
+        print(f"Erro deletando webhook: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao deletar webhook")
+
+    invalidate_webhooks(client_id)
+    return {"status": "deleted"}
@@ -0,0 +1,71 @@
+import threading
+import time
+from typing import Dict, Optional
+from database import get_supabase
+
+# Atribuição lead -> criativo resolvida na ingestão.
+# Mapa (client_id, utm_content) -> creatives.id em memória por worker, recarregado
+# pelo meta_sync a cada sincronização e, por segurança, após MAP_TTL segundos.
+# utm_content pode trazer o id do anúncio ({{ad.id}}) ou o nome ({{ad.name}}): o
+# external_id tem prioridade e nomes repetidos no cliente não são atribuídos.
+
+MAP_TTL = 600
+
+_creative_maps: Dict[str, Dict[str, str]] = {}
+_loaded_at: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def refresh_creative_map(client_id: str, supabase=None) -> Dict[str, str]:
+    """Recarrega external_id/nome -> id dos criativos do cliente."""
+    supabase = supabase or get_supabase()
+    res = supabase.table("creatives").select("id, external_id, name").eq("client_id", client_id).execute()
+    creatives = res.data or []
+
+    by_name: Dict[str, Optional[str]] = {}
+    for c in creatives:
+        if c.get("name"):
+            by_name[c["name"]] = None if c["name"] in by_name else c["id"]
+    mapping = {name: cid for name, cid in by_name.items() if cid}
+    mapping.update({c["external_id"]: c["id"] for c in creatives if c.get("external_id")})
+
+    with _lock:
+        _creative_maps[client_id] = mapping
+        _loaded_at[client_id] = time.monotonic()
+    return mapping
+
+
+def resolve_creative_id(client_id: str, utm_content: Optional[str]) -> Optional[str]:
+    """
+    Retorna o creatives.id correspondente ao utm_content do lead, ou None.
+    Nunca levanta exceção: falhas de atribuição não podem bloquear a captura do lead.
+    """
+    if not client_id or not utm_content:
+        return None
+
+    with _lock:
+        mapping = _creative_maps.get(client_id)
+        fresh = mapping is not None and time.monotonic() - _loaded_at.get(client_id, 0) < MAP_TTL
+
+    if not fresh:
+        try:
+            mapping = refresh_creative_map(client_id)
+        except Exception as e:
+            print(f"Erro ao carregar mapa de criativos do cliente {client_id}: {e}")
+            return None
+
+    return mapping.get(utm_content)
+
+
+def backfill_lead_attribution(client_id: Optional[str] = None) -> int:
+    """
+    Preenche leads.creative_id de leads antigos via RPC backfill_lead_creatives.
+    Sem client_id, processa todos os clientes.
+    """
+    supabase = get_supabase()
+    try:
+        res = supabase.rpc("backfill_lead_creatives", {"p_client_id": client_id}).execute()
+        return res.data or 0
+    except Exception as e:
+        print(f"Erro no backfill de atribuição de criativos: {e}")
+        return 0
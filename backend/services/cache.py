@@ -0,0 +1,165 @@
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Cache de respostas por tenant para os endpoints de analytics consultados em polling
+# pelo painel admin. É local ao worker (cada processo uvicorn tem o seu), por isso os
+# TTLs são curtos: a invalidação por ingestão de leads/cliques cobre o worker que
+# recebeu o evento e o TTL limita a defasagem nos demais.
+
+ROUTE_TTLS = {
+    "metrics":               30,
+    "funnel":                30,
+    "metrics_retention":     60,
+    "metrics_abandonment":   60,
+    "analytics_full":        60,
+    "creatives":            120,
+    # Agregação interna de creative_metrics compartilhada pelas rotas de analytics
+    "creative_summary":      10,
+    # Erros recentes por cliente no painel master
+    "client_health":         60,
+}
+DEFAULT_TTL = 30
+MAX_ENTRIES = 5000
+
+CacheKey = Tuple[str, str, Tuple[Tuple[str, str], ...]]
+
+
+class _Entry:
+    __slots__ = ("payload", "body", "etag", "expires_at")
+
+    def __init__(self, payload: Any, ttl: int):
+        self.payload    = jsonable_encoder(payload)
+        self.body       = json.dumps(self.payload, separators=(",", ":"), sort_keys=True, ensure_ascii=False).encode()
+        self.etag       = f'"{hashlib.sha1(self.body).hexdigest()}"'
+        self.expires_at = time.monotonic() + ttl
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: Dict[CacheKey, _Entry] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+        )
+
+    @staticmethod
+    def make_key(route: str, client_id: str, params: Optional[Dict[str, Any]] = None) -> CacheKey:
+        items = tuple(sorted((k, str(v)) for k, v in (params or {}).items() if v is not None))
+        return (route, str(client_id), items)
+
+    def get(self, route: str, client_id: str, params: Optional[Dict[str, Any]] = None) -> Optional[_Entry]:
+        key = self.make_key(route, client_id, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            self._stats[route]["hits" if entry is not None else "misses"] += 1
+            return entry
+
+    def set(self, route: str, client_id: str, params: Optional[Dict[str, Any]], payload: Any, ttl: int) -> _Entry:
+        entry = _Entry(payload, ttl)
+        key = self.make_key(route, client_id, params)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict_expired()
+                if len(self._entries) >= self.max_entries:
+                    # Dicts preservam ordem de inserção: descarta a entrada mais antiga
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = entry
+        return entry
+
+    def invalidate_client(self, client_id: str, routes: Optional[Tuple[str, ...]] = None) -> int:
+        """
+        Remove as entradas de um tenant (todas as rotas ou apenas as informadas).
+        Chamado pelos pontos de ingestão de leads e cliques.
+        """
+        client_id = str(client_id)
+        with self._lock:
+            keys = [
+                k for k in self._entries
+                if k[1] == client_id and (routes is None or k[0] in routes)
+            ]
+            for k in keys:
+                self._stats[k[0]]["invalidations"] += 1
+                del self._entries[k]
+        return len(keys)
+
+    def record_not_modified(self, route: str):
+        with self._lock:
+            self._stats[route]["not_modified"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries_by_route: Dict[str, int] = defaultdict(int)
+            for key in self._entries:
+                entries_by_route[key[0]] += 1
+
+            routes = {}
+            for route, s in self._stats.items():
+                lookups = s["hits"] + s["misses"]
+                routes[route] = {
+                    **s,
+                    "entries":  entries_by_route.get(route, 0),
+                    "hit_rate": round(s["hits"] / lookups, 4) if lookups > 0 else 0.0,
+                    "ttl":      ROUTE_TTLS.get(route, DEFAULT_TTL),
+                }
+            return {"entries": len(self._entries), "routes": routes}
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for k in [k for k, e in self._entries.items() if e.expires_at <= now]:
+            del self._entries[k]
+
+
+response_cache = ResponseCache()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def cached_json_response(
+    request: Request,
+    route: str,
+    client_id: str,
+    params: Optional[Dict[str, Any]],
+    build: Callable[[], Any],
+) -> Response:
+    """
+    Serve o payload de `build()` a partir do cache do tenant, com ETag.
+    Retorna 304 quando o If-None-Match do navegador ainda corresponde.
+    """
+    entry = response_cache.get(route, client_id, params)
+    if entry is None:
+        entry = response_cache.set(route, client_id, params, build(), ROUTE_TTLS.get(route, DEFAULT_TTL))
+
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        response_cache.record_not_modified(route)
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=entry.body, media_type=JSONResponse.media_type, headers=headers)
+
+
+def invalidate_client_cache(client_id: Optional[str]):
+    """Invalida o cache de analytics do tenant após ingestão de lead/clique."""
+    if client_id:
+        response_cache.invalidate_client(client_id)
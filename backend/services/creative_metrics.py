@@ -0,0 +1,87 @@
+from typing import Any, Dict, List
+from database import get_supabase
+from services.cache import response_cache, ROUTE_TTLS
+
+# Agregação única de creative_metrics compartilhada por /metrics/retention,
+# /metrics/abandonment e /analytics/full. Busca só as colunas usadas e calcula
+# totais do funil, razões por criativo e taxas de abandono em uma única passada.
+
+METRIC_COLUMNS = "utm_content, total_clicks, step_1, step_2, step_3, completed, converted"
+COUNTERS = ("total_clicks", "step_1", "step_2", "step_3", "completed", "converted")
+
+
+def safe_div(n, d, digits=4):
+    return round(n / d, digits) if d > 0 else 0.0
+
+
+def drop_rate(curr, prev):
+    if prev == 0:
+        return 0.0
+    return round((prev - curr) / prev, 4)
+
+
+def aggregate_creative_metrics(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Consolida linhas de creative_metrics em:
+    - totals: soma global de cada contador
+    - creatives: métricas por utm_content com retenções e conversões
+    - drop_rates: abandono por etapa (inverso da retenção)
+    """
+    totals = dict.fromkeys(COUNTERS, 0)
+    creatives = []
+
+    for m in rows:
+        clicks    = m.get("total_clicks") or 0
+        step_1    = m.get("step_1") or 0
+        step_2    = m.get("step_2") or 0
+        step_3    = m.get("step_3") or 0
+        completed = m.get("completed") or 0
+        converted = m.get("converted") or 0
+
+        totals["total_clicks"] += clicks
+        totals["step_1"]       += step_1
+        totals["step_2"]       += step_2
+        totals["step_3"]       += step_3
+        totals["completed"]    += completed
+        totals["converted"]    += converted
+
+        creatives.append({
+            "utm_content":      m.get("utm_content"),
+            "clicks":           clicks,
+            "step_1":           step_1,
+            "step_2":           step_2,
+            "step_3":           step_3,
+            "completed":        completed,
+            "converted":        converted,
+            "retention_1":      safe_div(step_1, clicks),
+            "retention_2":      safe_div(step_2, step_1),
+            "retention_3":      safe_div(step_3, step_2),
+            "final_conversion": safe_div(completed, clicks),
+            "sales_rate":       safe_div(converted, completed),
+        })
+
+    return {
+        "totals":    totals,
+        "creatives": creatives,
+        "drop_rates": {
+            "step_1_drop_rate": drop_rate(totals["step_1"], totals["total_clicks"]),
+            "step_2_drop_rate": drop_rate(totals["step_2"], totals["step_1"]),
+            "step_3_drop_rate": drop_rate(totals["step_3"], totals["step_2"]),
+        },
+    }
+
+
+def get_creative_summary(client_id: str) -> Dict[str, Any]:
+    """
+    Retorna a agregação do tenant, reaproveitando o resultado entre as rotas de
+    analytics por alguns segundos (invalidado junto com o cache de respostas).
+    """
+    entry = response_cache.get("creative_summary", client_id)
+    if entry is not None:
+        return entry.payload
+
+    supabase = get_supabase()
+    res = supabase.table("creative_metrics").select(METRIC_COLUMNS).eq("client_id", client_id).execute()
+    summary = aggregate_creative_metrics(res.data or [])
+
+    return response_cache.set("creative_summary", client_id, None, summary, ROUTE_TTLS["creative_summary"]).payload
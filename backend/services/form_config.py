@@ -0,0 +1,173 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from database import get_supabase
+
+# Configuração pública do formulário (GET /forms/config/{client_id}) pré-renderizada.
+# O payload é montado uma vez (cliente + client_form_config + form_fields) e gravado em
+# public_form_configs (migration 23) junto com o ETag; cada worker mantém os bytes já
+# serializados em memória. Salvar o formulário ou alterar nome/marca/plano do cliente
+# chama rebuild_public_form_config. FORM_CONFIG_TTL limita a defasagem nos outros workers
+# e é o mesmo max-age enviado ao navegador/CDN.
+
+FORM_CONFIG_TTL = 60
+MAX_BLOBS       = 5000   # entradas por worker (LRU); o endpoint é público
+CACHE_CONTROL   = f"public, max-age={FORM_CONFIG_TTL}, stale-while-revalidate=300"
+
+
+class FormConfigBlob:
+    __slots__ = ("body", "etag", "loaded_at")
+
+    def __init__(self, payload: Dict[str, Any], etag: Optional[str] = None):
+        # Serialização determinística: o mesmo payload gera o mesmo ETag em todos os workers
+        self.body = json.dumps(payload, separators=(",", ":"), sort_keys=True, ensure_ascii=False).encode()
+        self.etag = etag or f'"{hashlib.sha1(self.body).hexdigest()}"'
+        self.loaded_at = time.monotonic()
+
+
+# client_id -> blob em ordem de uso (LRU); None = cliente inexistente/inativo (entrada negativa)
+_blobs: "OrderedDict[str, Tuple[Optional[FormConfigBlob], float]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "loads": 0, "builds": 0, "rebuilds": 0, "evictions": 0, "invalid_ids": 0}
+
+
+def is_valid_client_id(client_id: str) -> bool:
+    try:
+        uuid.UUID(str(client_id))
+        return True
+    except ValueError:
+        return False
+
+
+def render_public_form_config(client_id: str, supabase=None) -> Optional[Dict[str, Any]]:
+    """Monta o payload público; None se o cliente não existe ou está inativo."""
+    return _render(client_id, supabase or get_supabase())[0]
+
+
+def _render(client_id: str, supabase) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """(payload ou None, cliente existe)."""
+    client_res = supabase.table("clients").select("id, name, active, plan, brand_logo_url, brand_primary_color")\
+        .eq("id", client_id).maybe_single().execute()
+    client_data = client_res.data if client_res else None
+    if not client_data:
+        return None, False
+    if not client_data["active"]:
+        return None, True
+
+    response = supabase.table("client_form_config")\
+        .select("label_custom, required, order_position, form_fields(id, field_key, type, label_default, options)")\
+        .eq("client_id", client_id)\
+        .eq("active", True)\
+        .order("order_position")\
+        .execute()
+
+    fields = []
+    for item in response.data or []:
+        field_def = item["form_fields"]
+        fields.append({
+            "field_id":  field_def["id"],
+            "field_key": field_def["field_key"],
+            "type":      field_def["type"],
+            "label":     item["label_custom"] or field_def["label_default"],
+            "required":  item["required"],
+            "options":   field_def.get("options"),
+            "order":     item["order_position"]
+        })
+
+    payload = {
+        "client_name": client_data["name"],
+        "plan":        client_data["plan"],
+        "brand_logo_url": client_data.get("brand_logo_url"),
+        "brand_primary_color": client_data.get("brand_primary_color"),
+        "fields":      fields
+    }
+    return payload, True
+
+
+def _remember(client_id: str, blob: Optional[FormConfigBlob]):
+    now = time.monotonic()
+    with _lock:
+        _blobs[client_id] = (blob, now)
+        _blobs.move_to_end(client_id)
+        if len(_blobs) <= MAX_BLOBS:
+            return
+        # Cheio: primeiro as entradas vencidas (ex.: negativas de ids aleatórios), depois LRU
+        for key in [k for k, (_, at) in _blobs.items() if now - at >= FORM_CONFIG_TTL]:
+            del _blobs[key]
+            _stats["evictions"] += 1
+        while len(_blobs) > MAX_BLOBS:
+            _blobs.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def rebuild_public_form_config(client_id: str, supabase=None) -> Optional[FormConfigBlob]:
+    """Renderiza de novo e grava o blob do cliente (ou remove, se ficou inativo)."""
+    supabase = supabase or get_supabase()
+    payload, exists = _render(client_id, supabase)
+    blob = FormConfigBlob(payload) if payload is not None else None
+    try:
+        if blob is None:
+            # Só cliente inativo tem linha a remover (a exclusão do cliente já apaga em cascata)
+            if exists:
+                supabase.table("public_form_configs").delete().eq("client_id", client_id).execute()
+        else:
+            supabase.table("public_form_configs").upsert({
+                "client_id": client_id,
+                "payload":   payload,
+                "etag":      blob.etag,
+                "built_at":  datetime.now(timezone.utc).isoformat(),
+            }, on_conflict="client_id").execute()
+    except Exception as e:
+        print(f"Erro ao gravar public_form_configs de {client_id}: {e}")
+    _remember(client_id, blob)
+    with _lock:
+        _stats["rebuilds"] += 1
+    return blob
+
+
+def get_public_form_blob(client_id: str, supabase=None) -> Optional[FormConfigBlob]:
+    if not is_valid_client_id(client_id):
+        # Não é UUID: 404 sem consulta e sem entrada no cache
+        with _lock:
+            _stats["invalid_ids"] += 1
+        return None
+
+    with _lock:
+        entry = _blobs.get(client_id)
+        if entry is not None and time.monotonic() - entry[1] < FORM_CONFIG_TTL:
+            _blobs.move_to_end(client_id)
+            _stats["hits"] += 1
+            return entry[0]
+
+    supabase = supabase or get_supabase()
+    try:
+        res = supabase.table("public_form_configs").select("payload, etag").eq("client_id", client_id).execute()
+        if res.data:
+            blob = FormConfigBlob(res.data[0]["payload"], res.data[0]["etag"])
+            _remember(client_id, blob)
+            with _lock:
+                _stats["loads"] += 1
+            return blob
+    except Exception as e:
+        print(f"Erro ao ler public_form_configs de {client_id}, renderizando: {e}")
+
+    # Primeiro acesso (ou tabela indisponível): renderiza e grava
+    with _lock:
+        _stats["builds"] += 1
+    return rebuild_public_form_config(client_id, supabase)
+
+
+def invalidate_public_form_config(client_id: str):
+    with _lock:
+        _blobs.pop(client_id, None)
+
+
+def form_config_stats() -> Dict[str, Any]:
+    with _lock:
+        return {**_stats, "clients": len(_blobs)}
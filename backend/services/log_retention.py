@@ -0,0 +1,38 @@
+import os
+from typing import Dict
+from database import get_supabase
+
+# Retenção em camadas da tabela logs:
+# - após LOG_STRIP_BODIES_DAYS dias, remove payload/response do metadata (corpos de webhook)
+# - após LOG_ARCHIVE_DAYS dias, move os logs para logs_archive (um registro por cliente/dia)
+# As RPCs processam no máximo RETENTION_BATCH linhas por chamada para manter as
+# transações curtas; o job repete até não sobrar nada elegível.
+
+STRIP_BODIES_DAYS = int(os.getenv("LOG_STRIP_BODIES_DAYS", "14"))
+ARCHIVE_DAYS      = int(os.getenv("LOG_ARCHIVE_DAYS", "90"))
+RETENTION_BATCH   = int(os.getenv("LOG_RETENTION_BATCH", "5000"))
+MAX_ROUNDS        = 200
+
+
+def _drain(supabase, fn: str, days: int) -> int:
+    total = 0
+    for _ in range(MAX_ROUNDS):
+        res = supabase.rpc(fn, {"p_days": days, "p_limit": RETENTION_BATCH}).execute()
+        affected = res.data or 0
+        total += affected
+        if affected < RETENTION_BATCH:
+            break
+    return total
+
+
+def run_log_retention() -> Dict[str, int]:
+    """Job diário do scheduler. Nunca levanta exceção."""
+    supabase = get_supabase()
+    result = {"stripped": 0, "archived": 0}
+    try:
+        result["stripped"] = _drain(supabase, "strip_log_metadata", STRIP_BODIES_DAYS)
+        result["archived"] = _drain(supabase, "archive_old_logs", ARCHIVE_DAYS)
+    except Exception as e:
+        print(f"Erro na retenção de logs: {e}")
+    print(f"Retenção de logs: {result}")
+    return result
@@ -1,7 +1,267 @@
 from datetime import datetime
 from database import get_supabase
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
+from collections import deque
+from contextlib import contextmanager
 import asyncio
+import json
+import os
+import random
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows (desenvolvimento local): sem lock entre processos
+    fcntl = None
+
+# Pipeline assíncrono de logs do sistema.
+# log_system_event só enfileira em memória (não faz I/O no event loop); um flusher em
+# background grava lotes com insert multi-linha por tamanho ou tempo. Se o banco
+# estiver indisponível o lote vai para um arquivo local (JSONL) e é reenviado depois.
+# O arquivo de spill é compartilhado pelos workers do uvicorn: append e a troca de nome
+# antes do replay acontecem sob um flock em <spill>.lock, e cada processo lê a sua cópia
+# renomeada, então um lote nunca é intercalado nem reenviado duas vezes.
+
+MAX_BUFFER       = int(os.getenv("LOG_MAX_BUFFER", "10000"))
+BATCH_SIZE       = int(os.getenv("LOG_BATCH_SIZE", "200"))
+FLUSH_INTERVAL   = float(os.getenv("LOG_FLUSH_INTERVAL", "2.0"))
+SPILL_PATH       = os.getenv("LOG_SPILL_PATH", "/tmp/funila_logs_spill.jsonl")
+MAX_SPILL_BYTES  = int(os.getenv("LOG_MAX_SPILL_BYTES", str(50 * 1024 * 1024)))
+
+
+def _parse_sample_rates(raw: str) -> Dict[str, float]:
+    # Formato: "brasil_api=0.25,webhook=0.5" — aplica-se apenas a level='info'
+    rates = {}
+    for part in raw.split(","):
+        if "=" in part:
+            source, rate = part.split("=", 1)
+            try:
+                rates[source.strip()] = max(0.0, min(1.0, float(rate)))
+            except ValueError:
+                pass
+    return rates
+
+
+# SQLSTATE de erro nos dados da linha (22xxx: valor inválido, ex. \u0000 em texto/jsonb;
+# 23xxx: integridade, ex. FK). Repetir o mesmo insert nunca vai dar certo.
+ROW_ERROR_SQLSTATE_CLASSES = ("22", "23")
+ROW_ERROR_MARKERS = ("violates", "invalid input", "unsupported unicode escape", "cannot contain nul")
+
+
+def _is_row_error(exc: Exception) -> bool:
+    code = str(getattr(exc, "code", "") or "")
+    if len(code) == 5 and code[:2] in ROW_ERROR_SQLSTATE_CLASSES:
+        return True
+    message = str(exc).lower()
+    return any(marker in message for marker in ROW_ERROR_MARKERS)
+
+
+INFO_SAMPLE_RATES = _parse_sample_rates(os.getenv("LOG_INFO_SAMPLE_RATES", "brasil_api=0.25"))
+
+
+class LogPipeline:
+    def __init__(
+        self,
+        max_buffer: int = MAX_BUFFER,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        spill_path: str = SPILL_PATH,
+        sample_rates: Optional[Dict[str, float]] = None,
+        table: str = "logs",
+    ):
+        self.table = table
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.sample_rates = INFO_SAMPLE_RATES if sample_rates is None else sample_rates
+
+        self._buffer: deque = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.counters = {
+            "enqueued":       0,
+            "written":        0,
+            "sampled_out":    0,
+            "dropped_full":   0,
+            "dropped_spill":  0,
+            "spilled":        0,
+            "replayed":       0,
+            "failed_batches": 0,
+            "dropped_invalid": 0,
+        }
+
+    # ─── Produção ──────────────────────────────────────────────────────────────
+    def enqueue(self, payload: Dict[str, Any]) -> bool:
+        rate = self.sample_rates.get(payload.get("source"))
+        if payload.get("level") == "info" and rate is not None and random.random() >= rate:
+            self._count("sampled_out")
+            return False
+
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.counters["dropped_full"] += 1
+                return False
+            self._buffer.append(payload)
+            self.counters["enqueued"] += 1
+            full_batch = len(self._buffer) >= self.batch_size
+
+        self._ensure_running()
+        if full_batch and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    # ─── Consumo ───────────────────────────────────────────────────────────────
+    def _ensure_running(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sem event loop (ex.: script síncrono): flush() manual
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await asyncio.to_thread(self.flush)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            n = min(self.batch_size, len(self._buffer))
+            return [self._buffer.popleft() for _ in range(n)]
+
+    def flush(self) -> int:
+        """Grava tudo o que estiver no buffer (síncrono; roda fora do event loop)."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                ok, unsent = self._write(batch)
+                written += ok
+                if unsent:
+                    self._spill(unsent)
+
+            if written and os.path.exists(self.spill_path):
+                self._replay_spill()
+        return written
+
+    def _write(self, batch: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Grava o lote. Em erro de dados (FK de cliente/lead apagado, valor inválido) divide
+        o lote ao meio até isolar as linhas ruins, que são descartadas e contadas; as
+        demais são gravadas. Retorna (gravados, não enviados por falha de conexão/banco),
+        e só estes últimos vão para o spill.
+        """
+        try:
+            get_supabase().table(self.table).insert(batch).execute()
+            self._count("written", len(batch))
+            return len(batch), []
+        except Exception as e:
+            if not _is_row_error(e):
+                self._count("failed_batches")
+                print(f"[LOGGER FAILURE] Could not write {len(batch)} {self.table} events: {e}")
+                return 0, batch
+            if len(batch) == 1:
+                self._count("dropped_invalid")
+                print(f"[LOGGER FAILURE] Dropping invalid {self.table} event: {e}")
+                return 0, []
+
+        mid = len(batch) // 2
+        written, unsent = self._write(batch[:mid])
+        if unsent:
+            # Caiu a conexão no meio da divisão: o resto também volta para o spill
+            return written, unsent + batch[mid:]
+        more, unsent = self._write(batch[mid:])
+        return written + more, unsent
+
+    @contextmanager
+    def _spill_lock(self):
+        """Lock exclusivo entre processos sobre o arquivo de spill."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.spill_path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _spill(self, batch: List[Dict[str, Any]]):
+        try:
+            # Uma única escrita por lote, sob o lock: linhas de workers diferentes não se misturam
+            data = "".join(json.dumps(item, default=str) + "\n" for item in batch)
+            with self._spill_lock():
+                size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+                if size >= MAX_SPILL_BYTES:
+                    self._count("dropped_spill", len(batch))
+                    return
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    f.write(data)
+            self._count("spilled", len(batch))
+        except Exception as e:
+            self._count("dropped_spill", len(batch))
+            print(f"[LOGGER FAILURE] Could not spill log events: {e}")
+
+    def _replay_spill(self):
+        # Renomeia (sob o lock) para um arquivo deste processo antes de ler: novos spills
+        # vão para um arquivo novo e nenhum outro worker reenvia o mesmo conteúdo
+        replay_path = f"{self.spill_path}.replay.{os.getpid()}"
+        try:
+            with self._spill_lock():
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+            with open(replay_path, encoding="utf-8") as f:
+                items = [json.loads(line) for line in f if line.strip()]
+            os.remove(replay_path)
+        except Exception as e:
+            print(f"[LOGGER FAILURE] Could not read spill file: {e}")
+            return
+
+        for i in range(0, len(items), self.batch_size):
+            written, unsent = self._write(items[i:i + self.batch_size])
+            self._count("replayed", written)
+            if unsent:
+                self._spill(unsent)
+                for rest in range(i + self.batch_size, len(items), self.batch_size):
+                    self._spill(items[rest:rest + self.batch_size])
+                break
+
+    async def stop(self):
+        """Encerra o flusher e grava o que restou (shutdown da aplicação)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    # ─── Métricas ──────────────────────────────────────────────────────────────
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counters, "buffered": len(self._buffer)}
+
+
+log_pipeline = LogPipeline()
+
 
 async def log_system_event(
     client_id: str,
@@ -13,27 +273,21 @@ async def log_system_event(
 ):
     """
     Logs a system event to the 'logs' table for observability.
-    This function is designed to be fire-and-forget (safe to await, handles its own errors).
+    Enfileira no pipeline em memória e retorna imediatamente; a gravação é feita
+    em lotes pelo flusher em background. Nunca levanta exceção.
     """
     try:
-        supabase = get_supabase()
-
         payload = {
             "client_id": client_id,
             "level": level,
             "source": source,
             "message": message,
             "created_at": datetime.utcnow().isoformat(),
-            "metadata": metadata or {}
+            "metadata": metadata or {},
+            "lead_id": lead_id
         }
 
-        if lead_id:
-            payload["lead_id"] = lead_id
-
-        # Insert asynchronously to avoid blocking critical paths if possible
-        # Since Supabase-py is synchronous in many contexts, we just run it.
-        # Ideally, this should run in a background task if called from a route.
-        supabase.table("logs").insert(payload).execute()
+        log_pipeline.enqueue(payload)
 
     except Exception as e:
         # Failsafe: Don't crash the app if logging fails
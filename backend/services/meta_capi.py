@@ -1,16 +1,38 @@
 import httpx
 import hashlib
+import asyncio
+import os
+import random
+import threading
 import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
 from database import get_supabase
 from utils.security import decrypt_aes256
 
-async def send_conversion_event(lead: dict, client_id: str):
+# Envio de conversões para a Conversions API em lotes.
+# send_conversion_event só enfileira: os eventos ficam num buffer por pixel e um flusher
+# em background envia a cada FLUSH_WINDOW segundos (ou ao atingir 1000 eventos) um único
+# POST por pixel. Pixel e token decifrado ficam em cache por cliente; cada conversão tem
+# event_id determinístico (deduplicado aqui e pela própria Meta).
+
+MAX_EVENTS_PER_REQUEST = 1000 # Limite do endpoint /events
+FLUSH_WINDOW   = float(os.getenv("CAPI_FLUSH_WINDOW", "2.0"))
+MAX_ATTEMPTS   = int(os.getenv("CAPI_MAX_ATTEMPTS", "4"))
+RETRY_BASE     = float(os.getenv("CAPI_RETRY_BASE", "1.0"))
+PIXEL_TTL      = 600
+SEEN_EVENT_IDS = 50000
+METRIC_WINDOW  = 1000
+GRAPH_URL      = 'https://graph.facebook.com/v19.0'
+
+
+def _load_pixel(client_id: str) -> Optional[Tuple[str, str]]:
     supabase = get_supabase()
 
     # 1. Fetch Meta Ad Account with Pixel ID
-    acc_res = supabase.table('ad_accounts').select('*').eq('client_id', client_id).eq('platform', 'meta').execute()
+    acc_res = supabase.table('ad_accounts').select('pixel_id, access_token').eq('client_id', client_id).eq('platform', 'meta').execute()
     if not acc_res.data:
-        return
+        return None
 
     # Assuming first account found is the one to send event to
     acc = acc_res.data[0]
@@ -19,11 +41,15 @@ async def send_conversion_event(lead: dict, client_id: str):
 
     if not pixel_id or not access_token_enc:
         # If pixel_id is missing, maybe we can't send.
-        return
+        return None
 
     access_token = decrypt_aes256(access_token_enc)
-    if not access_token: return
+    if not access_token:
+        return None
+    return pixel_id, access_token
+
 
+def _build_event(lead: dict) -> dict:
     phone_hash = hashlib.sha256(lead['phone'].encode()).hexdigest() if lead.get('phone') else None
     email_hash = hashlib.sha256(lead['email'].encode()).hexdigest() if lead.get('email') else None
 
@@ -33,9 +59,10 @@ async def send_conversion_event(lead: dict, client_id: str):
     if phone_hash: user_data['ph'] = [phone_hash]
     if email_hash: user_data['em'] = [email_hash]
 
-    event = {
+    return {
         'event_name': 'Purchase', # Or 'Lead'
         'event_time': int(time.time()),
+        'event_id':   f"purchase_{lead['id']}" if lead.get('id') else None,
         'user_data':  user_data,
         'custom_data': {
             'value':    1,
@@ -43,14 +70,212 @@ async def send_conversion_event(lead: dict, client_id: str):
         }
     }
 
-    try:
-        async with httpx.AsyncClient() as client:
-            r = await client.post(
-                f'https://graph.facebook.com/v19.0/{pixel_id}/events',
-                params={'access_token': access_token},
-                json={'data': [event]}
-            )
-            if r.status_code != 200:
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 3)
+
+
+class CapiSender:
+    def __init__(self, flush_window: float = FLUSH_WINDOW, max_attempts: int = MAX_ATTEMPTS, retry_base: float = RETRY_BASE):
+        self.flush_window = flush_window
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+
+        # client_id -> (pixel, carregado_em); pixel None = cliente sem pixel/token
+        self._pixels: Dict[str, Tuple[Optional[Tuple[str, str]], float]] = {}
+        # pixel_id -> {"token", "events": {event_id: event}}
+        self._buffers: Dict[str, Dict[str, Any]] = {}
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.counters = {
+            "enqueued":      0,
+            "deduplicated":  0,
+            "no_pixel":      0,
+            "batches_sent":  0,
+            "events_sent":   0,
+            "events_failed": 0,
+            "retries":       0,
+        }
+        self._batch_sizes: deque = deque(maxlen=METRIC_WINDOW)
+        self._send_latency: deque = deque(maxlen=METRIC_WINDOW)
+
+    # ─── Pixel / token ─────────────────────────────────────────────────────────
+    def _cached_pixel(self, client_id: str):
+        with self._lock:
+            entry = self._pixels.get(client_id)
+        if entry is None or time.monotonic() - entry[1] >= PIXEL_TTL:
+            return False, None
+        return True, entry[0]
+
+    def _refresh_pixel(self, client_id: str) -> Optional[Tuple[str, str]]:
+        pixel = _load_pixel(client_id)
+        with self._lock:
+            self._pixels[client_id] = (pixel, time.monotonic())
+        return pixel
+
+    def invalidate_pixel(self, client_id: str):
+        with self._lock:
+            self._pixels.pop(client_id, None)
+
+    async def resolve_pixel(self, client_id: str) -> Optional[Tuple[str, str]]:
+        hit, pixel = self._cached_pixel(client_id)
+        if hit:
+            return pixel
+        try:
+            return await asyncio.to_thread(self._refresh_pixel, client_id)
+        except Exception as e:
+            print(f"CAPI Exception: could not load pixel for client {client_id}: {e}")
+            return None
+
+    # ─── Produção ──────────────────────────────────────────────────────────────
+    async def enqueue(self, leads: List[dict], client_id: str) -> int:
+        pixel = await self.resolve_pixel(client_id)
+        if not pixel:
+            self._count("no_pixel", len(leads))
+            return 0
+        pixel_id, access_token = pixel
+
+        added, full = 0, False
+        with self._lock:
+            buf = self._buffers.setdefault(pixel_id, {"token": access_token, "events": {}})
+            buf["token"] = access_token
+            for lead in leads:
+                event = _build_event(lead)
+                event_id = event["event_id"] or f"anon_{random.getrandbits(64):x}"
+                event["event_id"] = event_id
+                if event_id in self._seen or event_id in buf["events"]:
+                    self.counters["deduplicated"] += 1
+                    continue
+                buf["events"][event_id] = event
+                self.counters["enqueued"] += 1
+                added += 1
+            full = len(buf["events"]) >= MAX_EVENTS_PER_REQUEST
+
+        self._ensure_running()
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+        return added
+
+    # ─── Consumo ───────────────────────────────────────────────────────────────
+    def _ensure_running(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_window)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _take_batches(self) -> List[Tuple[str, str, List[dict]]]:
+        batches = []
+        with self._lock:
+            for pixel_id, buf in list(self._buffers.items()):
+                events = list(buf["events"].values())
+                for i in range(0, len(events), MAX_EVENTS_PER_REQUEST):
+                    batches.append((pixel_id, buf["token"], events[i:i + MAX_EVENTS_PER_REQUEST]))
+            self._buffers.clear()
+        return batches
+
+    async def flush(self) -> int:
+        batches = self._take_batches()
+        if not batches:
+            return 0
+        async with httpx.AsyncClient(timeout=15.0) as http:
+            sent = await asyncio.gather(*(self._send(http, *batch) for batch in batches))
+        return sum(sent)
+
+    async def _send(self, http: httpx.AsyncClient, pixel_id: str, access_token: str, events: List[dict]) -> int:
+        for attempt in range(1, self.max_attempts + 1):
+            start = time.monotonic()
+            retryable = True
+            try:
+                r = await http.post(
+                    f'{GRAPH_URL}/{pixel_id}/events',
+                    params={'access_token': access_token},
+                    json={'data': events}
+                )
+                if r.status_code == 200:
+                    self._record_sent(events, time.monotonic() - start)
+                    return len(events)
+                # 4xx (exceto rate limit) não melhora com retentativa
+                retryable = r.status_code == 429 or r.status_code >= 500
                 print(f"CAPI Error: {r.text}")
-    except Exception as e:
-        print(f"CAPI Exception: {e}")
+            except Exception as e:
+                print(f"CAPI Exception: {e}")
+
+            if not retryable or attempt == self.max_attempts:
+                break
+            self._count("retries")
+            await asyncio.sleep(self.retry_base * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2))
+
+        self._count("events_failed", len(events))
+        return 0
+
+    def _record_sent(self, events: List[dict], latency: float):
+        with self._lock:
+            self.counters["batches_sent"] += 1
+            self.counters["events_sent"] += len(events)
+            self._batch_sizes.append(len(events))
+            self._send_latency.append(latency)
+            for event in events:
+                self._seen[event["event_id"]] = None
+            while len(self._seen) > SEEN_EVENT_IDS:
+                self._seen.popitem(last=False)
+
+    async def stop(self):
+        """Encerra o flusher e envia o que restou (shutdown da aplicação)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    # ─── Métricas ──────────────────────────────────────────────────────────────
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = list(self._batch_sizes)
+            latency = list(self._send_latency)
+            buffered = sum(len(b["events"]) for b in self._buffers.values())
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "buffered": buffered,
+            "batch_size": {"p50": _percentile(sizes, 0.5), "p95": _percentile(sizes, 0.95), "max": max(sizes) if sizes else None},
+            "send_latency_s": {"p50": _percentile(latency, 0.5), "p95": _percentile(latency, 0.95)},
+        }
+
+
+capi_sender = CapiSender()
+
+
+async def send_conversion_event(lead: dict, client_id: str):
+    await capi_sender.enqueue([lead], client_id)
+
+
+async def send_conversion_events(leads: List[dict], client_id: str):
+    """Enfileira as conversões de vários leads do mesmo cliente (enviadas no mesmo lote)."""
+    if leads:
+        await capi_sender.enqueue(leads, client_id)
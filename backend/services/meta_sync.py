@@ -1,53 +1,426 @@
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
 import httpx
 from database import get_supabase
 from utils.security import decrypt_aes256
+from services.cache import invalidate_client_cache
+from services.attribution import refresh_creative_map, backfill_lead_attribution
+
+# Sincronização de contas Meta.
+# Todas as páginas da Graph API são seguidas (paging.next). Campanhas e anúncios de
+# cada conta são buscados em paralelo, com no máximo GRAPH_CONCURRENCY requisições
+# simultâneas por token; os cabeçalhos de uso (x-business-use-case-usage, x-app-usage,
+# x-ad-account-usage) reduzem o ritmo antes de a Meta bloquear o token. Campanhas e
+# criativos são gravados com upserts em lote.
+#
+# Sync incremental: com uma marca d'água em meta_sync_state, só campanhas e anúncios
+# com updated_time posterior são relidos, e as métricas (últimos 30 dias) são buscadas
+# via batch requests apenas para esses anúncios e para os que tiveram entrega desde a
+# marca d'água. A cada META_FULL_SYNC_DAYS dias (ou sem marca d'água) o sync é completo.
+
+GRAPH_URL          = os.getenv("META_GRAPH_URL", "https://graph.facebook.com/v19.0")
+GRAPH_CONCURRENCY  = int(os.getenv("META_GRAPH_CONCURRENCY", "4"))
+PAGE_LIMIT         = 200
+UPSERT_BATCH       = 500
+MAX_RETRIES        = 3
+USAGE_SLOWDOWN_PCT = 75   # acima disso, espaça as requisições
+USAGE_PAUSE_PCT    = 95   # acima disso, pausa até a janela de uso aliviar
+USAGE_PAUSE_SECS   = 60
+# Códigos de erro de limite de uso da Graph API
+RATE_LIMIT_CODES   = {4, 17, 32, 613, 80000, 80003, 80004, 80014}
+
+FULL_SYNC_INTERVAL = timedelta(days=int(os.getenv("META_FULL_SYNC_DAYS", "7")))
+GRAPH_BATCH_SIZE   = 50   # Máximo de requisições por batch request
+INSIGHTS_RETRIES   = 1    # Nova tentativa das sub-respostas de insights com erro
+# Margem na marca d'água para alterações gravadas durante o sync anterior
+WATERMARK_OVERLAP  = timedelta(minutes=10)
+
+CAMPAIGN_FIELDS = 'id,name,status,objective,daily_budget'
+INSIGHT_FIELDS  = 'spend,clicks,impressions,ctr'
+AD_META_FIELDS  = 'id,name,campaign_id,creative{thumbnail_url,title,body}'
+AD_FIELDS       = AD_META_FIELDS + ',insights{' + INSIGHT_FIELDS + '}'
+
+
+class GraphError(Exception):
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"Graph API {status_code}: {body[:300]}")
+        self.status_code = status_code
+        self.body = body
+
+
+def parse_usage(headers) -> Tuple[float, float]:
+    """
+    Lê os cabeçalhos de uso da Graph API.
+    Retorna (maior percentual de uso, segundos até recuperar o acesso).
+    """
+    pct, regain = 0.0, 0.0
+
+    raw = headers.get('x-business-use-case-usage')
+    if raw:
+        try:
+            for entries in json.loads(raw).values():
+                for e in entries:
+                    pct = max(pct, float(e.get('call_count') or 0), float(e.get('total_cputime') or 0), float(e.get('total_time') or 0))
+                    regain = max(regain, float(e.get('estimated_time_to_regain_access') or 0) * 60)
+        except (ValueError, AttributeError, TypeError):
+            pass
+
+    raw = headers.get('x-app-usage')
+    if raw:
+        try:
+            usage = json.loads(raw)
+            pct = max(pct, *(float(usage.get(k) or 0) for k in ('call_count', 'total_cputime', 'total_time')))
+        except (ValueError, AttributeError, TypeError):
+            pass
+
+    raw = headers.get('x-ad-account-usage')
+    if raw:
+        try:
+            usage = json.loads(raw)
+            pct = max(pct, float(usage.get('acc_id_util_pct') or 0))
+            regain = max(regain, float(usage.get('reset_time_duration') or 0) if pct >= USAGE_PAUSE_PCT else 0)
+        except (ValueError, AttributeError, TypeError):
+            pass
+
+    return pct, regain
+
+
+class GraphClient:
+    """Cliente da Graph API para um token: concorrência limitada, paginação e controle de uso."""
+
+    def __init__(self, http, token: str, concurrency: int = GRAPH_CONCURRENCY, base_url: str = GRAPH_URL,
+                 pause_seconds: float = USAGE_PAUSE_SECS):
+        self.http = http
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.pause_seconds = pause_seconds
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._resume_at = 0.0
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "max_usage_pct": 0.0}
+
+    async def _wait_for_budget(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _apply_usage(self, headers):
+        pct, regain = parse_usage(headers)
+        self.stats["max_usage_pct"] = max(self.stats["max_usage_pct"], pct)
+        pause = 0.0
+        if regain > 0:
+            pause = regain
+        elif pct >= USAGE_PAUSE_PCT:
+            pause = self.pause_seconds
+        elif pct >= USAGE_SLOWDOWN_PCT:
+            # Espaçamento proporcional ao quanto passou do limite de desaceleração
+            pause = self.pause_seconds * (pct - USAGE_SLOWDOWN_PCT) / (100 - USAGE_SLOWDOWN_PCT) / 10
+        if pause > 0:
+            self.stats["throttled"] += 1
+            self._resume_at = max(self._resume_at, time.monotonic() + pause)
+
+    async def request(self, url: str, params: Optional[Dict[str, Any]] = None, data: Optional[Dict[str, Any]] = None) -> Any:
+        params = {**(params or {}), 'access_token': self.token}
+        for attempt in range(1, MAX_RETRIES + 1):
+            await self._wait_for_budget()
+            async with self._semaphore:
+                await self._wait_for_budget()
+                self.stats["requests"] += 1
+                if data is None:
+                    r = await self.http.get(url, params=params)
+                else:
+                    r = await self.http.post(url, params=params, data=data)
+            self._apply_usage(r.headers)
+
+            if r.status_code == 200:
+                return r.json()
+
+            try:
+                code = (r.json().get('error') or {}).get('code')
+            except Exception:
+                code = None
+            retryable = r.status_code == 429 or r.status_code >= 500 or code in RATE_LIMIT_CODES
+            if not retryable or attempt == MAX_RETRIES:
+                raise GraphError(r.status_code, r.text)
 
-async def sync_meta_account(client_id: str):
-    supabase = get_supabase()
+            self.stats["retries"] += 1
+            if code in RATE_LIMIT_CODES or r.status_code == 429:
+                self.stats["throttled"] += 1
+                self._resume_at = max(self._resume_at, time.monotonic() + self.pause_seconds)
+            else:
+                await asyncio.sleep(random.uniform(0.5, 1.5) * attempt)
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return await self.request(f"{self.base_url}/{path.lstrip('/')}", params)
+
+    async def get_all(self, path: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Segue paging.next até a última página."""
+        page = await self.get(path, {'limit': PAGE_LIMIT, **(params or {})})
+        items = list(page.get('data', []))
+        next_url = (page.get('paging') or {}).get('next')
+        while next_url:
+            # A URL de next já traz os parâmetros (inclusive o cursor after)
+            page = await self.request(next_url)
+            items.extend(page.get('data', []))
+            next_url = (page.get('paging') or {}).get('next')
+        return items
+
+    async def batch(self, relative_urls: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Executa várias requisições GET em batch requests de até GRAPH_BATCH_SIZE.
+        Retorna o corpo de cada resposta na mesma ordem (None para as que falharam).
+        """
+        chunks = [relative_urls[i:i + GRAPH_BATCH_SIZE] for i in range(0, len(relative_urls), GRAPH_BATCH_SIZE)]
+
+        async def run(chunk):
+            batch = json.dumps([{'method': 'GET', 'relative_url': u} for u in chunk])
+            responses = await self.request(f"{self.base_url}/", data={'batch': batch, 'include_headers': 'false'})
+            bodies = []
+            for item in responses or []:
+                try:
+                    bodies.append(json.loads(item['body']) if item and item.get('code') == 200 else None)
+                except (ValueError, TypeError, KeyError):
+                    bodies.append(None)
+            self.stats["batched_requests"] = self.stats.get("batched_requests", 0) + len(chunk)
+            return bodies + [None] * (len(chunk) - len(bodies))
+
+        results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+        return [body for chunk in results for body in chunk]
+
+
+async def sync_meta_account(client_id: str, supabase=None, http=None) -> Dict[str, Any]:
+    """
+    Sincroniza campanhas e criativos de todas as contas Meta do cliente.
+    Retorna um resumo (contas, campanhas, criativos, requisições, throttling).
+    """
+    supabase = supabase or get_supabase()
+    summary = {"accounts": 0, "incremental": 0, "campaigns": 0, "creatives": 0, "metrics_updated": 0,
+               "insights_failed": 0, "requests": 0, "throttled": 0, "errors": 0}
 
     # 1. Busca token
     acc_res = supabase.table('ad_accounts').select('*').eq('client_id', client_id).eq('platform', 'meta').execute()
     if not acc_res.data:
-        return
-
-    for acc in acc_res.data:
-        token = decrypt_aes256(acc['access_token'])
-        if not token: continue
+        return summary
 
-        async with httpx.AsyncClient() as client:
-            # 2. Busca contas de anuncio reais (sync accounts list)
-            r = await client.get('https://graph.facebook.com/v19.0/me/adaccounts',
-                params={'access_token': token, 'fields': 'id,name,currency,account_status'})
+    own_http = http is None
+    if own_http:
+        http = httpx.AsyncClient(timeout=30.0)
+    try:
+        for acc in acc_res.data:
+            token = decrypt_aes256(acc['access_token'])
+            if not token: continue
 
-            if r.status_code != 200:
-                print(f"Error syncing meta for {client_id}: {r.text}")
+            graph = GraphClient(http, token)
+            try:
+                # 2. Busca contas de anuncio reais (sync accounts list)
+                accounts = await graph.get_all('me/adaccounts', {'fields': 'id,name,currency,account_status'})
+            except Exception as e:
+                print(f"Error syncing meta for {client_id}: {e}")
+                summary["errors"] += 1
+                summary["last_error"] = str(e)[:500]
                 continue
 
-            accounts = r.json().get('data', [])
+            state = await asyncio.to_thread(load_sync_state, acc['id'], supabase)
+            results = await asyncio.gather(
+                *(sync_ad_account(client_id, acc['id'], account['id'], graph, supabase, state.get(account['id']))
+                  for account in accounts),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"Error syncing meta account for {client_id}: {result}")
+                    summary["errors"] += 1
+                    summary["last_error"] = str(result)[:500]
+                else:
+                    for key in ("incremental", "campaigns", "creatives", "metrics_updated", "insights_failed"):
+                        summary[key] += result[key]
+            summary["accounts"] += len(accounts)
+            summary["requests"] += graph.stats["requests"]
+            summary["throttled"] += graph.stats["throttled"]
+    finally:
+        if own_http:
+            await http.aclose()
 
-            for account in accounts:
-                # Update ad_account table if needed (e.g. status)
-                # For now we focus on campaigns
+    # Novos criativos: atualiza o mapa de atribuição e vincula leads antigos
+    try:
+        refresh_creative_map(client_id, supabase)
+    except Exception as e:
+        print(f"Erro ao atualizar mapa de criativos de {client_id}: {e}")
+    backfill_lead_attribution(client_id)
 
-                # 3. Fetch Campaigns
-                campaigns = await fetch_campaigns(account['id'], token, client)
-                for camp in campaigns:
-                    # Upsert Campaign
-                    camp_uuid = upsert_campaign(client_id, acc['id'], camp, supabase)
+    invalidate_client_cache(client_id)
+    return summary
 
-                    # 4. Fetch Creatives (Ads)
-                    ads = await fetch_ads(account['id'], camp['id'], token, client)
 
-                    for ad in ads:
-                        upsert_creative(client_id, camp_uuid, ad, supabase)
+async def sync_ad_account(client_id: str, ad_account_uuid: str, account_id: str, graph: GraphClient, supabase,
+                          state: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    started = datetime.now(timezone.utc)
+    watermark = _parse_ts((state or {}).get('synced_until'))
+    last_full = _parse_ts((state or {}).get('last_full_sync_at'))
+    incremental = watermark is not None and last_full is not None and started - last_full < FULL_SYNC_INTERVAL
 
-async def fetch_campaigns(account_id, token, client):
-    r = await client.get(f'https://graph.facebook.com/v19.0/{account_id}/campaigns',
-        params={'access_token': token, 'fields': 'id,name,status,objective,daily_budget'})
-    return r.json().get('data', [])
+    if incremental:
+        result = await _sync_changes(client_id, ad_account_uuid, account_id, graph, supabase, watermark - WATERMARK_OVERLAP)
+    else:
+        result = await _sync_full(client_id, ad_account_uuid, account_id, graph, supabase)
+    result["incremental"] = int(incremental)
+    result.setdefault("insights_failed", 0)
 
-def upsert_campaign(client_id, ad_account_uuid, camp_data, supabase):
-    res = supabase.table('campaigns').upsert({
+    # Métricas que falharam: a marca d'água não avança, o próximo incremental busca de novo
+    synced_until = watermark if result["insights_failed"] else started
+    await asyncio.to_thread(
+        save_sync_state, ad_account_uuid, account_id, synced_until,
+        last_full if incremental else started, result, supabase
+    )
+    return result
+
+
+async def _sync_full(client_id, ad_account_uuid, account_id, graph: GraphClient, supabase) -> Dict[str, int]:
+    # 3. Campanhas e anúncios (com insights expandidos) da conta em paralelo
+    campaigns, ads = await asyncio.gather(
+        fetch_campaigns(account_id, graph),
+        fetch_ads(account_id, graph),
+    )
+
+    camp_ids = await asyncio.to_thread(upsert_campaigns_bulk, client_id, ad_account_uuid, campaigns, supabase)
+
+    # 4. Criativos vinculados às campanhas gravadas
+    rows = [creative_row(client_id, camp_ids.get(ad.get('campaign_id')), ad) for ad in ads]
+    rows = [row for row in rows if row]
+    await asyncio.to_thread(upsert_creatives_bulk, rows, supabase)
+
+    return {"campaigns": len(campaigns), "creatives": len(rows), "metrics_updated": len(rows)}
+
+
+async def _sync_changes(client_id, ad_account_uuid, account_id, graph: GraphClient, supabase, since: datetime) -> Dict[str, int]:
+    # Só o que mudou desde a marca d'água + anúncios que tiveram entrega no período
+    campaigns, ads, delivered = await asyncio.gather(
+        fetch_campaigns(account_id, graph, since),
+        fetch_ads(account_id, graph, since),
+        fetch_delivered_ad_ids(account_id, graph, since),
+    )
+
+    camp_ids = await asyncio.to_thread(upsert_campaigns_bulk, client_id, ad_account_uuid, campaigns, supabase)
+    unknown = {ad.get('campaign_id') for ad in ads if ad.get('campaign_id') and ad.get('campaign_id') not in camp_ids}
+    if unknown:
+        camp_ids.update(await asyncio.to_thread(campaign_ids_for, list(unknown), supabase))
+
+    changed_ids = [ad['id'] for ad in ads]
+    metric_only_ids = [ad_id for ad_id in delivered if ad_id not in set(changed_ids)]
+    insights = await fetch_ad_insights(changed_ids + metric_only_ids, graph)
+    # Sem métricas o upsert gravaria zeros: esses anúncios ficam para o próximo ciclo
+    failed = [ad_id for ad_id in changed_ids + metric_only_ids if ad_id not in insights]
+
+    rows = []
+    for ad in ads:
+        if ad['id'] not in insights:
+            continue
+        ad = {**ad, 'insights': {'data': [insights[ad['id']]]}}
+        row = creative_row(client_id, camp_ids.get(ad.get('campaign_id')), ad)
+        if row:
+            rows.append(row)
+    await asyncio.to_thread(upsert_creatives_bulk, rows, supabase)
+
+    metric_rows = [insight_row(ad_id, insights[ad_id]) for ad_id in metric_only_ids if ad_id in insights]
+    await asyncio.to_thread(apply_creative_insights, client_id, metric_rows, supabase)
+
+    return {"campaigns": len(campaigns), "creatives": len(rows), "metrics_updated": len(rows) + len(metric_rows),
+            "insights_failed": len(failed)}
+
+
+def _updated_since_filter(since: datetime) -> str:
+    return json.dumps([{'field': 'updated_time', 'operator': 'GREATER_THAN', 'value': int(since.timestamp())}])
+
+
+async def fetch_campaigns(account_id, graph: GraphClient, since: Optional[datetime] = None):
+    params = {'fields': CAMPAIGN_FIELDS}
+    if since:
+        params['filtering'] = _updated_since_filter(since)
+    return await graph.get_all(f'{account_id}/campaigns', params)
+
+
+async def fetch_ads(account_id, graph: GraphClient, since: Optional[datetime] = None):
+    # Anúncios da conta inteira (com campaign_id) em vez de uma chamada por campanha.
+    # No sync completo insights é expandido como campo do anúncio; no incremental as
+    # métricas vêm de fetch_ad_insights.
+    if since is None:
+        return await graph.get_all(f'{account_id}/ads', {'fields': AD_FIELDS})
+    return await graph.get_all(f'{account_id}/ads', {'fields': AD_META_FIELDS, 'filtering': _updated_since_filter(since)})
+
+
+async def fetch_delivered_ad_ids(account_id, graph: GraphClient, since: datetime) -> List[str]:
+    """Anúncios com entrega (linhas de insights) entre `since` e hoje."""
+    time_range = json.dumps({'since': since.date().isoformat(), 'until': datetime.now(timezone.utc).date().isoformat()})
+    rows = await graph.get_all(f'{account_id}/insights', {'level': 'ad', 'fields': 'ad_id', 'time_range': time_range})
+    return list(dict.fromkeys(r['ad_id'] for r in rows if r.get('ad_id')))
+
+
+async def fetch_ad_insights(ad_ids: List[str], graph: GraphClient, retries: int = INSIGHTS_RETRIES) -> Dict[str, Dict[str, Any]]:
+    """
+    Métricas dos últimos 30 dias (mesma janela do sync completo) via batch requests.
+    Sub-respostas com erro (ex.: limite por item) são repetidas `retries` vezes; os
+    anúncios que continuarem falhando ficam fora do resultado.
+    """
+    insights = {}
+    pending = list(ad_ids)
+    for _ in range(retries + 1):
+        if not pending:
+            break
+        bodies = await graph.batch([f'{ad_id}/insights?fields={INSIGHT_FIELDS}&date_preset=last_30d' for ad_id in pending])
+        failed = []
+        for ad_id, body in zip(pending, bodies):
+            if body is None:
+                failed.append(ad_id)
+            else:
+                data = body.get('data') or []
+                insights[ad_id] = data[0] if data else {}
+        pending = failed
+    return insights
+
+
+def _parse_ts(value) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        ts = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def load_sync_state(ad_account_uuid, supabase) -> Dict[str, Dict[str, Any]]:
+    """account_id (act_...) -> estado do último sync. Vazio = sync completo."""
+    try:
+        res = supabase.table('meta_sync_state').select('*').eq('ad_account_id', ad_account_uuid).execute()
+        return {row['account_id']: row for row in res.data or []}
+    except Exception as e:
+        print(f"Erro ao ler meta_sync_state, fazendo sync completo: {e}")
+        return {}
+
+
+def save_sync_state(ad_account_uuid, account_id, synced_until: datetime, last_full: Optional[datetime], stats, supabase):
+    try:
+        supabase.table('meta_sync_state').upsert({
+            'ad_account_id':     ad_account_uuid,
+            'account_id':        account_id,
+            'synced_until':      synced_until.isoformat(),
+            'last_full_sync_at': last_full.isoformat() if last_full else None,
+            'stats':             stats,
+            'updated_at':        datetime.now(timezone.utc).isoformat(),
+        }, on_conflict='ad_account_id,account_id').execute()
+    except Exception as e:
+        print(f"Erro ao gravar meta_sync_state de {account_id}: {e}")
+
+
+def campaign_row(client_id, ad_account_uuid, camp_data) -> Dict[str, Any]:
+    return {
         'external_id': camp_data['id'],
         'client_id': client_id,
         'ad_account_id': ad_account_uuid,
@@ -55,27 +428,41 @@ def upsert_campaign(client_id, ad_account_uuid, camp_data, supabase):
         'status': camp_data.get('status'),
         'objective': camp_data.get('objective'),
         'daily_budget_cents': int(camp_data.get('daily_budget', 0)) if camp_data.get('daily_budget') else 0
-    }, on_conflict='external_id').execute()
+    }
+
 
-    if res.data and len(res.data) > 0:
-        return res.data[0]['id']
+def upsert_campaigns_bulk(client_id, ad_account_uuid, campaigns, supabase) -> Dict[str, str]:
+    """Upsert em lotes; retorna external_id -> campaigns.id."""
+    ids: Dict[str, str] = {}
+    rows = [campaign_row(client_id, ad_account_uuid, c) for c in campaigns]
+    for i in range(0, len(rows), UPSERT_BATCH):
+        res = supabase.table('campaigns').upsert(rows[i:i + UPSERT_BATCH], on_conflict='external_id').execute()
+        for row in res.data or []:
+            ids[row['external_id']] = row['id']
 
     # Fallback in case representation was not returned
-    fallback = supabase.table('campaigns').select('id').eq('external_id', camp_data['id']).single().execute()
-    return fallback.data['id'] if fallback.data else None
-
-async def fetch_ads(account_id, campaign_id, token, client):
-    # fields: name, creative{thumbnail_url,title,body}, insights{spend,clicks,impressions,ctr}
-    # Note: insights is a separate edge usually, or field expansion.
-    # For ads endpoint, we can expand insights.
-    fields = 'name,creative{thumbnail_url,title,body},insights{spend,clicks,impressions,ctr}'
-    r = await client.get(f'https://graph.facebook.com/v19.0/{campaign_id}/ads',
-        params={'access_token': token, 'fields': fields})
-    return r.json().get('data', [])
+    missing = [r['external_id'] for r in rows if r['external_id'] not in ids]
+    if missing:
+        ids.update(campaign_ids_for(missing, supabase))
+    return ids
 
-def upsert_creative(client_id, camp_uuid, ad_data, supabase):
+
+def campaign_ids_for(external_ids: List[str], supabase) -> Dict[str, str]:
+    ids: Dict[str, str] = {}
+    for i in range(0, len(external_ids), UPSERT_BATCH):
+        res = supabase.table('campaigns').select('id, external_id').in_('external_id', external_ids[i:i + UPSERT_BATCH]).execute()
+        for row in res.data or []:
+            ids[row['external_id']] = row['id']
+    return ids
+
+
+def upsert_campaign(client_id, ad_account_uuid, camp_data, supabase):
+    return upsert_campaigns_bulk(client_id, ad_account_uuid, [camp_data], supabase).get(camp_data['id'])
+
+
+def creative_row(client_id, camp_uuid, ad_data) -> Optional[Dict[str, Any]]:
     if not camp_uuid:
-        return
+        return None
 
     insights_data = ad_data.get('insights', {})
     if isinstance(insights_data, dict) and 'data' in insights_data:
@@ -85,34 +472,51 @@ def upsert_creative(client_id, camp_uuid, ad_data, supabase):
 
     creative_info = ad_data.get('creative', {})
 
-    spend = float(insights.get('spend', 0))
-    spend_cents = int(spend * 100)
-    clicks = int(insights.get('clicks', 0))
-    ctr = float(insights.get('ctr', 0))
-    impressions = int(insights.get('impressions', 0))
-
-    # Calculate leads generated (from leads table) to update creative metrics
-    # Actually leads table has creative_id FK.
-    # We should update `leads_generated` based on count of leads with this creative_id (if we link them).
-    # But currently we don't link them yet (that's Google Sync or manually via UTM).
-    # If leads have utm_content matching ad_data['id'] or name, we can link.
-    # But for now, we just save what Meta tells us (Meta leads?) or 0.
-    # The prompt says: "leads_generated INTEGER DEFAULT 0".
-    # And "Rota GET /creatives... calcula score médio".
-    # So we leave leads_generated as 0 or strictly from Meta (if using On-Facebook Leads).
-    # But usually we want OUR leads.
-    # I will leave it 0 here, relying on `leads` table aggregation for the frontend display.
-
-    supabase.table('creatives').upsert({
-        'external_id':   ad_data['id'],
+    # leads_generated fica a cargo da agregação da tabela leads (GET /creatives)
+    return {
+        **insight_row(ad_data['id'], insights),
         'client_id':     client_id,
         'campaign_id':   camp_uuid,
         'name':          ad_data.get('name', ''),
         'thumbnail_url': creative_info.get('thumbnail_url', ''),
         'headline':      creative_info.get('title', ''),
-        'spend_cents':   spend_cents,
-        'clicks':        clicks,
-        'impressions':   impressions,
-        'ctr':           ctr,
-        'last_metrics_sync': 'NOW()'
-    }, on_conflict='external_id').execute()
+        'last_metrics_sync': datetime.now(timezone.utc).isoformat()
+    }
+
+
+def insight_row(external_id: str, insights: Dict[str, Any]) -> Dict[str, Any]:
+    spend = float(insights.get('spend', 0))
+    return {
+        'external_id': external_id,
+        'spend_cents': int(spend * 100),
+        'clicks':      int(insights.get('clicks', 0)),
+        'impressions': int(insights.get('impressions', 0)),
+        'ctr':         float(insights.get('ctr', 0)),
+    }
+
+
+def apply_creative_insights(client_id, rows, supabase):
+    """Atualiza só as métricas dos criativos (RPC apply_creative_insights)."""
+    for i in range(0, len(rows), UPSERT_BATCH):
+        chunk = rows[i:i + UPSERT_BATCH]
+        try:
+            supabase.rpc('apply_creative_insights', {'p_client_id': client_id, 'p_rows': chunk}).execute()
+        except Exception as e:
+            print(f"RPC apply_creative_insights indisponível, atualizando um a um: {e}")
+            now = datetime.now(timezone.utc).isoformat()
+            for row in chunk:
+                values = {k: v for k, v in row.items() if k != 'external_id'}
+                supabase.table('creatives').update({**values, 'last_metrics_sync': now})\
+                    .eq('client_id', client_id).eq('external_id', row['external_id']).execute()
+
+
+def upsert_creatives_bulk(rows, supabase):
+    for i in range(0, len(rows), UPSERT_BATCH):
+        supabase.table('creatives').upsert(rows[i:i + UPSERT_BATCH], on_conflict='external_id').execute()
+
+
+def upsert_creative(client_id, camp_uuid, ad_data, supabase):
+    row = creative_row(client_id, camp_uuid, ad_data)
+    if not row:
+        return
+    supabase.table('creatives').upsert(row, on_conflict='external_id').execute()
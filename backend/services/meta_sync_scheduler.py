@@ -0,0 +1,177 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from database import get_supabase
+from services.meta_sync import sync_meta_account
+from services.scheduler_leases import INSTANCE_ID
+
+# Agenda do sync Meta de todos os clientes (migration 20).
+# Em vez de sincronizar todos os clientes em sequência a cada 4 horas, um tick curto
+# reserva os clientes vencidos (claim_meta_syncs, com SKIP LOCKED e lease) e roda até
+# SYNC_CONCURRENCY syncs em paralelo. O próximo horário de cada cliente é o fim do sync
+# + SYNC_INTERVAL com jitter, então os clientes ficam espalhados pelo intervalo e vários
+# workers/instâncias nunca sincronizam o mesmo cliente ao mesmo tempo.
+
+SYNC_INTERVAL    = timedelta(hours=float(os.getenv("META_SYNC_INTERVAL_HOURS", "4")))
+SYNC_CONCURRENCY = int(os.getenv("META_SYNC_CONCURRENCY", "4"))
+TICK_SECONDS     = int(os.getenv("META_SYNC_TICK_SECONDS", "300"))
+LEASE_SECONDS    = int(os.getenv("META_SYNC_LEASE_SECONDS", "3600"))
+JITTER           = 0.1   # ±10% do intervalo
+RETRY_AFTER      = timedelta(minutes=30)
+
+WORKER_ID = INSTANCE_ID
+
+
+def next_run_after(finished: datetime, interval: timedelta = SYNC_INTERVAL, jitter: float = JITTER) -> datetime:
+    return finished + interval * random.uniform(1 - jitter, 1 + jitter)
+
+
+class MetaSyncScheduler:
+    def __init__(
+        self,
+        sync: Callable[[str], Awaitable[Dict[str, Any]]] = sync_meta_account,
+        concurrency: int = SYNC_CONCURRENCY,
+        interval: timedelta = SYNC_INTERVAL,
+        worker_id: str = WORKER_ID,
+    ):
+        self.sync = sync
+        self.concurrency = concurrency
+        self.interval = interval
+        self.worker_id = worker_id
+        self._running = False
+        # Fallback sem a migration 20: agenda local ao worker (client_id -> próximo horário)
+        self._local_next: Dict[str, datetime] = {}
+        self._local_claims: set = set()
+        self.counters = {"ticks": 0, "skipped_ticks": 0, "synced": 0, "failed": 0}
+        self.last_tick: Optional[Dict[str, Any]] = None
+
+    async def run_due(self) -> int:
+        """Job do APScheduler: sincroniza os clientes vencidos. Retorna quantos rodaram."""
+        if self._running:
+            # Tick anterior ainda em andamento neste worker
+            self.counters["skipped_ticks"] += 1
+            return 0
+        self._running = True
+        started = time.monotonic()
+        total = 0
+        try:
+            self.counters["ticks"] += 1
+            # `concurrency` slots, cada um reservando um cliente por vez: um sync lento não
+            # segura os demais, e clientes ainda não iniciados ficam livres para outros workers
+            counts = await asyncio.gather(*(self._slot() for _ in range(self.concurrency)))
+            total = sum(counts)
+        except Exception as e:
+            print(f"Scheduler Sync Error: {e}")
+        finally:
+            self._running = False
+            self.last_tick = {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "clients": total,
+                "duration_ms": int((time.monotonic() - started) * 1000),
+            }
+        return total
+
+    async def _slot(self) -> int:
+        done = 0
+        while True:
+            claimed = await asyncio.to_thread(self._claim, 1)
+            if not claimed:
+                return done
+            await self._run_client(claimed[0])
+            done += 1
+
+    async def _run_client(self, client_id: str):
+        started = time.monotonic()
+        status, error, summary = "ok", None, None
+        try:
+            summary = await self.sync(client_id)
+            # sync_meta_account trata os erros por conta (ex.: token expirado) e só os conta
+            if summary and summary.get("errors"):
+                status = "error"
+                error = f"{summary['errors']} conta(s) com erro: {summary.get('last_error') or 'sem detalhes'}"[:500]
+                self.counters["failed"] += 1
+            else:
+                self.counters["synced"] += 1
+        except Exception as e:
+            print(f"Error syncing meta for {client_id}: {e}")
+            status, error = "error", str(e)[:500]
+            self.counters["failed"] += 1
+        duration_ms = int((time.monotonic() - started) * 1000)
+
+        now = datetime.now(timezone.utc)
+        next_run = next_run_after(now, self.interval) if status == "ok" else now + min(RETRY_AFTER, self.interval)
+        await asyncio.to_thread(self._finish, client_id, status, duration_ms, next_run, error, summary)
+
+    # ─── Persistência ──────────────────────────────────────────────────────────
+    def _claim(self, limit: int) -> List[str]:
+        try:
+            res = get_supabase().rpc("claim_meta_syncs", {
+                "p_worker":         self.worker_id,
+                "p_limit":          limit,
+                "p_lease_seconds":  LEASE_SECONDS,
+                "p_spread_seconds": int(self.interval.total_seconds()),
+            }).execute()
+            return [row["client_id"] for row in res.data or []]
+        except Exception as e:
+            print(f"RPC claim_meta_syncs indisponível, usando agenda local: {e}")
+            return self._claim_local(limit)
+
+    def _claim_local(self, limit: int) -> List[str]:
+        res = get_supabase().table("ad_accounts").select("client_id").eq("platform", "meta").execute()
+        now = datetime.now(timezone.utc)
+        for client_id in {acc["client_id"] for acc in res.data or [] if acc.get("client_id")}:
+            if client_id not in self._local_next:
+                # Primeira execução em um ponto aleatório do intervalo
+                self._local_next[client_id] = now + self.interval * random.random()
+        due = sorted((at, cid) for cid, at in self._local_next.items() if at <= now)[:limit]
+        for _, client_id in due:
+            # Reservado até o _finish gravar o próximo horário
+            self._local_next[client_id] = now + timedelta(seconds=LEASE_SECONDS)
+            self._local_claims.add(client_id)
+        return [client_id for _, client_id in due]
+
+    def _finish(self, client_id, status, duration_ms, next_run: datetime, error, summary):
+        if client_id in self._local_claims:
+            self._local_claims.discard(client_id)
+            self._local_next[client_id] = next_run
+            return
+        try:
+            get_supabase().rpc("finish_meta_sync", {
+                "p_client_id":   client_id,
+                "p_worker":      self.worker_id,
+                "p_status":      status,
+                "p_duration_ms": duration_ms,
+                "p_next_run_at": next_run.isoformat(),
+                "p_error":       error,
+                "p_summary":     summary,
+            }).execute()
+        except Exception as e:
+            print(f"Erro ao registrar sync Meta de {client_id}: {e}")
+
+    # ─── Métricas ──────────────────────────────────────────────────────────────
+    def stats(self) -> Dict[str, Any]:
+        """Contadores deste worker + última duração e próximo horário de cada cliente."""
+        try:
+            res = get_supabase().table("meta_sync_schedule").select(
+                "client_id, next_run_at, last_started_at, last_finished_at, last_duration_ms, last_status, last_error, locked_by"
+            ).order("next_run_at").execute()
+            clients = res.data or []
+        except Exception as e:
+            print(f"Erro ao ler meta_sync_schedule: {e}")
+            clients = [{"client_id": cid, "next_run_at": at.isoformat()} for cid, at in sorted(self._local_next.items(), key=lambda i: i[1])]
+        return {
+            "worker": self.worker_id,
+            "interval_hours": self.interval.total_seconds() / 3600,
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "last_tick": self.last_tick,
+            **self.counters,
+            "clients": clients,
+        }
+
+
+meta_sync_scheduler = MetaSyncScheduler()
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from database import get_supabase
+from services.logger import LogPipeline
+
+# Ingestão dos eventos do scanner.js (sites dos clientes).
+# O client_id é validado contra um conjunto em memória dos clientes ativos (recarregado
+# a cada ACTIVE_CLIENTS_TTL, ou antes em um id desconhecido, no máximo a cada
+# MISS_REFRESH_INTERVAL) e os eventos vão para um buffer write-behind: o mesmo pipeline
+# dos logs, gravando external_events com inserts multi-linha por tamanho ou tempo.
+
+# Limites do que vem da internet (beacons): uma linha inválida não pode travar o lote
+MAX_EVENT_TYPE_LENGTH = 64
+MAX_PAGE_URL_LENGTH   = 2048
+MAX_METADATA_BYTES    = 4096
+MAX_METADATA_STRING   = 512
+MAX_METADATA_DEPTH    = 4
+
+ACTIVE_CLIENTS_TTL    = 300
+MISS_REFRESH_INTERVAL = 30
+MAX_EVENTS_PER_BATCH  = 50
+SCANNER_SPILL_PATH    = os.getenv("SCANNER_SPILL_PATH", "/tmp/funila_scanner_spill.jsonl")
+
+
+def clean_text(value: str, max_length: int) -> str:
+    """Remove NUL (o Postgres rejeita em text/jsonb) e outros controles, e corta no limite."""
+    value = "".join(c for c in str(value) if c >= " " or c in "\t\n")
+    return value[:max_length]
+
+
+def _clean_value(value, depth: int):
+    if isinstance(value, str):
+        return clean_text(value, MAX_METADATA_STRING)
+    if isinstance(value, dict):
+        if depth >= MAX_METADATA_DEPTH:
+            return None
+        return {clean_text(k, MAX_EVENT_TYPE_LENGTH): _clean_value(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, list):
+        if depth >= MAX_METADATA_DEPTH:
+            return None
+        return [_clean_value(v, depth + 1) for v in value]
+    if value is None or isinstance(value, (bool, int)):
+        return value
+    if isinstance(value, float):
+        # NaN/Infinity não são JSON válido
+        return value if value == value and value not in (float("inf"), float("-inf")) else None
+    return clean_text(value, MAX_METADATA_STRING)
+
+
+def clean_metadata(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Metadata sem NUL, com profundidade e tamanho limitados (acima do limite, só a marca)."""
+    if not metadata:
+        return {}
+    cleaned = _clean_value(metadata, 0) or {}
+    if len(json.dumps(cleaned, ensure_ascii=False).encode()) > MAX_METADATA_BYTES:
+        return {"truncated": True}
+    return cleaned
+
+
+class ActiveClients:
+    def __init__(self, ttl: float = ACTIVE_CLIENTS_TTL, miss_refresh: float = MISS_REFRESH_INTERVAL):
+        self.ttl = ttl
+        self.miss_refresh = miss_refresh
+        self._ids: Set[str] = set()
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "unknown": 0, "refreshes": 0}
+
+    def refresh(self) -> Set[str]:
+        res = get_supabase().table("clients").select("id").eq("active", True).execute()
+        ids = {row["id"] for row in res.data or []}
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+            self.counters["refreshes"] += 1
+        return ids
+
+    def lookup(self, client_id: str) -> Optional[bool]:
+        """True/False pelo cache; None se é preciso recarregar antes de decidir."""
+        with self._lock:
+            age = time.monotonic() - self._loaded_at
+            if client_id in self._ids and age < self.ttl:
+                self.counters["hits"] += 1
+                return True
+            if age < min(self.ttl, self.miss_refresh):
+                self.counters["unknown"] += 1
+                return False
+        return None
+
+    async def is_active(self, client_id: str) -> bool:
+        known = self.lookup(client_id)
+        if known is not None:
+            return known
+        try:
+            ids = await asyncio.to_thread(self.refresh)
+        except Exception as e:
+            print(f"Erro ao carregar clientes ativos do scanner: {e}")
+            with self._lock:
+                ids = self._ids
+        if client_id not in ids:
+            with self._lock:
+                self.counters["unknown"] += 1
+            return False
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counters, "clients": len(self._ids)}
+
+
+active_clients = ActiveClients()
+scanner_pipeline = LogPipeline(table="external_events", spill_path=SCANNER_SPILL_PATH, sample_rates={})
+
+
+async def ingest_scanner_events(client_id: str, events: List[Dict[str, Any]]) -> int:
+    """Enfileira os eventos de um cliente ativo. Retorna quantos foram aceitos."""
+    if not events or not await active_clients.is_active(client_id):
+        return 0
+    now = datetime.utcnow().isoformat()
+    accepted = 0
+    for event in events[:MAX_EVENTS_PER_BATCH]:
+        accepted += scanner_pipeline.enqueue({
+            "client_id":  client_id,
+            "event_type": event["event_type"],
+            "page_url":   event.get("page_url"),
+            "metadata":   event.get("metadata") or {},
+            # Horário de recebimento, não do flush
+            "created_at": now,
+        })
+    return accepted
+
+
+def scanner_stats() -> Dict[str, Any]:
+    return {"pipeline": scanner_pipeline.stats(), "active_clients": active_clients.stats()}
@@ -0,0 +1,163 @@
+import asyncio
+import functools
+import os
+import socket
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from database import get_supabase
+
+# Eleição de líder por job do APScheduler (migration 21).
+# Cada worker do uvicorn inicia seu próprio AsyncIOScheduler; os jobs são registrados
+# com scheduler_leases.job(nome, func) e só executam no worker que mantém o lease do job.
+# Um heartbeat em background adquire/renova os leases (renew_scheduler_leases) a cada
+# HEARTBEAT_SECONDS; se o dono morrer, o lease expira em LEASE_TTL e outro worker assume.
+
+LEASE_TTL         = int(os.getenv("SCHEDULER_LEASE_TTL", "60"))
+HEARTBEAT_SECONDS = float(os.getenv("SCHEDULER_HEARTBEAT_SECONDS", "20"))
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _parse_ts(value: Optional[str]) -> datetime:
+    try:
+        ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    except (AttributeError, ValueError):
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+
+class SchedulerLeases:
+    def __init__(self, holder: str = INSTANCE_ID, ttl: int = LEASE_TTL, heartbeat: float = HEARTBEAT_SECONDS):
+        self.holder = holder
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.jobs: List[str] = []
+        self._held: Set[str] = set()
+        self._held_until = 0.0
+        # None = nunca renovou; False = RPC indisponível (sem migration 21)
+        self._available: Optional[bool] = None
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"heartbeats": 0, "heartbeat_errors": 0, "runs": 0, "skipped": 0, "failed": 0}
+
+    # ─── Registro de jobs ──────────────────────────────────────────────────────
+    def job(self, name: str, func: Callable) -> Callable:
+        """Envolve func: executa só se este worker tiver o lease de `name`."""
+        if name not in self.jobs:
+            self.jobs.append(name)
+
+        @functools.wraps(func)
+        async def run(*args, **kwargs):
+            if not self.holds(name):
+                self.counters["skipped"] += 1
+                return None
+            started = time.monotonic()
+            status, error, result = "ok", None, None
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    result = await func(*args, **kwargs)
+                else:
+                    result = await asyncio.to_thread(func, *args, **kwargs)
+            except Exception as e:
+                print(f"Scheduler job {name} failed: {e}")
+                status, error = "error", str(e)[:500]
+                self.counters["failed"] += 1
+            self.counters["runs"] += 1
+            await asyncio.to_thread(self._record, name, status, int((time.monotonic() - started) * 1000), error)
+            return result
+
+        return run
+
+    def holds(self, name: str) -> bool:
+        if self._available is False:
+            # Sem a tabela de leases: comportamento antigo, todos os workers executam
+            return True
+        return name in self._held and time.monotonic() < self._held_until
+
+    # ─── Heartbeat ─────────────────────────────────────────────────────────────
+    def renew(self) -> Set[str]:
+        started = time.monotonic()
+        try:
+            res = get_supabase().rpc("renew_scheduler_leases", {
+                "p_holder":      self.holder,
+                "p_jobs":        self.jobs,
+                "p_ttl_seconds": self.ttl,
+            }).execute()
+            self._held = {row if isinstance(row, str) else row.get("renew_scheduler_leases") for row in res.data or []}
+            self._held_until = started + self.ttl
+            self._available = True
+            self.counters["heartbeats"] += 1
+        except Exception as e:
+            self.counters["heartbeat_errors"] += 1
+            if self._available is None:
+                print(f"RPC renew_scheduler_leases indisponível, jobs rodam em todos os workers: {e}")
+                self._available = False
+            else:
+                # Falha temporária: mantém os leases atuais até expirarem (holds checa o prazo)
+                print(f"Erro ao renovar leases do scheduler: {e}")
+        return self._held
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.to_thread(self.renew)
+            await asyncio.sleep(self.heartbeat)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._held and self._available:
+            try:
+                await asyncio.to_thread(
+                    lambda: get_supabase().rpc("release_scheduler_leases", {"p_holder": self.holder}).execute()
+                )
+            except Exception as e:
+                print(f"Erro ao liberar leases do scheduler: {e}")
+        self._held = set()
+
+    def _record(self, name, status, duration_ms, error):
+        if not self._available:
+            return
+        try:
+            get_supabase().rpc("record_scheduler_run", {
+                "p_job":         name,
+                "p_holder":      self.holder,
+                "p_status":      status,
+                "p_duration_ms": duration_ms,
+                "p_error":       error,
+            }).execute()
+        except Exception as e:
+            print(f"Erro ao registrar execução do job {name}: {e}")
+
+    # ─── Status ────────────────────────────────────────────────────────────────
+    def status(self) -> Dict[str, Any]:
+        """Dono de cada job (global) e estado do heartbeat deste worker."""
+        leases: List[Dict[str, Any]] = []
+        if self._available is not False:
+            try:
+                res = get_supabase().table("scheduler_leases").select("*").order("job").execute()
+                now = datetime.now(timezone.utc)
+                leases = [{**row, "active": _parse_ts(row.get("expires_at")) > now} for row in res.data or []]
+            except Exception as e:
+                print(f"Erro ao ler scheduler_leases: {e}")
+        return {
+            "instance": self.holder,
+            "leases_available": self._available,
+            "held_here": sorted(name for name in self._held if self.holds(name)),
+            "jobs": leases,
+            **self.counters,
+        }
+
+
+scheduler_leases = SchedulerLeases()
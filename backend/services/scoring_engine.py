@@ -0,0 +1,340 @@
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database import get_supabase
+
+# Motor de pontuação interna dos leads (migration 22).
+# As regras de cada cliente (client_scoring_rules, ou DEFAULT_RULES) são compiladas uma
+# vez: os valores das regras são normalizados na compilação e as opções conhecidas dos
+# campos (form_fields.options) viram uma tabela valor -> pontos. Respostas novas são
+# avaliadas uma vez e memorizadas. Em lote, cada coluna é pontuada pelos seus valores
+# distintos (poucos: os campos são selects), e os pontos somados por lead.
+#
+# Regras: {"fields": {field_key: [{"op", "values", "points"}, ...]}, "max_internal": 100}
+# Por campo vale a primeira regra que casar. Operadores:
+#   equals        valor normalizado é um dos `values`
+#   contains_any  valor normalizado contém algum dos `values`
+#   contains_all  valor normalizado contém todos os `values`
+#   present       valor preenchido
+
+DEFAULT_RULES: Dict[str, Any] = {
+    "fields": {
+        # "Mais de 3 anos" -> "maisde3anos"
+        "clt_years": [
+            {"op": "contains_any", "values": ["maisde3", "acimade3"], "points": 30},
+            {"op": "contains_any", "values": ["2a3", "23anos"], "points": 15},
+        ],
+        # "R$3.000 - R$5.000" -> "30005000"; "Acima de R$5.000" -> "acimade5000"
+        "income_range": [
+            {"op": "contains_all", "values": ["3000", "5000"], "points": 25},
+            {"op": "contains_all", "values": ["acima", "5000"], "points": 25},
+            {"op": "contains_any", "values": ["maisde5000"], "points": 25},
+        ],
+        "tried_financing": [
+            {"op": "equals", "values": ["nao", "não", "nunca"], "points": 20},
+        ],
+        "phone": [
+            {"op": "present", "points": 10},
+        ],
+    },
+    "max_internal": 100,
+}
+
+OPERATORS  = ("equals", "contains_any", "contains_all", "present")
+MEMO_LIMIT = 10000   # respostas memorizadas por campo
+SCORER_TTL = 300
+# Só o worker que salvou as regras invalida o próprio cache: os outros conferem
+# client_scoring_rules.version no máximo a cada VERSION_CHECK_INTERVAL segundos.
+VERSION_CHECK_INTERVAL = 5
+# Leads pontuados com as regras antigas nessa janela são repontuados por uma passada final
+RESCORE_TAIL_MARGIN = 30
+
+
+def normalize(s) -> str:
+    """Normalização de strings para evitar erros de digitação/espaços."""
+    if not s: return ""
+    return str(s).lower().replace(" ", "").replace("r$", "").replace(".", "").replace(",", "").replace("-", "").replace("–", "")
+
+
+def status_for_score(final_score: int) -> str:
+    if final_score >= 70:
+        return "hot"
+    if final_score >= 40:
+        return "warm"
+    return "cold"
+
+
+def _value_key(value) -> str:
+    return "" if value is None else str(value)
+
+
+class CompiledField:
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules: List[Tuple[str, Any, int]] = []
+        for rule in rules:
+            op = rule["op"]
+            values = [normalize(v) for v in rule.get("values") or []]
+            self.rules.append((op, frozenset(values) if op == "equals" else tuple(values), int(rule["points"])))
+        self.table: Dict[str, int] = {}
+
+    def evaluate(self, value) -> int:
+        """Avalia as regras sem tabela (caminho interpretado)."""
+        norm = normalize(value)
+        for op, values, points in self.rules:
+            if op == "present":
+                matched = bool(value)
+            elif op == "equals":
+                matched = norm in values
+            elif op == "contains_any":
+                matched = any(v in norm for v in values)
+            else:
+                matched = all(v in norm for v in values)
+            if matched:
+                return points
+        return 0
+
+    def points(self, value) -> int:
+        key = _value_key(value)
+        points = self.table.get(key)
+        if points is None:
+            points = self.evaluate(value)
+            if len(self.table) < MEMO_LIMIT:
+                self.table[key] = points
+        return points
+
+
+class CompiledScorer:
+    def __init__(self, rules: Dict[str, Any], options: Optional[Dict[str, Iterable[str]]] = None, version: int = 0):
+        self.version = version
+        self.max_internal = int(rules.get("max_internal", 100))
+        self.fields = {key: CompiledField(field_rules) for key, field_rules in (rules.get("fields") or {}).items()}
+        # Pré-computa a tabela com as opções conhecidas dos campos de seleção
+        for key, values in (options or {}).items():
+            if key in self.fields:
+                for value in values:
+                    self.fields[key].points(value)
+
+    def score(self, answers: Dict[str, Any]) -> int:
+        total = sum(field.points(answers.get(key)) for key, field in self.fields.items())
+        return min(total, self.max_internal)
+
+    def score_batch(self, rows: List[Dict[str, Any]]) -> List[int]:
+        """Pontua vários leads por coluna: cada valor distinto é resolvido uma vez."""
+        totals = [0] * len(rows)
+        for key, field in self.fields.items():
+            column = [_value_key(row.get(key)) for row in rows]
+            lookup = {value: field.points(value) for value in set(column)}
+            if not any(lookup.values()):
+                continue
+            for i, value in enumerate(column):
+                totals[i] += lookup[value]
+        cap = self.max_internal
+        return [t if t < cap else cap for t in totals]
+
+
+def validate_rules(rules: Dict[str, Any]) -> Optional[str]:
+    """Mensagem de erro se as regras forem inválidas; None se estiverem ok."""
+    fields = rules.get("fields")
+    if not isinstance(fields, dict):
+        return "Regras devem ter 'fields' por campo"
+    for key, field_rules in fields.items():
+        if not isinstance(field_rules, list):
+            return f"Regras do campo {key} devem ser uma lista"
+        for rule in field_rules:
+            if not isinstance(rule, dict) or rule.get("op") not in OPERATORS:
+                return f"Operador inválido no campo {key} (use {', '.join(OPERATORS)})"
+            if not isinstance(rule.get("points"), int):
+                return f"Pontos inválidos no campo {key}"
+            if rule["op"] != "present" and not rule.get("values"):
+                return f"Regra '{rule['op']}' do campo {key} sem valores"
+    return None
+
+
+# ─── Regras por cliente (cache por worker) ─────────────────────────────────────
+_options: Dict[str, List[str]] = {}
+_lock = threading.Lock()
+
+
+def _field_options(supabase) -> Dict[str, List[str]]:
+    with _lock:
+        if _options:
+            return _options
+    options = {}
+    try:
+        for field in supabase.table("form_fields").select("field_key, options").execute().data or []:
+            values = []
+            for opt in field.get("options") or []:
+                values.append(opt.get("value") or opt.get("label") if isinstance(opt, dict) else opt)
+            options[field["field_key"]] = [v for v in values if v]
+    except Exception as e:
+        print(f"Erro ao carregar opções dos campos para o scoring: {e}")
+        return {}
+    with _lock:
+        _options.update(options)
+    return options
+
+
+def load_rules(client_id: str, supabase=None) -> Tuple[Dict[str, Any], int]:
+    supabase = supabase or get_supabase()
+    try:
+        res = supabase.table("client_scoring_rules").select("rules, version").eq("client_id", client_id).execute()
+        if res.data:
+            return res.data[0]["rules"], res.data[0].get("version") or 0
+    except Exception as e:
+        print(f"Erro ao carregar regras de scoring de {client_id}, usando padrão: {e}")
+    return DEFAULT_RULES, 0
+
+
+# client_id -> (scorer, compilado em, versão conferida em)
+_scorers: Dict[str, Tuple[CompiledScorer, float, float]] = {}
+
+
+def cached_scorer(client_id: Optional[str]) -> Optional[CompiledScorer]:
+    """Scorer em cache se a versão foi conferida há pouco; None se precisa consultar."""
+    with _lock:
+        entry = _scorers.get(client_id or "")
+    if entry is None:
+        return None
+    now = time.monotonic()
+    if not client_id:
+        return entry[0] if now - entry[1] < SCORER_TTL else None
+    if now - entry[1] < SCORER_TTL and now - entry[2] < VERSION_CHECK_INTERVAL:
+        return entry[0]
+    return None
+
+
+def _rules_version(client_id: str, supabase) -> Optional[int]:
+    try:
+        res = supabase.table("client_scoring_rules").select("version").eq("client_id", client_id).execute()
+        return (res.data[0].get("version") or 0) if res.data else 0
+    except Exception as e:
+        print(f"Erro ao conferir versão das regras de scoring de {client_id}: {e}")
+        return None
+
+
+def get_scorer(client_id: Optional[str], supabase=None) -> CompiledScorer:
+    scorer = cached_scorer(client_id)
+    if scorer is not None:
+        return scorer
+
+    supabase = supabase or get_supabase()
+    key = client_id or ""
+    with _lock:
+        entry = _scorers.get(key)
+    now = time.monotonic()
+    if client_id and entry is not None and now - entry[1] < SCORER_TTL:
+        # Consulta leve: se a versão não mudou, o scorer compilado continua valendo
+        version = _rules_version(client_id, supabase)
+        if version is None or version == entry[0].version:
+            with _lock:
+                _scorers[key] = (entry[0], entry[1], now)
+            return entry[0]
+
+    rules, version = load_rules(client_id, supabase) if client_id else (DEFAULT_RULES, 0)
+    scorer = CompiledScorer(rules, _field_options(supabase), version)
+    now = time.monotonic()
+    with _lock:
+        _scorers[key] = (scorer, now, now)
+    return scorer
+
+
+def invalidate_scorer(client_id: str):
+    with _lock:
+        _scorers.pop(client_id, None)
+
+
+# ─── Repontuação em lote ───────────────────────────────────────────────────────
+RESCORE_PAGE = 5000
+
+
+def rescore_client(client_id: str, supabase=None, page_size: int = RESCORE_PAGE) -> Dict[str, int]:
+    """
+    Recalcula internal_score de todos os leads do cliente com as regras atuais.
+    O status (coluna do Kanban) não é alterado: depois da captação ele é manual.
+    """
+    supabase = supabase or get_supabase()
+    invalidate_scorer(client_id)
+    scorer = get_scorer(client_id, supabase)
+    summary = {"scanned": 0, "updated": 0}
+
+    after = None
+    while True:
+        rows = _lead_answers(client_id, after, page_size, supabase)
+        if not rows:
+            break
+        _rescore_rows(client_id, scorer, rows, summary, supabase)
+        if len(rows) < page_size:
+            break
+        after = rows[-1]["id"]
+    return summary
+
+
+def rescore_recent(client_id: str, since: str, supabase=None) -> Dict[str, int]:
+    """
+    Passada final depois de salvar regras: leads criados desde `since` podem ter sido
+    pontuados por outro worker com as regras antigas (até VERSION_CHECK_INTERVAL) e
+    depois que a repontuação completa já tinha passado por eles.
+    """
+    supabase = supabase or get_supabase()
+    scorer = get_scorer(client_id, supabase)
+    summary = {"scanned": 0, "updated": 0}
+    leads = supabase.table("leads").select("id, phone, internal_score")\
+        .eq("client_id", client_id).gte("created_at", since).execute().data or []
+    for i in range(0, len(leads), RESCORE_PAGE):
+        _rescore_rows(client_id, scorer, _with_answers(leads[i:i + RESCORE_PAGE], supabase), summary, supabase)
+    return summary
+
+
+def _rescore_rows(client_id, scorer: CompiledScorer, rows, summary, supabase):
+    answers = [{**(row.get("answers") or {}), "phone": row.get("phone")} for row in rows]
+    scores = scorer.score_batch(answers)
+    changed = [
+        {"id": row["id"], "internal_score": score}
+        for row, score in zip(rows, scores) if score != row.get("internal_score")
+    ]
+    if changed:
+        _apply_scores(client_id, changed, supabase)
+    summary["scanned"] += len(rows)
+    summary["updated"] += len(changed)
+
+
+def _lead_answers(client_id, after, limit, supabase) -> List[Dict[str, Any]]:
+    try:
+        res = supabase.rpc("get_lead_answers", {"p_client_id": client_id, "p_after": after, "p_limit": limit}).execute()
+        return res.data or []
+    except Exception as e:
+        print(f"RPC get_lead_answers indisponível, montando respostas no Python: {e}")
+
+    query = supabase.table("leads").select("id, phone, internal_score").eq("client_id", client_id).order("id").limit(limit)
+    if after:
+        query = query.gt("id", after)
+    return _with_answers(query.execute().data or [], supabase)
+
+
+def _with_answers(leads: List[Dict[str, Any]], supabase) -> List[Dict[str, Any]]:
+    if not leads:
+        return []
+    answers: Dict[str, Dict[str, Any]] = {lead["id"]: {} for lead in leads}
+    responses = supabase.table("lead_responses").select("lead_id, response_value, form_fields(field_key)")\
+        .in_("lead_id", list(answers)).execute().data or []
+    for r in responses:
+        field_key = (r.get("form_fields") or {}).get("field_key")
+        if field_key:
+            answers[r["lead_id"]][field_key] = r.get("response_value")
+    return [{**lead, "answers": answers[lead["id"]]} for lead in leads]
+
+
+def _apply_scores(client_id, rows, supabase):
+    try:
+        supabase.rpc("apply_lead_scores", {"p_client_id": client_id, "p_rows": rows}).execute()
+        return
+    except Exception as e:
+        print(f"RPC apply_lead_scores indisponível, atualizando por score: {e}")
+    by_score: Dict[int, List[str]] = {}
+    for row in rows:
+        by_score.setdefault(row["internal_score"], []).append(row["id"])
+    for score, ids in by_score.items():
+        for i in range(0, len(ids), 500):
+            supabase.table("leads").update({"internal_score": score})\
+                .eq("client_id", client_id).in_("id", ids[i:i + 500]).execute()
@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import math
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Alocação de slugs sem consultas prévias ao banco.
+# A unicidade é garantida pelo índice único em links(slug): o insert falha com 23505
+# em caso de colisão e a rota tenta outro candidato. O filtro de Bloom (por worker)
+# só evita gerar candidatos que provavelmente já existem.
+
+BLOOM_CAPACITY = 1_000_000
+BLOOM_ERROR_RATE = 0.01
+LOAD_PAGE_SIZE = 1000
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = BLOOM_CAPACITY, error_rate: float = BLOOM_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = hashlib.sha256(value.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: str):
+        for pos in self._positions(value):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+
+class SlugRegistry:
+    """
+    Filtro de Bloom dos slugs existentes, carregado uma vez por worker em uma thread
+    de fundo disparada pela primeira criação de link. A requisição não espera a carga:
+    até ela terminar o filtro só está incompleto, e o índice único + a nova tentativa
+    no 23505 continuam garantindo a unicidade.
+    """
+
+    def __init__(self):
+        self._filter = BloomFilter()
+        self._started = False
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+
+    def ensure_loading(self, supabase):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._load, args=(supabase,), name="slug-registry-load", daemon=True).start()
+
+    def _load(self, supabase):
+        try:
+            # Keyset por id: páginas estáveis mesmo com inserts durante a carga
+            after = None
+            while True:
+                query = supabase.table("links").select("id, slug").order("id").limit(LOAD_PAGE_SIZE)
+                if after is not None:
+                    query = query.gt("id", after)
+                rows = query.execute().data or []
+                for row in rows:
+                    if row.get("slug"):
+                        self._filter.add(row["slug"])
+                if len(rows) < LOAD_PAGE_SIZE:
+                    break
+                after = rows[-1]["id"]
+        except Exception as e:
+            logger.error(f"Erro ao carregar slugs existentes: {e}")
+        finally:
+            self._loaded.set()
+
+    def wait_loaded(self, timeout: float = None) -> bool:
+        return self._loaded.wait(timeout)
+
+    def add(self, slug: str):
+        self._filter.add(slug)
+
+    def probably_exists(self, slug: str) -> bool:
+        return slug in self._filter
+
+
+slug_registry = SlugRegistry()
+
+
+def slug_base(name: str) -> str:
+    base = name.lower().replace(" ", "-")
+    base = "".join(c for c in base if c.isalnum() or c == "-")
+    return base or "link"
+
+
+def candidate_slug(base: str, attempt: int = 0) -> str:
+    """Gera um candidato ainda não visto pelo filtro (sufixo de 4 chars, 6 após colisões)."""
+    length = 4 if attempt == 0 else 6
+    candidate = f"{base}-{uuid.uuid4().hex[:length]}"
+    for _ in range(5):
+        if not slug_registry.probably_exists(candidate):
+            break
+        candidate = f"{base}-{uuid.uuid4().hex[:6]}"
+    return candidate
+
+
+def is_unique_violation(exc: Exception) -> bool:
+    return getattr(exc, "code", None) == "23505" or "23505" in str(exc) or "duplicate key" in str(exc).lower()
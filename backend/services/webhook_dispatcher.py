@@ -0,0 +1,365 @@
+import asyncio
+import math
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from database import get_supabase
+from services.logger import log_system_event
+from utils.url_safety import resolves_to_safe_address
+
+# Entrega de webhooks a partir da tabela webhook_outbox (migration 18).
+# O dispatcher reserva lotes de entregas vencidas (claim_webhook_outbox, com SKIP LOCKED),
+# entrega com limite de concorrência por endpoint e circuit breaker por URL, e grava o
+# resultado de todo o lote em uma chamada (finish_webhook_deliveries). Falhas voltam para
+# a fila com backoff exponencial até WEBHOOK_MAX_ATTEMPTS; depois ficam como 'dead'.
+
+CLAIM_LIMIT           = int(os.getenv("WEBHOOK_CLAIM_LIMIT", "100"))
+LEASE_SECONDS         = int(os.getenv("WEBHOOK_LEASE_SECONDS", "60"))   # mínimo; ver lease_seconds()
+LEASE_MARGIN          = 30
+POLL_INTERVAL         = float(os.getenv("WEBHOOK_POLL_INTERVAL", "2.0"))
+REQUEST_TIMEOUT       = float(os.getenv("WEBHOOK_TIMEOUT", "10.0"))
+ENDPOINT_CONCURRENCY  = int(os.getenv("WEBHOOK_ENDPOINT_CONCURRENCY", "2"))
+MAX_ATTEMPTS          = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+BACKOFF_BASE          = float(os.getenv("WEBHOOK_BACKOFF_BASE", "30"))
+BACKOFF_MAX           = float(os.getenv("WEBHOOK_BACKOFF_MAX", "21600"))
+BREAKER_THRESHOLD     = int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN      = float(os.getenv("WEBHOOK_BREAKER_COOLDOWN", "120"))
+MAX_BATCH_EVENTS      = 100
+LATENCY_WINDOW        = 1000
+ERROR_BACKOFF_MAX     = 60.0   # espera máxima entre ciclos com falha (ex.: RPC ausente)
+BLOCKED_URL_ERROR     = "URL bloqueada: resolve para endereço interno"
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Atraso antes da tentativa seguinte: BACKOFF_BASE * 2^(n-1), com jitter de ±20%."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def lease_seconds(claim_limit: int, concurrency: int, timeout: float = REQUEST_TIMEOUT) -> int:
+    """
+    Lease do lote reservado pelo pior caso de um ciclo: todas as entregas para uma única
+    URL lenta, `concurrency` por vez, cada uma esgotando o timeout. Com um lease menor,
+    outro worker reservaria as mesmas linhas no meio da entrega e as enviaria de novo.
+    """
+    worst = math.ceil(claim_limit / max(1, concurrency)) * timeout + LEASE_MARGIN
+    return max(LEASE_SECONDS, int(math.ceil(worst)))
+
+
+class CircuitBreaker:
+    """
+    Por URL: após BREAKER_THRESHOLD falhas consecutivas o circuito abre e as entregas
+    são adiadas sem requisição até o fim do cooldown; a primeira tentativa depois disso
+    (half-open) fecha o circuito se der certo ou o reabre se falhar.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+
+    def retry_after(self, url: str) -> float:
+        """0 se a URL pode ser chamada agora; senão, segundos até o fim do cooldown."""
+        opened = self._opened_at.get(url)
+        if opened is None:
+            return 0.0
+        return max(0.0, opened + self.cooldown - time.monotonic())
+
+    def record(self, url: str, ok: bool):
+        if ok:
+            self._failures.pop(url, None)
+            self._opened_at.pop(url, None)
+            return
+        failures = self._failures.get(url, 0) + 1
+        self._failures[url] = failures
+        if failures >= self.threshold:
+            self._opened_at[url] = time.monotonic()
+
+    def open_circuits(self) -> List[str]:
+        return [url for url in self._opened_at if self.retry_after(url) > 0]
+
+
+def _parse_ts(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 3)
+
+
+class WebhookDispatcher:
+    def __init__(
+        self,
+        claim_limit: int = CLAIM_LIMIT,
+        poll_interval: float = POLL_INTERVAL,
+        endpoint_concurrency: int = ENDPOINT_CONCURRENCY,
+        max_attempts: int = MAX_ATTEMPTS,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.claim_limit = claim_limit
+        self.poll_interval = poll_interval
+        self.endpoint_concurrency = endpoint_concurrency
+        self.max_attempts = max_attempts
+        self.breaker = breaker or CircuitBreaker()
+        self.lease_seconds = lease_seconds(claim_limit, endpoint_concurrency)
+        self._consecutive_errors = 0
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        self.counters = {
+            "claimed":         0,
+            "delivered":       0,
+            "failed_attempts": 0,
+            "dead":            0,
+            "circuit_skipped": 0,
+            "blocked":         0,
+            "requests":        0,
+            "batched_posts":   0,
+            "cycle_errors":    0,
+        }
+        # Segundos entre o enfileiramento e a entrega / duração das requisições
+        self._delivery_latency: deque = deque(maxlen=LATENCY_WINDOW)
+        self._request_duration: deque = deque(maxlen=LATENCY_WINDOW)
+
+    # ─── Ciclo de vida ─────────────────────────────────────────────────────────
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.run_once()
+                self._consecutive_errors = 0
+            except Exception as e:
+                self.counters["cycle_errors"] += 1
+                self._consecutive_errors += 1
+                processed = 0
+                # Falhas seguidas (ex.: claim_webhook_outbox ainda não existe): a espera dobra
+                # até ERROR_BACKOFF_MAX em vez de repetir a cada poll_interval
+                print(f"[WEBHOOK DISPATCHER] Cycle failed ({self._consecutive_errors}x), "
+                      f"retrying in {self._idle_timeout():.0f}s: {e}")
+
+            # Lote cheio: provavelmente há mais entregas vencidas, segue sem esperar
+            if processed >= self.claim_limit:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._idle_timeout())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _idle_timeout(self) -> float:
+        if not self._consecutive_errors:
+            return self.poll_interval
+        return min(ERROR_BACKOFF_MAX, self.poll_interval * 2 ** self._consecutive_errors)
+
+    # ─── Entrega ───────────────────────────────────────────────────────────────
+    async def run_once(self) -> int:
+        rows = await asyncio.to_thread(self._claim)
+        if not rows:
+            return 0
+        self.counters["claimed"] += len(rows)
+
+        by_url: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_url.setdefault(row["url"], []).append(row)
+
+        results: List[Dict[str, Any]] = []
+        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as http:
+            await asyncio.gather(*(self._deliver_endpoint(http, url, items, results) for url, items in by_url.items()))
+
+        await asyncio.to_thread(self._finish, results)
+        return len(rows)
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        res = get_supabase().rpc("claim_webhook_outbox", {
+            "p_limit": self.claim_limit,
+            "p_lease_seconds": self.lease_seconds,
+        }).execute()
+        return res.data or []
+
+    def _finish(self, results: List[Dict[str, Any]]):
+        if results:
+            get_supabase().rpc("finish_webhook_deliveries", {"p_results": results}).execute()
+
+    async def _deliver_endpoint(self, http: httpx.AsyncClient, url: str, rows: List[Dict[str, Any]], results: List[Dict[str, Any]]):
+        # Endpoints com batch_delivery recebem vários eventos em um único POST
+        units = [[row] for row in rows if not row.get("batch")]
+        batched = [row for row in rows if row.get("batch")]
+        units += [batched[i:i + MAX_BATCH_EVENTS] for i in range(0, len(batched), MAX_BATCH_EVENTS)]
+
+        semaphore = self._semaphores.setdefault(url, asyncio.Semaphore(self.endpoint_concurrency))
+
+        async def deliver(unit):
+            async with semaphore:
+                # O circuito pode abrir no meio do ciclo: confere antes de cada envio
+                wait = self.breaker.retry_after(url)
+                if wait > 0:
+                    results.extend(self._deferred(unit, wait))
+                    return
+                results.extend(await self._post(http, url, unit))
+
+        await asyncio.gather(*(deliver(unit) for unit in units))
+
+    def _deferred(self, rows: List[Dict[str, Any]], wait: float) -> List[Dict[str, Any]]:
+        """Circuito aberto: adia sem requisição e sem consumir tentativa."""
+        self.counters["circuit_skipped"] += len(rows)
+        retry_at = (datetime.now(timezone.utc) + timedelta(seconds=wait)).isoformat()
+        return [self._result(row, "pending", row.get("attempts") or 0, retry_at, None, "circuit open") for row in rows]
+
+    async def _post(self, http: httpx.AsyncClient, url: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        is_batch = len(rows) > 1 or bool(rows[0].get("batch"))
+        body = {"events": [row["payload"] for row in rows]} if is_batch else rows[0]["payload"]
+        client_id = rows[0].get("client_id")
+        lead_id = None if is_batch else rows[0].get("lead_id")
+
+        # A URL foi validada no cadastro, mas o DNS pode mudar depois: confere a cada envio
+        if not await resolves_to_safe_address(url):
+            return await self._blocked(url, rows, body, client_id, lead_id)
+
+        start_time = time.time()
+        status_code, error, response_text = None, None, ""
+        try:
+            # Limite total por envio (o timeout do httpx vale por fase); o lease conta com ele
+            resp = await asyncio.wait_for(http.post(url, json=body), timeout=REQUEST_TIMEOUT)
+            status_code, response_text = resp.status_code, resp.text[:1000] # Truncate response
+            if status_code >= 400:
+                error = f"HTTP {status_code}"
+        except asyncio.TimeoutError:
+            error = f"Timeout após {REQUEST_TIMEOUT:.0f}s"
+        except Exception as e:
+            error = str(e)
+        duration = round((time.time() - start_time) * 1000, 2)
+
+        ok = error is None
+        self.counters["requests"] += 1
+        if is_batch:
+            self.counters["batched_posts"] += 1
+        self._request_duration.append(duration / 1000)
+        self.breaker.record(url, ok)
+
+        metadata = {"url": url, "duration_ms": duration, "payload": body, "events": len(rows)}
+        if status_code is not None:
+            metadata["status_code"] = status_code
+            metadata["response"] = response_text
+        else:
+            metadata["error"] = error
+        await log_system_event(
+            client_id=client_id,
+            level="info" if ok else "error",
+            source="webhook",
+            message=f"Webhook {'success' if ok else 'error'} ({status_code})" if status_code is not None else f"Webhook failed: {error}",
+            lead_id=lead_id,
+            metadata=metadata
+        )
+
+        now = datetime.now(timezone.utc)
+        results = []
+        for row in rows:
+            attempts = (row.get("attempts") or 0) + 1
+            if ok:
+                self.counters["delivered"] += 1
+                created = _parse_ts(row.get("created_at"))
+                if created:
+                    self._delivery_latency.append((now - created).total_seconds())
+                results.append(self._result(row, "delivered", attempts, None, status_code, None))
+            elif attempts >= self.max_attempts:
+                self.counters["failed_attempts"] += 1
+                self.counters["dead"] += 1
+                results.append(self._result(row, "dead", attempts, None, status_code, error))
+            else:
+                self.counters["failed_attempts"] += 1
+                retry_at = (now + timedelta(seconds=backoff_seconds(attempts))).isoformat()
+                results.append(self._result(row, "pending", attempts, retry_at, status_code, error))
+        return results
+
+    async def _blocked(self, url: str, rows: List[Dict[str, Any]], body, client_id, lead_id) -> List[Dict[str, Any]]:
+        """Endereço interno: nenhuma requisição é feita e as entregas vão direto para 'dead'."""
+        self.counters["blocked"] += len(rows)
+        self.counters["dead"] += len(rows)
+        await log_system_event(
+            client_id=client_id,
+            level="error",
+            source="webhook",
+            message=f"Webhook failed: {BLOCKED_URL_ERROR}",
+            lead_id=lead_id,
+            metadata={"url": url, "payload": body, "events": len(rows), "error": BLOCKED_URL_ERROR}
+        )
+        return [self._result(row, "dead", (row.get("attempts") or 0) + 1, None, None, BLOCKED_URL_ERROR) for row in rows]
+
+    @staticmethod
+    def _result(row, status, attempts, next_attempt_at, status_code, error) -> Dict[str, Any]:
+        return {
+            "id":               row["id"],
+            "status":           status,
+            "attempts":         attempts,
+            "next_attempt_at":  next_attempt_at,
+            "last_status_code": status_code,
+            "last_error":       error[:500] if error else None,
+        }
+
+    # ─── Métricas ──────────────────────────────────────────────────────────────
+    def stats(self, include_depth: bool = True) -> Dict[str, Any]:
+        latency = list(self._delivery_latency)
+        durations = list(self._request_duration)
+        data = {
+            **self.counters,
+            "running": self._task is not None and not self._task.done(),
+            "delivery_latency_s": {"p50": _percentile(latency, 0.5), "p95": _percentile(latency, 0.95)},
+            "request_duration_s": {"p50": _percentile(durations, 0.5), "p95": _percentile(durations, 0.95)},
+            "open_circuits": self.breaker.open_circuits(),
+        }
+        if include_depth:
+            try:
+                data["queue"] = get_supabase().rpc("webhook_outbox_depth", {}).execute().data
+            except Exception as e:
+                data["queue"] = None
+                print(f"Erro ao consultar profundidade do outbox de webhooks: {e}")
+        return data
+
+
+webhook_dispatcher = WebhookDispatcher()
+
+
+def purge_webhook_outbox(days: int = 7) -> int:
+    """Job diário: remove entregas concluídas ou mortas há mais de `days` dias."""
+    try:
+        return get_supabase().rpc("purge_webhook_outbox", {"p_days": days}).execute().data or 0
+    except Exception as e:
+        print(f"Erro ao limpar outbox de webhooks: {e}")
+        return 0
@@ -0,0 +1,60 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from database import get_supabase
+
+# Webhooks ativos por cliente em memória (por worker), incluindo entradas negativas:
+# a maioria dos clientes não tem webhooks e, depois da primeira consulta, disparar
+# eventos para eles não faz I/O. As rotas de /webhooks invalidam o cliente alterado;
+# REGISTRY_TTL limita a defasagem nos outros workers e para edições feitas fora da API.
+
+REGISTRY_TTL = 120
+
+_registry: Dict[str, List[Dict[str, Any]]] = {}
+_loaded_at: Dict[str, float] = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "negative_hits": 0, "misses": 0, "invalidations": 0}
+
+
+def cached_webhooks(client_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Webhooks em cache se ainda válidos ([] = cliente sem webhooks); None se precisa carregar."""
+    with _lock:
+        hooks = _registry.get(client_id)
+        if hooks is None or time.monotonic() - _loaded_at.get(client_id, 0) >= REGISTRY_TTL:
+            return None
+        _stats["hits" if hooks else "negative_hits"] += 1
+        return hooks
+
+
+def load_webhooks(client_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Consulta os webhooks ativos do cliente e atualiza o cache. None em caso de erro."""
+    try:
+        res = get_supabase().table("webhooks").select("id, url, batch_delivery")\
+            .eq("client_id", client_id).eq("active", True).execute()
+    except Exception as e:
+        print(f"Error fetching webhooks for client {client_id}: {e}")
+        return None
+
+    hooks = res.data or []
+    with _lock:
+        _registry[client_id] = hooks
+        _loaded_at[client_id] = time.monotonic()
+        _stats["misses"] += 1
+    return hooks
+
+
+def get_active_webhooks(client_id: str) -> Optional[List[Dict[str, Any]]]:
+    hooks = cached_webhooks(client_id)
+    return hooks if hooks is not None else load_webhooks(client_id)
+
+
+def invalidate_webhooks(client_id: str):
+    with _lock:
+        _registry.pop(client_id, None)
+        _loaded_at.pop(client_id, None)
+        _stats["invalidations"] += 1
+
+
+def registry_stats() -> Dict[str, Any]:
+    with _lock:
+        return {**_stats, "clients": len(_registry), "with_webhooks": sum(1 for h in _registry.values() if h)}
@@ -2,33 +2,56 @@ import httpx
 import asyncio
 import time
 from database import get_supabase
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from services.logger import log_system_event
+from utils.url_safety import resolves_to_safe_address
+from services.webhook_dispatcher import webhook_dispatcher
+from services.webhook_registry import cached_webhooks, load_webhooks
+
+# Os eventos são gravados no outbox (webhook_outbox) e entregues pelo webhook_dispatcher
+# com retentativas. Se o outbox não estiver disponível, entrega direto como antes.
+
+# Envios simultâneos na entrega direta (fallback)
+BATCH_CONCURRENCY = 10
+
+async def send_webhook(url: str, payload: Dict[str, Any], client_id: str, lead_id: str = None, http: Optional[httpx.AsyncClient] = None):
+    if not await resolves_to_safe_address(url):
+        await log_system_event(
+            client_id=client_id,
+            level="error",
+            source="webhook",
+            message="Webhook failed: URL bloqueada: resolve para endereço interno",
+            lead_id=lead_id,
+            metadata={"url": url, "payload": payload, "error": "URL bloqueada"}
+        )
+        return
 
-async def send_webhook(url: str, payload: Dict[str, Any], client_id: str, lead_id: str = None):
     start_time = time.time()
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(url, json=payload)
-            duration = round((time.time() - start_time) * 1000, 2)
+        if http is None:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                resp = await client.post(url, json=payload)
+        else:
+            resp = await http.post(url, json=payload)
+        duration = round((time.time() - start_time) * 1000, 2)
 
-            status = "success" if resp.status_code < 400 else "error"
-            level = "info" if status == "success" else "error"
+        status = "success" if resp.status_code < 400 else "error"
+        level = "info" if status == "success" else "error"
 
-            await log_system_event(
-                client_id=client_id,
-                level=level,
-                source="webhook",
-                message=f"Webhook {status} ({resp.status_code})",
-                lead_id=lead_id,
-                metadata={
-                    "url": url,
-                    "status_code": resp.status_code,
-                    "duration_ms": duration,
-                    "payload": payload,
-                    "response": resp.text[:1000] # Truncate response
-                }
-            )
+        await log_system_event(
+            client_id=client_id,
+            level=level,
+            source="webhook",
+            message=f"Webhook {status} ({resp.status_code})",
+            lead_id=lead_id,
+            metadata={
+                "url": url,
+                "status_code": resp.status_code,
+                "duration_ms": duration,
+                "payload": payload,
+                "response": resp.text[:1000] # Truncate response
+            }
+        )
 
     except Exception as e:
         duration = round((time.time() - start_time) * 1000, 2)
@@ -46,28 +69,10 @@ async def send_webhook(url: str, payload: Dict[str, Any], client_id: str, lead_i
             }
         )
 
-async def trigger_webhooks(event_type: str, lead_data: Dict[str, Any], client_id: str):
-    """
-    Triggers webhooks for a specific client and event.
-    Designed to be run as a background task.
-    """
-    supabase = get_supabase()
-
-    # Fetch active webhooks for the client
-    try:
-        res = supabase.table("webhooks").select("url").eq("client_id", client_id).eq("active", True).execute()
-        webhooks = res.data
-    except Exception as e:
-        print(f"Error fetching webhooks for client {client_id}: {e}")
-        return
-
-    if not webhooks:
-        return
-
-    # Construct payload
+def build_webhook_payload(event_type: str, lead_data: Dict[str, Any]) -> Dict[str, Any]:
     # Payload format required: { lead_id, name, phone, status, internal_score, serasa_score }
     # We add event_type for context
-    payload = {
+    return {
         "event": event_type,
         "lead_id": lead_data.get("id"),
         "name": lead_data.get("name"),
@@ -77,9 +82,55 @@ async def trigger_webhooks(event_type: str, lead_data: Dict[str, Any], client_id
         "serasa_score": lead_data.get("serasa_score")
     }
 
-    # Send to all webhooks
-    # We can run them concurrently
-    lead_id = lead_data.get("id")
-    tasks = [send_webhook(wh["url"], payload, client_id, lead_id) for wh in webhooks]
-    if tasks:
-        await asyncio.gather(*tasks)
+def enqueue_webhook_events(event_type: str, leads: List[Dict[str, Any]], client_id: str, webhooks: List[Dict[str, Any]]) -> bool:
+    """Grava uma entrega por (webhook, lead) no outbox em um único insert."""
+    rows = [{
+        "client_id":  client_id,
+        "webhook_id": wh.get("id"),
+        "url":        wh["url"],
+        "event":      event_type,
+        "lead_id":    lead.get("id"),
+        "payload":    build_webhook_payload(event_type, lead),
+        "batch":      bool(wh.get("batch_delivery")),
+    } for lead in leads for wh in webhooks]
+    try:
+        get_supabase().table("webhook_outbox").insert(rows).execute()
+        return True
+    except Exception as e:
+        print(f"Error enqueuing webhooks for client {client_id}, delivering directly: {e}")
+        return False
+
+async def trigger_webhooks(event_type: str, lead_data: Dict[str, Any], client_id: str):
+    """
+    Triggers webhooks for a specific client and event.
+    Designed to be run as a background task.
+    """
+    await trigger_webhooks_batch(event_type, [lead_data], client_id)
+
+async def trigger_webhooks_batch(event_type: str, leads: List[Dict[str, Any]], client_id: str):
+    """
+    Same as trigger_webhooks for many leads of one client (e.g. bulk Kanban moves):
+    webhooks come from the registry once and every (webhook, lead) delivery goes to the outbox.
+    """
+    if not leads:
+        return
+    # Registro em memória: clientes sem webhooks (entrada negativa) saem aqui sem I/O
+    webhooks = cached_webhooks(client_id)
+    if webhooks is None:
+        webhooks = await asyncio.to_thread(load_webhooks, client_id)
+    if not webhooks:
+        return
+
+    if await asyncio.to_thread(enqueue_webhook_events, event_type, leads, client_id, webhooks):
+        webhook_dispatcher.wake()
+        return
+
+    # Fallback: entrega direta, sem retentativas
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async with httpx.AsyncClient(timeout=10.0) as http:
+        async def deliver(url, lead):
+            async with semaphore:
+                await send_webhook(url, build_webhook_payload(event_type, lead), client_id, lead.get("id"), http)
+
+        await asyncio.gather(*(deliver(wh["url"], lead) for lead in leads for wh in webhooks))
@@ -0,0 +1,65 @@
+from unittest.mock import MagicMock, patch
+
+from services import attribution
+from services.attribution import refresh_creative_map, resolve_creative_id
+
+CLIENT = "client-1"
+
+
+def _supabase(creatives):
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = creatives
+    return supabase
+
+
+def setup_function():
+    attribution._creative_maps.clear()
+    attribution._loaded_at.clear()
+
+
+def test_utm_content_matches_external_id_and_name():
+    supabase = _supabase([
+        {"id": "c1", "external_id": "120210001", "name": "Vídeo depoimento"},
+        {"id": "c2", "external_id": "120210002", "name": "Carrossel"},
+    ])
+    with patch("services.attribution.get_supabase", return_value=supabase):
+        assert resolve_creative_id(CLIENT, "120210001") == "c1"
+        assert resolve_creative_id(CLIENT, "Carrossel") == "c2"
+        assert resolve_creative_id(CLIENT, "desconhecido") is None
+        assert resolve_creative_id(CLIENT, None) is None
+
+
+def test_external_id_wins_and_repeated_names_are_not_attributed():
+    mapping = refresh_creative_map(CLIENT, _supabase([
+        {"id": "c1", "external_id": "Promo", "name": "Banner"},
+        {"id": "c2", "external_id": "120210002", "name": "Promo"},
+        {"id": "c3", "external_id": "120210003", "name": "Banner"},
+    ]))
+    assert mapping["Promo"] == "c1"
+    assert "Banner" not in mapping
+
+
+def test_map_is_cached_until_refreshed_by_sync():
+    supabase = _supabase([{"id": "c1", "external_id": "120210001", "name": "A"}])
+    with patch("services.attribution.get_supabase", return_value=supabase):
+        assert resolve_creative_id(CLIENT, "120210001") == "c1"
+        assert resolve_creative_id(CLIENT, "120210002") is None
+        assert supabase.table.call_count == 1
+
+        # meta_sync recarrega o mapa depois de gravar novos criativos
+        supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {"id": "c1", "external_id": "120210001", "name": "A"},
+            {"id": "c2", "external_id": "120210002", "name": "B"},
+        ]
+        refresh_creative_map(CLIENT, supabase)
+        assert resolve_creative_id(CLIENT, "120210002") == "c2"
+        assert supabase.table.call_count == 2
+
+
+def test_expired_map_is_reloaded_and_errors_do_not_raise():
+    supabase = _supabase([{"id": "c1", "external_id": "120210001", "name": "A"}])
+    with patch("services.attribution.get_supabase", return_value=supabase):
+        assert resolve_creative_id(CLIENT, "120210001") == "c1"
+        attribution._loaded_at[CLIENT] -= attribution.MAP_TTL
+        supabase.table.side_effect = Exception("connection reset")
+        assert resolve_creative_id(CLIENT, "120210001") is None
@@ -0,0 +1,45 @@
+
+from services.creative_metrics import aggregate_creative_metrics
+
+
+def test_aggregate_creative_metrics_totals_and_ratios():
+    rows = [
+        {"utm_content": "ad-a", "total_clicks": 100, "step_1": 50, "step_2": 25, "step_3": 20, "completed": 10, "converted": 5},
+        {"utm_content": "ad-b", "total_clicks": 100, "step_1": 30, "step_2": 15, "step_3": 10, "completed": 10, "converted": 0},
+    ]
+
+    summary = aggregate_creative_metrics(rows)
+
+    assert summary["totals"] == {
+        "total_clicks": 200, "step_1": 80, "step_2": 40, "step_3": 30, "completed": 20, "converted": 5
+    }
+
+    ad_a = summary["creatives"][0]
+    assert ad_a["utm_content"] == "ad-a"
+    assert ad_a["retention_1"] == 0.5
+    assert ad_a["retention_2"] == 0.5
+    assert ad_a["retention_3"] == 0.8
+    assert ad_a["final_conversion"] == 0.1
+    assert ad_a["sales_rate"] == 0.5
+
+    assert summary["drop_rates"] == {
+        "step_1_drop_rate": 0.6,
+        "step_2_drop_rate": 0.5,
+        "step_3_drop_rate": 0.25,
+    }
+
+
+def test_aggregate_creative_metrics_handles_zeros_and_nulls():
+    rows = [{"utm_content": "ad-a", "total_clicks": None, "step_1": 0}]
+
+    summary = aggregate_creative_metrics(rows)
+
+    assert summary["totals"]["total_clicks"] == 0
+    assert summary["creatives"][0]["retention_1"] == 0.0
+    assert summary["drop_rates"]["step_1_drop_rate"] == 0.0
+
+
+def test_aggregate_creative_metrics_empty():
+    summary = aggregate_creative_metrics([])
+    assert summary["creatives"] == []
+    assert summary["totals"]["completed"] == 0
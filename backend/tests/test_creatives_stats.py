@@ -0,0 +1,53 @@
+from routes.creatives import aggregate_lead_stats
+
+
+def test_aggregate_prefers_creative_id_over_utm():
+    creatives = [
+        {'id': 'c1', 'external_id': 'ad-1'},
+        {'id': 'c2', 'external_id': 'ad-2'},
+        {'id': 'c3', 'external_id': 'ad-3'},
+    ]
+    leads = [
+        {'creative_id': 'c1', 'utm_content': 'ad-1', 'internal_score': 80},
+        {'creative_id': 'c1', 'utm_content': None, 'internal_score': 41},
+        {'creative_id': None, 'utm_content': 'ad-1', 'internal_score': 0},
+        {'creative_id': None, 'utm_content': 'ad-2', 'internal_score': 50},
+        {'creative_id': None, 'utm_content': 'ad-2', 'internal_score': None},
+    ]
+
+    stats = aggregate_lead_stats(creatives, leads)
+
+    assert stats['c1'] == {'leads_generated': 2, 'avg_score': 60}
+    assert stats['c2'] == {'leads_generated': 2, 'avg_score': 50}
+    assert 'c3' not in stats
+
+
+class CountingDict(dict):
+    """Conta as leituras de campos para medir o trabalho sem depender do relógio."""
+    reads = 0
+
+    def get(self, key, default=None):
+        CountingDict.reads += 1
+        return super().get(key, default)
+
+    def __getitem__(self, key):
+        CountingDict.reads += 1
+        return super().__getitem__(key)
+
+
+def test_aggregate_scales_linearly_with_thousands_of_creatives():
+    n_creatives, n_leads = 5000, 100000
+    creatives = [CountingDict(id=f'c{i}', external_id=f'ad-{i}') for i in range(n_creatives)]
+    leads = [
+        CountingDict(creative_id=None, utm_content=f'ad-{i % n_creatives}', internal_score=i % 100)
+        for i in range(n_leads)
+    ]
+
+    CountingDict.reads = 0
+    stats = aggregate_lead_stats(creatives, leads)
+
+    assert len(stats) == n_creatives
+    assert all(s['leads_generated'] == n_leads // n_creatives for s in stats.values())
+    # A versão anterior lia os leads uma vez por criativo (5000 x 100000 leituras);
+    # agora cada lead e cada criativo é lido um número constante de vezes
+    assert CountingDict.reads <= 5 * (n_creatives + n_leads)
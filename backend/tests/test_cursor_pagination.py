@@ -0,0 +1,113 @@
+from unittest.mock import patch, MagicMock
+
+import base64
+import pytest
+from fastapi import HTTPException
+
+from routes import logs
+from routes.leads import get_lead_details
+from services import log_retention
+from utils.cursor import encode_cursor, decode_cursor
+
+CLIENT = {"client_id": "6f1c2a9e-3b7d-4c55-9a1e-2d8f0b7c4e11"}
+LOG_ID = "0b8e5c1a-7d2f-4e9b-a3c6-5f1d2e8a9b70"
+
+
+def _raw_cursor(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2026-03-01T12:30:00.12345+00:00", LOG_ID)
+    assert decode_cursor(cursor) == ("2026-03-01T12:30:00.123450+00:00", LOG_ID)
+
+
+@pytest.mark.parametrize("cursor", [
+    "não-é-base64!",
+    _raw_cursor("2026-03-01T12:30:00+00:00"),
+    _raw_cursor('2026-03-01",id.gt.0|' + LOG_ID),
+    _raw_cursor("2026-03-01T12:30:00+00:00|1),or(client_id.neq.x"),
+])
+def test_tampered_cursor_is_rejected_with_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def _logs_supabase(rows):
+    supabase = MagicMock()
+    query = supabase.table.return_value.select.return_value.eq.return_value.order.return_value.order.return_value
+    query.or_.return_value = query
+    query.limit.return_value.execute.return_value.data = rows
+    return supabase, query
+
+
+def test_logs_paging_returns_next_cursor_and_applies_it():
+    rows = [{"id": LOG_ID, "created_at": "2026-03-01T12:00:00+00:00"},
+            {"id": "1c2d3e4f-5a6b-4c7d-8e9f-0a1b2c3d4e5f", "created_at": "2026-03-01T11:00:00+00:00"}]
+    supabase, query = _logs_supabase(rows)
+    with patch("routes.logs.get_supabase", return_value=supabase):
+        page = logs.list_logs(cursor=None, limit=1, source=None, level=None, lead_id=None, user_profile=CLIENT)
+    assert page["data"] == rows[:1]
+    assert decode_cursor(page["next_cursor"]) == ("2026-03-01T12:00:00+00:00", LOG_ID)
+    query.limit.assert_called_with(2)
+
+    supabase, query = _logs_supabase(rows[1:])
+    with patch("routes.logs.get_supabase", return_value=supabase):
+        page = logs.list_logs(cursor=page["next_cursor"], limit=1, source=None, level=None, lead_id=None,
+                              user_profile=CLIENT)
+    assert page["next_cursor"] is None
+    query.or_.assert_called_once_with(
+        f'created_at.lt."2026-03-01T12:00:00+00:00",and(created_at.eq."2026-03-01T12:00:00+00:00",id.lt.{LOG_ID})'
+    )
+
+
+def test_logs_with_tampered_cursor_never_reach_the_database():
+    supabase, query = _logs_supabase([])
+    with patch("routes.logs.get_supabase", return_value=supabase), pytest.raises(HTTPException) as exc:
+        logs.list_logs(cursor=_raw_cursor("x|y"), limit=10, source=None, level=None, lead_id=None,
+                       user_profile=CLIENT)
+    assert exc.value.status_code == 400
+    query.or_.assert_not_called()
+
+
+def test_lead_timeline_cursor_is_passed_parsed_to_rpc():
+    timeline = [{"id": LOG_ID, "created_at": "2026-03-01T12:00:00+00:00"},
+                {"id": "1c2d3e4f-5a6b-4c7d-8e9f-0a1b2c3d4e5f", "created_at": "2026-03-01T11:00:00+00:00"}]
+    supabase = MagicMock()
+    supabase.rpc.return_value.execute.return_value.data = {"lead": {"id": "lead-1"}, "responses": [], "timeline": timeline}
+    with patch("routes.leads.get_supabase", return_value=supabase):
+        page = get_lead_details("lead-1", limit=1, cursor=encode_cursor("2026-03-02T00:00:00Z", LOG_ID),
+                                user_profile=CLIENT)
+
+    params = supabase.rpc.call_args[0][1]
+    assert params["p_before"] == "2026-03-02T00:00:00+00:00" and params["p_before_id"] == LOG_ID
+    assert page["timeline"] == timeline[:1]
+    assert decode_cursor(page["next_cursor"]) == ("2026-03-01T12:00:00+00:00", LOG_ID)
+
+
+def test_log_retention_drains_in_batches_until_short_round():
+    supabase = MagicMock()
+    affected = {"strip_log_metadata": [log_retention.RETENTION_BATCH, 7], "archive_old_logs": [0]}
+
+    def rpc(name, params):
+        result = MagicMock()
+        result.execute.return_value.data = affected[name].pop(0)
+        return result
+
+    supabase.rpc.side_effect = rpc
+    with patch("services.log_retention.get_supabase", return_value=supabase):
+        result = log_retention.run_log_retention()
+
+    assert result == {"stripped": log_retention.RETENTION_BATCH + 7, "archived": 0}
+    assert supabase.rpc.call_args_list[0][0] == (
+        "strip_log_metadata", {"p_days": log_retention.STRIP_BODIES_DAYS, "p_limit": log_retention.RETENTION_BATCH}
+    )
+    assert supabase.rpc.call_args_list[-1][0][0] == "archive_old_logs"
+
+
+def test_log_retention_never_raises():
+    supabase = MagicMock()
+    supabase.rpc.side_effect = Exception("function archive_old_logs does not exist")
+    with patch("services.log_retention.get_supabase", return_value=supabase):
+        assert log_retention.run_log_retention() == {"stripped": 0, "archived": 0}
@@ -0,0 +1,20 @@
+from routes.leads import build_kanban_board, kanban_column
+
+
+def test_kanban_column_mapping_matches_frontend():
+    assert kanban_column({'status': 'hot'}) == 'hot'
+    assert kanban_column({'status': 'cold', 'consent_given': False, 'name': 'Ana'}) == 'abandoned'
+    assert kanban_column({'status': 'cold', 'consent_given': True, 'name': 'Ana'}) == 'cold'
+    assert kanban_column({'status': 'started'}) == 'abandoned'
+    assert kanban_column({'status': 'unknown'}) == 'cold'
+
+
+def test_board_limits_each_column_but_counts_everything():
+    leads = [{'id': f'h{i}', 'status': 'hot'} for i in range(5)] + \
+            [{'id': f'w{i}', 'status': 'warm'} for i in range(2)]
+
+    board = build_kanban_board(leads, per_column=3)
+
+    assert [l['id'] for l in board['columns']['hot']] == ['h0', 'h1', 'h2']
+    assert len(board['columns']['warm']) == 2
+    assert board['counts'] == {'hot': 5, 'warm': 2}
@@ -0,0 +1,19 @@
+from routes.leads import search_filter
+
+
+def test_name_search_uses_trigram_ilike():
+    assert search_filter(" Maria Silva ") == ("name", "ilike", "%Maria Silva%")
+
+
+def test_phone_search_matches_digits_anywhere():
+    assert search_filter("(11) 98888-7") == ("phone_digits", "like", "%11988887%")
+    assert search_filter("+55 11 98888-7777") == ("phone_digits", "like", "%11988887777%")
+
+
+def test_phone_search_by_last_digits():
+    assert search_filter("7777") == ("phone_digits", "like", "%7777%")
+    assert search_filter("8888-7777") == ("phone_digits", "like", "%88887777%")
+
+
+def test_mixed_term_searches_name():
+    assert search_filter("João 2")[0] == "name"
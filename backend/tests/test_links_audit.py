@@ -8,7 +8,9 @@ sys.modules['supabase'] = MagicMock()
 
 import pytest
 from unittest.mock import patch, call
-from routes.links import create_link, LinkCreate, HTTPException
+from routes.links import create_link, create_links_bulk, LinkCreate, HTTPException
+from services import slugs
+from services.slugs import BloomFilter, SlugRegistry
 
 def test_create_link_success():
     with patch('routes.links.get_supabase') as mock_get_supabase:
@@ -82,3 +84,99 @@ def test_create_link_db_error():
         with pytest.raises(HTTPException) as exc:
             create_link(link_data, user_profile)
         assert exc.value.status_code == 500
+
+def test_create_link_retries_on_slug_collision():
+    with patch('routes.links.get_supabase') as mock_get_supabase:
+        supabase = MagicMock()
+        mock_get_supabase.return_value = supabase
+        mock_table = supabase.table.return_value
+
+        ok = MagicMock()
+        ok.execute.return_value.data = [{'id': '123'}]
+        conflict = MagicMock()
+        conflict.execute.side_effect = Exception('duplicate key value violates unique constraint "links_slug_key" (23505)')
+        mock_table.insert.side_effect = [conflict, ok]
+
+        result = create_link(LinkCreate(name="Promo", destination="http://dest.com"), {'client_id': 'client-1'})
+
+        assert result['id'] == '123'
+        assert mock_table.insert.call_count == 2
+        first_slug = mock_table.insert.call_args_list[0][0][0]['slug']
+        second_slug = mock_table.insert.call_args_list[1][0][0]['slug']
+        assert first_slug != second_slug
+        assert second_slug.startswith('promo-')
+
+def test_create_link_manual_slug_conflict():
+    with patch('routes.links.get_supabase') as mock_get_supabase:
+        supabase = MagicMock()
+        mock_get_supabase.return_value = supabase
+        supabase.table.return_value.insert.return_value.execute.side_effect = Exception('duplicate key (23505)')
+
+        with pytest.raises(HTTPException) as exc:
+            create_link(LinkCreate(name="Promo", destination="http://dest.com", slug="promo"), {'client_id': 'client-1'})
+        assert exc.value.status_code == 400
+
+def test_create_links_bulk_single_insert():
+    with patch('routes.links.get_supabase') as mock_get_supabase:
+        supabase = MagicMock()
+        mock_get_supabase.return_value = supabase
+        mock_table = supabase.table.return_value
+        mock_table.insert.return_value.execute.return_value.data = [{'id': '1'}, {'id': '2'}]
+
+        links = [
+            LinkCreate(name="Campanha A", destination="http://dest.com"),
+            LinkCreate(name="Campanha B", destination="http://dest.com"),
+            LinkCreate(name="Captura", destination="http://dest.com", funnel_type="capture"),
+        ]
+        result = create_links_bulk(links, {'client_id': 'client-1'})
+
+        mock_table.insert.assert_called_once()
+        rows = mock_table.insert.call_args[0][0]
+        assert len(rows) == 2
+        assert len({r['slug'] for r in rows}) == 2
+        assert len(result['created']) == 2
+        assert result['errors'][0]['index'] == 2
+
+def test_bloom_filter_membership():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"slug-{i}")
+
+    assert all(f"slug-{i}" in bloom for i in range(1000))
+    false_positives = sum(1 for i in range(1000, 11000) if f"slug-{i}" in bloom)
+    assert false_positives < 300
+
+
+def test_slug_registry_loads_in_background_by_id():
+    all_rows = [{"id": f"{i:04d}", "slug": f"slug-{i}"} for i in range(5)]
+    calls = []
+
+    class Query:
+        def __init__(self):
+            self.after = None
+            self.size = None
+
+        def select(self, *a): return self
+        def order(self, col):
+            calls.append(("order", col))
+            return self
+        def limit(self, n):
+            self.size = n
+            return self
+        def gt(self, col, value):
+            self.after = value
+            return self
+        def execute(self):
+            rows = [r for r in all_rows if self.after is None or r["id"] > self.after][:self.size]
+            return MagicMock(data=rows)
+
+    supabase = MagicMock()
+    supabase.table.side_effect = lambda name: Query()
+    registry = SlugRegistry()
+    with patch.object(slugs, "LOAD_PAGE_SIZE", 2):
+        registry.ensure_loading(supabase)
+        registry.ensure_loading(supabase)
+        assert registry.wait_loaded(timeout=2)
+
+    assert all(registry.probably_exists(f"slug-{i}") for i in range(5))
+    assert calls == [("order", "id")] * 3
@@ -0,0 +1,130 @@
+import json
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from services.logger import LogPipeline, log_system_event, log_pipeline
+
+
+def _event(level="info", source="webhook", message="ok"):
+    return {"client_id": "client-1", "level": level, "source": source, "message": message,
+            "created_at": "2026-01-01T00:00:00", "metadata": {}, "lead_id": None}
+
+
+def test_flush_writes_multi_row_batches(tmp_path):
+    pipeline = LogPipeline(batch_size=2, spill_path=str(tmp_path / "spill.jsonl"), sample_rates={})
+    for i in range(5):
+        pipeline.enqueue(_event(message=str(i)))
+
+    with patch("services.logger.get_supabase") as mock_get_supabase:
+        supabase = MagicMock()
+        mock_get_supabase.return_value = supabase
+
+        assert pipeline.flush() == 5
+
+    inserts = supabase.table.return_value.insert.call_args_list
+    assert [len(c[0][0]) for c in inserts] == [2, 2, 1]
+    assert pipeline.stats()["written"] == 5
+    assert pipeline.stats()["buffered"] == 0
+
+
+def test_failed_batches_spill_and_replay(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    pipeline = LogPipeline(batch_size=10, spill_path=str(spill), sample_rates={})
+    pipeline.enqueue(_event(message="a"))
+    pipeline.enqueue(_event(message="b"))
+
+    with patch("services.logger.get_supabase") as mock_get_supabase:
+        mock_get_supabase.return_value.table.return_value.insert.return_value.execute.side_effect = Exception("down")
+        assert pipeline.flush() == 0
+
+    assert [json.loads(l)["message"] for l in spill.read_text().splitlines()] == ["a", "b"]
+    assert pipeline.stats()["spilled"] == 2
+
+    pipeline.enqueue(_event(message="c"))
+    with patch("services.logger.get_supabase") as mock_get_supabase:
+        supabase = MagicMock()
+        mock_get_supabase.return_value = supabase
+        pipeline.flush()
+
+    assert not spill.exists()
+    assert pipeline.stats()["replayed"] == 2
+    replayed = supabase.table.return_value.insert.call_args_list[-1][0][0]
+    assert [e["message"] for e in replayed] == ["a", "b"]
+
+
+class RowError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def test_bad_row_is_isolated_and_dropped_without_spilling(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    pipeline = LogPipeline(batch_size=8, spill_path=str(spill), sample_rates={})
+    for i in range(8):
+        pipeline.enqueue(_event(message="bad" if i == 5 else str(i)))
+    inserted = []
+
+    def insert(rows):
+        result = MagicMock()
+        if any(r["message"] == "bad" for r in rows):
+            result.execute.side_effect = RowError('insert or update on table "logs" violates foreign key constraint', "23503")
+        else:
+            result.execute.side_effect = lambda: inserted.extend(rows)
+        return result
+
+    with patch("services.logger.get_supabase") as mock_get_supabase:
+        mock_get_supabase.return_value.table.return_value.insert.side_effect = insert
+        assert pipeline.flush() == 7
+
+    assert sorted(e["message"] for e in inserted) == [str(i) for i in range(8) if i != 5]
+    assert pipeline.stats()["dropped_invalid"] == 1
+    assert pipeline.stats()["failed_batches"] == 0
+    assert not spill.exists()
+
+
+def test_workers_sharing_spill_file_replay_it_once(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    workers = [LogPipeline(batch_size=10, spill_path=str(spill), sample_rates={}) for _ in range(2)]
+    workers[0]._spill([_event(message="a")])
+    workers[1]._spill([_event(message="b")])
+
+    with patch("services.logger.get_supabase") as mock_get_supabase:
+        supabase = MagicMock()
+        mock_get_supabase.return_value = supabase
+        for worker in workers:
+            worker._replay_spill()
+
+    inserts = [c[0][0] for c in supabase.table.return_value.insert.call_args_list]
+    assert [[e["message"] for e in batch] for batch in inserts] == [["a", "b"]]
+    assert workers[0].stats()["replayed"] == 2 and workers[1].stats()["replayed"] == 0
+    assert not spill.exists()
+
+
+def test_buffer_is_bounded_and_counts_drops(tmp_path):
+    pipeline = LogPipeline(max_buffer=3, spill_path=str(tmp_path / "spill.jsonl"), sample_rates={})
+    results = [pipeline.enqueue(_event()) for _ in range(5)]
+
+    assert results == [True, True, True, False, False]
+    assert pipeline.stats()["dropped_full"] == 2
+
+
+def test_info_sampling_keeps_errors(tmp_path):
+    pipeline = LogPipeline(spill_path=str(tmp_path / "spill.jsonl"), sample_rates={"brasil_api": 0.0})
+
+    assert pipeline.enqueue(_event(level="info", source="brasil_api")) is False
+    assert pipeline.enqueue(_event(level="error", source="brasil_api")) is True
+    assert pipeline.enqueue(_event(level="info", source="webhook")) is True
+    assert pipeline.stats()["sampled_out"] == 1
+
+
+@pytest.mark.asyncio
+async def test_log_system_event_only_enqueues():
+    before = log_pipeline.stats()["enqueued"]
+    with patch("services.logger.get_supabase") as mock_get_supabase:
+        await log_system_event("client-1", "error", "webhook", "falhou", lead_id="lead-1")
+        mock_get_supabase.assert_not_called()
+        await log_pipeline.stop()
+
+    assert log_pipeline.stats()["enqueued"] == before + 1
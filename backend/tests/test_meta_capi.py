@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from services.meta_capi import CapiSender
+
+
+class FakeHttp:
+    """Substitui httpx.AsyncClient (outros testes trocam o módulo httpx por um mock)."""
+
+    def __init__(self, statuses, requests):
+        self.statuses = statuses
+        self.requests = requests
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def post(self, url, params=None, json=None):
+        self.requests.append({"url": url, "json": json})
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return SimpleNamespace(status_code=status, text="")
+
+
+def _leads(n, start=0):
+    return [{"id": f"lead-{i}", "phone": f"1199999{i:04d}"} for i in range(start, start + n)]
+
+
+async def _flush(sender, statuses):
+    requests = []
+    fake_httpx = SimpleNamespace(AsyncClient=lambda **kw: FakeHttp(list(statuses), requests))
+    with patch("services.meta_capi.httpx", fake_httpx):
+        await sender.flush()
+    return requests
+
+
+@pytest.mark.asyncio
+async def test_conversions_coalesce_into_one_post_per_pixel():
+    sender = CapiSender(retry_base=0)
+    with patch("services.meta_capi._load_pixel", return_value=("px-1", "token")) as load:
+        await sender.enqueue(_leads(3), "client-1")
+        await sender.enqueue(_leads(2, start=3), "client-1")
+    requests = await _flush(sender, [200])
+
+    assert load.call_count == 1
+    assert len(requests) == 1
+    assert len(requests[0]["json"]["data"]) == 5
+    assert sender.stats()["batch_size"]["max"] == 5
+
+
+@pytest.mark.asyncio
+async def test_duplicate_event_ids_are_dropped():
+    sender = CapiSender(retry_base=0)
+    with patch("services.meta_capi._load_pixel", return_value=("px-1", "token")):
+        await sender.enqueue(_leads(2), "client-1")
+        await sender.enqueue(_leads(1), "client-1")
+        await _flush(sender, [200])
+        await sender.enqueue(_leads(1), "client-1")
+
+    assert sender.stats()["deduplicated"] == 2
+    assert sender.stats()["buffered"] == 0
+
+
+@pytest.mark.asyncio
+async def test_server_errors_retry_with_backoff():
+    sender = CapiSender(retry_base=0, max_attempts=3)
+    with patch("services.meta_capi._load_pixel", return_value=("px-1", "token")):
+        await sender.enqueue(_leads(1), "client-1")
+    requests = await _flush(sender, [500, 200])
+
+    assert len(requests) == 2
+    assert sender.stats()["retries"] == 1
+    assert sender.stats()["events_sent"] == 1
+
+
+@pytest.mark.asyncio
+async def test_clients_without_pixel_are_cached():
+    sender = CapiSender()
+    with patch("services.meta_capi._load_pixel", return_value=None) as load:
+        await sender.enqueue(_leads(1), "client-1")
+        await sender.enqueue(_leads(1), "client-1")
+
+    assert load.call_count == 1
+    assert sender.stats()["no_pixel"] == 2
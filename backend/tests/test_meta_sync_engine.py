@@ -0,0 +1,269 @@
+import asyncio
+import importlib
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# test_meta_sync substitui httpx em sys.modules por um mock; carrega o módulo real aqui
+_mocked = sys.modules.pop('httpx', None)
+httpx = importlib.import_module('httpx')
+if _mocked is not None:
+    sys.modules['httpx'] = _mocked
+
+from services import meta_sync
+from services.meta_sync import GraphClient, parse_usage
+
+
+class FakeGraph:
+    """
+    Graph API local (httpx.MockTransport): contas, campanhas e anúncios paginados com
+    cursor after, cabeçalhos de uso configuráveis e contagem de requisições simultâneas.
+    """
+
+    def __init__(self, n_campaigns=5, ads_per_campaign=3, page_size=2, usage=None, latency=0.01):
+        self.campaigns = [{'id': f'camp-{i}', 'name': f'Campanha {i}', 'status': 'ACTIVE'} for i in range(n_campaigns)]
+        self.ads = [
+            {'id': f'ad-{i}-{j}', 'name': f'Anúncio {i}.{j}', 'campaign_id': f'camp-{i}',
+             'creative': {'thumbnail_url': 't', 'title': 'h'},
+             'insights': {'data': [{'spend': '1.5', 'clicks': '10', 'impressions': '100', 'ctr': '0.1'}]}}
+            for i in range(n_campaigns) for j in range(ads_per_campaign)
+        ]
+        # updated_time (unix) de cada objeto e anúncios com entrega recente (edge /insights)
+        self.updated = {obj['id']: 0 for obj in self.campaigns + self.ads}
+        self.delivered = []
+        self.failing = set()   # anúncios cujo insights falha dentro do batch
+        self.page_size = page_size
+        self.usage = usage
+        self.latency = latency
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _page(self, url, items):
+        query = parse_qs(urlparse(str(url)).query)
+        start = int(query.get('after', ['0'])[0])
+        body = {'data': items[start:start + self.page_size]}
+        if start + self.page_size < len(items):
+            base = str(url).split('?')[0]
+            body['paging'] = {'next': f"{base}?access_token=tok&after={start + self.page_size}"}
+        return body
+
+    def _changed(self, url, items):
+        filtering = parse_qs(urlparse(str(url)).query).get('filtering')
+        if not filtering:
+            return items
+        since = json.loads(filtering[0])[0]['value']
+        return [obj for obj in items if self.updated[obj['id']] > since]
+
+    def _batch(self, request):
+        items = json.loads(parse_qs(request.content.decode())['batch'][0])
+        responses = []
+        for item in items:
+            ad_id = item['relative_url'].split('/')[0]
+            if ad_id in self.failing:
+                responses.append({'code': 400, 'body': json.dumps({'error': {'code': 613}})})
+                continue
+            data = [{'spend': '2.5', 'clicks': '20', 'impressions': '200', 'ctr': '0.1'}]
+            responses.append({'code': 200, 'body': json.dumps({'data': data if ad_id in self.delivered else []})})
+        return responses
+
+    async def handler(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            self.requests.append(str(request.url))
+            path = request.url.path
+            headers = {'x-business-use-case-usage': json.dumps(self.usage)} if self.usage else {}
+            if request.method == 'POST' and path.endswith('/v19.0/'):
+                body = self._batch(request)
+            elif path.endswith('/me/adaccounts'):
+                body = self._page(request.url, [{'id': 'act_1', 'name': 'Conta'}])
+            elif path.endswith('/campaigns'):
+                body = self._page(request.url, self._changed(request.url, self.campaigns))
+            elif path.endswith('/ads'):
+                body = self._page(request.url, self._changed(request.url, self.ads))
+            elif path.endswith('/act_1/insights'):
+                body = self._page(request.url, [{'ad_id': ad_id} for ad_id in self.delivered])
+            else:
+                return httpx.Response(404, json={'error': {'code': 100}})
+            return httpx.Response(200, json=body, headers=headers)
+        finally:
+            self.in_flight -= 1
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+def _supabase(sync_state=None):
+    supabase = MagicMock()
+    tables = {}
+
+    def table(name):
+        if name not in tables:
+            builder = MagicMock()
+            if name == 'ad_accounts':
+                builder.select.return_value.eq.return_value.eq.return_value.execute.return_value.data = [
+                    {'id': 'acc-uuid', 'access_token': 'enc'}
+                ]
+            if name == 'campaigns':
+                def upsert(rows, on_conflict=None):
+                    result = MagicMock()
+                    result.execute.return_value.data = [{'id': f"uuid-{r['external_id']}", 'external_id': r['external_id']} for r in rows]
+                    return result
+                builder.upsert.side_effect = upsert
+                builder.select.return_value.in_.return_value.execute.return_value.data = [
+                    {'id': 'uuid-camp-0', 'external_id': 'camp-0'}
+                ]
+            if name == 'meta_sync_state':
+                builder.select.return_value.eq.return_value.execute.return_value.data = sync_state or []
+            tables[name] = builder
+        return tables[name]
+
+    supabase.table.side_effect = table
+    return supabase, tables
+
+
+async def _sync(graph, sync_state=None):
+    supabase, tables = _supabase(sync_state)
+    with patch.object(meta_sync, 'decrypt_aes256', return_value='tok'), \
+         patch.object(meta_sync, 'refresh_creative_map'), \
+         patch.object(meta_sync, 'backfill_lead_attribution'), \
+         patch.object(meta_sync, 'invalidate_client_cache'):
+        async with graph.client() as http:
+            summary = await meta_sync.sync_meta_account('client-1', supabase=supabase, http=http)
+    tables['rpc'] = supabase.rpc
+    return summary, tables
+
+
+@pytest.mark.asyncio
+async def test_sync_follows_paging_and_bulk_upserts():
+    graph = FakeGraph(n_campaigns=5, ads_per_campaign=3, page_size=2)
+    summary, tables = await _sync(graph)
+
+    assert summary['campaigns'] == 5
+    assert summary['creatives'] == 15
+    # 1 conta + 3 páginas de campanhas + 8 páginas de anúncios
+    assert summary['requests'] == 12
+
+    # Um upsert em lote por tabela (abaixo de UPSERT_BATCH)
+    assert tables['campaigns'].upsert.call_count == 1
+    creatives_upsert = tables['creatives'].upsert.call_args_list
+    assert len(creatives_upsert) == 1
+    rows = creatives_upsert[0][0][0]
+    assert {r['campaign_id'] for r in rows} == {f'uuid-camp-{i}' for i in range(5)}
+
+
+@pytest.mark.asyncio
+async def test_sync_refreshes_attribution_map_after_upserting_creatives():
+    supabase, tables = _supabase()
+    calls = []
+    with patch.object(meta_sync, 'decrypt_aes256', return_value='tok'), \
+         patch.object(meta_sync, 'refresh_creative_map',
+                      side_effect=lambda *a: calls.append(('refresh', tables['creatives'].upsert.called))), \
+         patch.object(meta_sync, 'backfill_lead_attribution', side_effect=lambda *a: calls.append(('backfill',))), \
+         patch.object(meta_sync, 'invalidate_client_cache'):
+        async with FakeGraph(n_campaigns=1, ads_per_campaign=2).client() as http:
+            await meta_sync.sync_meta_account('client-1', supabase=supabase, http=http)
+
+    assert calls == [('refresh', True), ('backfill',)]
+
+
+@pytest.mark.asyncio
+async def test_full_sync_records_watermark():
+    summary, tables = await _sync(FakeGraph(n_campaigns=2, ads_per_campaign=2))
+
+    assert summary['incremental'] == 0
+    state = tables['meta_sync_state'].upsert.call_args[0][0]
+    assert state['account_id'] == 'act_1'
+    assert state['synced_until'] == state['last_full_sync_at']
+
+
+@pytest.mark.asyncio
+async def test_incremental_sync_fetches_only_changes_in_batches():
+    graph = FakeGraph(n_campaigns=5, ads_per_campaign=3, page_size=2)
+    recent = datetime.now(timezone.utc) - timedelta(hours=1)
+    # Só um anúncio mudou; outros dois tiveram entrega (só métricas)
+    graph.updated['ad-0-1'] = int(recent.timestamp()) + 60
+    graph.delivered = ['ad-0-1', 'ad-3-0', 'ad-4-2']
+    sync_state = [{'account_id': 'act_1', 'synced_until': recent.isoformat(),
+                   'last_full_sync_at': (recent - timedelta(days=1)).isoformat()}]
+
+    summary, tables = await _sync(graph, sync_state)
+
+    assert summary['incremental'] == 1
+    assert summary['campaigns'] == 0
+    assert summary['creatives'] == 1
+    assert summary['metrics_updated'] == 3
+    # 1 conta + campanhas + anúncios + 2 páginas de insights da conta + 1 batch request com as 3 métricas
+    assert summary['requests'] == 6
+    batches = [r for r in graph.requests if urlparse(r).path.endswith('/v19.0/')]
+    assert len(batches) == 1
+
+    rows = tables['creatives'].upsert.call_args[0][0]
+    assert [(r['external_id'], r['campaign_id'], r['spend_cents']) for r in rows] == [('ad-0-1', 'uuid-camp-0', 250)]
+    rpc_rows = tables['rpc'].call_args[0][1]['p_rows']
+    assert {r['external_id'] for r in rpc_rows} == {'ad-3-0', 'ad-4-2'}
+
+    state = tables['meta_sync_state'].upsert.call_args[0][0]
+    assert state['last_full_sync_at'] == sync_state[0]['last_full_sync_at']
+
+
+@pytest.mark.asyncio
+async def test_failed_insights_are_not_zeroed_and_hold_the_watermark():
+    graph = FakeGraph(n_campaigns=5, ads_per_campaign=3, page_size=2)
+    recent = datetime.now(timezone.utc) - timedelta(hours=1)
+    graph.updated['ad-0-1'] = int(recent.timestamp()) + 60
+    graph.delivered = ['ad-0-1', 'ad-3-0', 'ad-4-2']
+    graph.failing = {'ad-0-1', 'ad-3-0'}
+    sync_state = [{'account_id': 'act_1', 'synced_until': recent.isoformat(),
+                   'last_full_sync_at': (recent - timedelta(days=1)).isoformat()}]
+
+    summary, tables = await _sync(graph, sync_state)
+
+    assert summary['insights_failed'] == 2
+    assert summary['creatives'] == 0
+    # Uma nova tentativa só com os que falharam
+    batches = [r for r in graph.requests if urlparse(r).path.endswith('/v19.0/')]
+    assert len(batches) == 2
+    assert 'creatives' not in tables
+    rpc_rows = tables['rpc'].call_args[0][1]['p_rows']
+    assert [r['external_id'] for r in rpc_rows] == ['ad-4-2']
+
+    state = tables['meta_sync_state'].upsert.call_args[0][0]
+    assert state['synced_until'] == recent.isoformat()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    graph = FakeGraph(n_campaigns=40, ads_per_campaign=1, page_size=5)
+    async with graph.client() as http:
+        client = GraphClient(http, 'tok', concurrency=2, base_url='https://graph.test/v19.0')
+        await asyncio.gather(*(client.get('act_1/campaigns') for _ in range(10)))
+
+    assert graph.max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_high_usage_headers_throttle_the_client():
+    usage = {'123': [{'type': 'ads_management', 'call_count': 96, 'total_cputime': 10, 'total_time': 10,
+                      'estimated_time_to_regain_access': 0}]}
+    graph = FakeGraph(usage=usage)
+    async with graph.client() as http:
+        client = GraphClient(http, 'tok', base_url='https://graph.test/v19.0', pause_seconds=0.01)
+        await client.get('act_1/campaigns')
+
+    assert client.stats['throttled'] == 1
+    assert client.stats['max_usage_pct'] == 96
+
+
+def test_parse_usage_reads_regain_time():
+    headers = {'x-business-use-case-usage': json.dumps(
+        {'1': [{'call_count': 100, 'total_cputime': 20, 'total_time': 30, 'estimated_time_to_regain_access': 2}]}
+    )}
+    assert parse_usage(headers) == (100.0, 120.0)
+    assert parse_usage({}) == (0.0, 0.0)
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from services.meta_sync_scheduler import MetaSyncScheduler
+
+
+class FakeSchedule:
+    """claim_meta_syncs/finish_meta_sync sobre uma fila em memória."""
+
+    def __init__(self, client_ids):
+        self.due = list(client_ids)
+        self.finished = {}
+
+    def rpc(self, name, params):
+        result = MagicMock()
+        if name == "claim_meta_syncs":
+            claimed, self.due = self.due[:params["p_limit"]], self.due[params["p_limit"]:]
+            result.execute.return_value.data = [{"client_id": cid} for cid in claimed]
+        elif name == "finish_meta_sync":
+            self.finished[params["p_client_id"]] = params
+        return result
+
+
+def _tracking_sync(delay=0.01):
+    state = {"in_flight": 0, "max_in_flight": 0, "calls": []}
+
+    async def sync(client_id):
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        state["calls"].append(client_id)
+        await asyncio.sleep(delay)
+        state["in_flight"] -= 1
+        if client_id == "client-bad":
+            raise RuntimeError("token expirado")
+        if client_id == "client-partial":
+            # Erro tratado dentro do sync_meta_account: volta no resumo
+            return {"accounts": 2, "errors": 1, "last_error": "Error validating access token"}
+        return {"accounts": 1}
+
+    return sync, state
+
+
+@pytest.mark.asyncio
+async def test_due_clients_run_concurrently_up_to_limit():
+    schedule = FakeSchedule([f"client-{i}" for i in range(5)] + ["client-partial", "client-bad"])
+    supabase = MagicMock()
+    supabase.rpc.side_effect = schedule.rpc
+    sync, state = _tracking_sync()
+    scheduler = MetaSyncScheduler(sync=sync, concurrency=3, interval=timedelta(hours=4), worker_id="w1")
+
+    with patch("services.meta_sync_scheduler.get_supabase", return_value=supabase):
+        before = datetime.now(timezone.utc)
+        assert await scheduler.run_due() == 7
+
+    assert state["max_in_flight"] == 3
+    assert len(schedule.finished) == 7
+    ok = schedule.finished["client-0"]
+    assert ok["p_status"] == "ok" and ok["p_worker"] == "w1"
+    next_run = datetime.fromisoformat(ok["p_next_run_at"])
+    # Intervalo com jitter de ±10%
+    assert before + timedelta(hours=3.6) <= next_run <= datetime.now(timezone.utc) + timedelta(hours=4.4)
+    bad = schedule.finished["client-bad"]
+    assert bad["p_status"] == "error" and "token expirado" in bad["p_error"]
+    assert datetime.fromisoformat(bad["p_next_run_at"]) <= datetime.now(timezone.utc) + timedelta(minutes=30)
+    partial = schedule.finished["client-partial"]
+    assert partial["p_status"] == "error" and "access token" in partial["p_error"]
+    assert datetime.fromisoformat(partial["p_next_run_at"]) <= datetime.now(timezone.utc) + timedelta(minutes=30)
+    assert scheduler.counters["failed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_local_fallback_spreads_and_does_not_rerun():
+    supabase = MagicMock()
+    supabase.rpc.side_effect = Exception("function claim_meta_syncs does not exist")
+    supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+        {"client_id": "client-1"}, {"client_id": "client-2"}
+    ]
+    sync, state = _tracking_sync(delay=0)
+    scheduler = MetaSyncScheduler(sync=sync, concurrency=2, interval=timedelta(hours=4), worker_id="w1")
+
+    with patch("services.meta_sync_scheduler.get_supabase", return_value=supabase):
+        # Primeira passada só agenda (horários espalhados pelo intervalo)
+        assert await scheduler.run_due() == 0
+        scheduler._local_next["client-1"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+        assert await scheduler.run_due() == 1
+        assert await scheduler.run_due() == 0
+
+    assert state["calls"] == ["client-1"]
+    assert scheduler._local_next["client-1"] > datetime.now(timezone.utc) + timedelta(hours=3)
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+from services import form_config
+from routes.forms import get_public_form_config
+
+CLIENT_ID = "6f1c2a9e-3b7d-4c55-9a1e-2d8f0b7c4e11"
+
+
+def _request(headers=None):
+    return SimpleNamespace(headers=headers or {})
+
+
+def _supabase(stored=None):
+    supabase = MagicMock()
+    tables = {}
+
+    def table(name):
+        if name not in tables:
+            builder = MagicMock()
+            if name == "clients":
+                builder.select.return_value.eq.return_value.maybe_single.return_value.execute.return_value.data = {
+                    "id": CLIENT_ID, "name": "Loja", "active": True, "plan": "pro",
+                    "brand_logo_url": None, "brand_primary_color": "#000",
+                }
+            if name == "client_form_config":
+                builder.select.return_value.eq.return_value.eq.return_value.order.return_value.execute.return_value.data = [{
+                    "label_custom": None, "required": True, "order_position": 1,
+                    "form_fields": {"id": "f1", "field_key": "phone", "type": "phone", "label_default": "Telefone", "options": None},
+                }]
+            if name == "public_form_configs":
+                builder.select.return_value.eq.return_value.execute.return_value.data = stored or []
+            tables[name] = builder
+        return tables[name]
+
+    supabase.table.side_effect = table
+    return supabase, tables
+
+
+def setup_function():
+    form_config._blobs.clear()
+
+
+def test_first_load_builds_and_stores_blob_then_serves_from_memory():
+    supabase, tables = _supabase()
+    with patch("services.form_config.get_supabase", return_value=supabase):
+        first = get_public_form_config(CLIENT_ID, _request())
+        second = get_public_form_config(CLIENT_ID, _request())
+
+    assert first.status_code == 200
+    assert b'"label":"Telefone"' in first.body
+    assert first.headers["etag"] == second.headers["etag"]
+    assert first.headers["cache-control"].startswith("public, max-age=")
+    # Renderizado e gravado uma vez; o segundo acesso não faz I/O
+    assert tables["public_form_configs"].upsert.call_count == 1
+    assert tables["client_form_config"].select.call_count == 1
+
+
+def test_stored_blob_skips_render_and_matching_etag_returns_304():
+    stored = [{"payload": {"client_name": "Loja", "fields": []}, "etag": '"abc"'}]
+    supabase, tables = _supabase(stored)
+    with patch("services.form_config.get_supabase", return_value=supabase):
+        response = get_public_form_config(CLIENT_ID, _request({"if-none-match": '"abc"'}))
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"abc"'
+    assert "clients" not in tables
+
+
+def test_rebuild_replaces_cached_blob_and_inactive_client_is_404():
+    supabase, tables = _supabase()
+    with patch("services.form_config.get_supabase", return_value=supabase):
+        old = get_public_form_config(CLIENT_ID, _request()).headers["etag"]
+
+        tables["client_form_config"].select.return_value.eq.return_value.eq.return_value.order.return_value.execute.return_value.data = []
+        form_config.rebuild_public_form_config(CLIENT_ID, supabase)
+        assert get_public_form_config(CLIENT_ID, _request()).headers["etag"] != old
+
+        tables["clients"].select.return_value.eq.return_value.maybe_single.return_value.execute.return_value.data = {"active": False}
+        form_config.rebuild_public_form_config(CLIENT_ID, supabase)
+        with pytest.raises(HTTPException) as exc:
+            get_public_form_config(CLIENT_ID, _request())
+
+    assert exc.value.status_code == 404
+    tables["public_form_configs"].delete.assert_called_once()
+
+
+def test_invalid_and_unknown_ids_are_404_without_writes():
+    supabase, tables = _supabase()
+    tables_clients = supabase.table("clients")
+    tables_clients.select.return_value.eq.return_value.maybe_single.return_value.execute.return_value.data = None
+    supabase.table.reset_mock()
+
+    with patch("services.form_config.get_supabase", return_value=supabase):
+        with pytest.raises(HTTPException) as exc:
+            get_public_form_config("../../etc", _request())
+        assert exc.value.status_code == 404
+        supabase.table.assert_not_called()
+        assert "../../etc" not in form_config._blobs
+
+        with pytest.raises(HTTPException):
+            get_public_form_config("00000000-0000-4000-8000-000000000000", _request())
+
+    tables["public_form_configs"].delete.assert_not_called()
+    tables["public_form_configs"].upsert.assert_not_called()
+
+
+def test_cache_is_bounded_and_expired_negatives_go_first(monkeypatch):
+    monkeypatch.setattr(form_config, "MAX_BLOBS", 3)
+    now = [1000.0]
+    monkeypatch.setattr(form_config.time, "monotonic", lambda: now[0])
+    blob = form_config.FormConfigBlob({"fields": []})
+
+    form_config._remember("negative", None)
+    now[0] += form_config.FORM_CONFIG_TTL + 1
+    for key in ("a", "b", "c"):
+        form_config._remember(key, blob)
+    assert list(form_config._blobs) == ["a", "b", "c"]
+
+    form_config._remember("d", blob)
+    assert list(form_config._blobs) == ["b", "c", "d"]
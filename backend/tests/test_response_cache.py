@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+from services.cache import ResponseCache, cached_json_response, response_cache, invalidate_client_cache
+
+
+def _request(headers=None):
+    return SimpleNamespace(headers=headers or {})
+
+
+def setup_function():
+    response_cache.clear()
+
+
+def test_cache_hit_skips_rebuild():
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"clicks": 10}
+
+    first = cached_json_response(_request(), "metrics", "client-1", {"period": "today"}, build)
+    second = cached_json_response(_request(), "metrics", "client-1", {"period": "today"}, build)
+
+    assert len(calls) == 1
+    assert first.status_code == 200
+    assert first.body == second.body
+    assert first.headers["etag"] == second.headers["etag"]
+
+    stats = response_cache.stats()["routes"]["metrics"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_params_and_tenants_are_isolated():
+    cached_json_response(_request(), "metrics", "client-1", {"period": "today"}, lambda: {"v": 1})
+    other_period = cached_json_response(_request(), "metrics", "client-1", {"period": "week"}, lambda: {"v": 2})
+    other_client = cached_json_response(_request(), "metrics", "client-2", {"period": "today"}, lambda: {"v": 3})
+
+    assert other_period.body == b'{"v":2}'
+    assert other_client.body == b'{"v":3}'
+
+
+def test_if_none_match_returns_304():
+    first = cached_json_response(_request(), "funnel", "client-1", None, lambda: {"step_1": 4})
+    etag = first.headers["etag"]
+
+    second = cached_json_response(_request({"if-none-match": etag}), "funnel", "client-1", None, lambda: {"step_1": 4})
+
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert response_cache.stats()["routes"]["funnel"]["not_modified"] == 1
+
+
+def test_invalidation_is_per_client():
+    cached_json_response(_request(), "creatives", "client-1", None, lambda: {"v": 1})
+    cached_json_response(_request(), "creatives", "client-2", None, lambda: {"v": 1})
+
+    invalidate_client_cache("client-1")
+
+    assert response_cache.get("creatives", "client-1") is None
+    assert response_cache.get("creatives", "client-2") is not None
+    assert response_cache.stats()["routes"]["creatives"]["invalidations"] == 1
+
+
+def test_expired_entries_are_rebuilt():
+    cache = ResponseCache()
+    cache.set("metrics", "client-1", None, {"v": 1}, ttl=-1)
+    assert cache.get("metrics", "client-1") is None
+
+
+def test_max_entries_evicts_oldest():
+    cache = ResponseCache(max_entries=2)
+    cache.set("metrics", "a", None, {}, ttl=60)
+    cache.set("metrics", "b", None, {}, ttl=60)
+    cache.set("metrics", "c", None, {}, ttl=60)
+
+    assert cache.get("metrics", "a") is None
+    assert cache.get("metrics", "c") is not None
@@ -0,0 +1,77 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from services import scanner_ingest
+from services.logger import LogPipeline
+from services.scanner_ingest import ActiveClients, ingest_scanner_events
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    pipeline = LogPipeline(table="external_events", batch_size=100, spill_path=str(tmp_path / "spill.jsonl"), sample_rates={})
+    monkeypatch.setattr(scanner_ingest, "scanner_pipeline", pipeline)
+    return pipeline
+
+
+def _supabase(active_ids):
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [{"id": i} for i in active_ids]
+    return supabase
+
+
+@pytest.mark.asyncio
+async def test_events_are_buffered_and_flushed_in_one_insert(pipeline, monkeypatch):
+    clients = ActiveClients()
+    monkeypatch.setattr(scanner_ingest, "active_clients", clients)
+    supabase = _supabase(["client-1"])
+    events = [{"event_type": "page_view", "page_url": "https://loja.test/"} for _ in range(30)]
+
+    with patch("services.scanner_ingest.get_supabase", return_value=supabase), \
+         patch("services.logger.get_supabase", return_value=supabase):
+        assert await ingest_scanner_events("client-1", events[:10]) == 10
+        assert await ingest_scanner_events("client-1", events[10:]) == 20
+        assert pipeline.flush() == 30
+
+    # Clientes ativos carregados uma vez; eventos gravados num único insert multi-linha
+    assert clients.counters["refreshes"] == 1
+    supabase.table.assert_any_call("external_events")
+    inserts = supabase.table.return_value.insert.call_args_list
+    assert [len(c[0][0]) for c in inserts] == [30]
+    assert inserts[0][0][0][0]["client_id"] == "client-1"
+
+
+@pytest.mark.asyncio
+async def test_unknown_client_is_ignored_without_reloading_every_time(pipeline, monkeypatch):
+    clients = ActiveClients()
+    monkeypatch.setattr(scanner_ingest, "active_clients", clients)
+    supabase = _supabase(["client-1"])
+
+    with patch("services.scanner_ingest.get_supabase", return_value=supabase):
+        for _ in range(5):
+            assert await ingest_scanner_events("client-x", [{"event_type": "page_view"}]) == 0
+
+    assert clients.counters["refreshes"] == 1
+    assert clients.counters["unknown"] == 5
+    assert pipeline.stats()["buffered"] == 0
+
+    # Novo cliente: a invalidação força recarregar na próxima consulta
+    clients.invalidate()
+    with patch("services.scanner_ingest.get_supabase", return_value=_supabase(["client-1", "client-x"])):
+        assert await ingest_scanner_events("client-x", [{"event_type": "page_view"}]) == 1
+
+
+def test_beacon_payload_is_sanitized_and_capped():
+    from routes.scanner import ScannerBatch
+
+    batch = ScannerBatch(client_id="client-1", events=[
+        {"event_type": "click\u0000", "page_url": "https://loja.test/\u0000" + "a" * 5000,
+         "metadata": {"campo\u0000": "valor\u0000", "nested": {"a": {"b": {"c": {"d": 1}}}}}},
+        {"event_type": "page_view", "page_url": "https://loja.test/", "metadata": {f"k{i}": "x" * 500 for i in range(20)}},
+    ])
+    first, second = batch.events
+
+    assert first.event_type == "click"
+    assert "\u0000" not in first.page_url and len(first.page_url) == scanner_ingest.MAX_PAGE_URL_LENGTH
+    assert first.metadata == {"campo": "valor", "nested": {"a": {"b": {"c": None}}}}
+    assert second.metadata == {"truncated": True}
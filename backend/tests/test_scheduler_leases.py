@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from services.scheduler_leases import SchedulerLeases
+
+
+class FakeLeaseTable:
+    """renew/release/record_scheduler_leases sobre um dict em memória."""
+
+    def __init__(self):
+        self.leases = {}
+        self.runs = []
+
+    def rpc(self, name, params):
+        now = datetime.now(timezone.utc)
+        result = MagicMock()
+        if name == "renew_scheduler_leases":
+            held = []
+            for job in params["p_jobs"]:
+                lease = self.leases.get(job)
+                if lease is None or lease["holder"] == params["p_holder"] or lease["expires_at"] < now:
+                    self.leases[job] = {"holder": params["p_holder"],
+                                        "expires_at": now + timedelta(seconds=params["p_ttl_seconds"])}
+                    held.append(job)
+            result.execute.return_value.data = held
+        elif name == "release_scheduler_leases":
+            for lease in self.leases.values():
+                if lease["holder"] == params["p_holder"]:
+                    lease["expires_at"] = now - timedelta(seconds=1)
+        elif name == "record_scheduler_run":
+            self.runs.append((params["p_job"], params["p_holder"], params["p_status"]))
+        return result
+
+
+@pytest.mark.asyncio
+async def test_job_runs_once_across_workers_and_fails_over():
+    table = FakeLeaseTable()
+    supabase = MagicMock()
+    supabase.rpc.side_effect = table.rpc
+    calls = []
+
+    def job():
+        calls.append("run")
+
+    workers = [SchedulerLeases(holder=f"host:{i}") for i in range(3)]
+    jobs = [w.job("log_retention", job) for w in workers]
+
+    with patch("services.scheduler_leases.get_supabase", return_value=supabase):
+        for w in workers:
+            w.renew()
+        for run in jobs:
+            await run()
+        assert calls == ["run"]
+        assert table.runs == [("log_retention", "host:0", "ok")]
+
+        # Líder encerra (libera o lease): outro worker assume no heartbeat seguinte
+        await workers[0].stop()
+        for w in workers[1:]:
+            w.renew()
+        for run in jobs:
+            await run()
+
+    assert calls == ["run", "run"]
+    assert table.runs[-1] == ("log_retention", "host:1", "ok")
+    assert workers[2].counters["skipped"] == 2
+
+
+@pytest.mark.asyncio
+async def test_without_lease_table_jobs_run_everywhere():
+    supabase = MagicMock()
+    supabase.rpc.side_effect = Exception("function renew_scheduler_leases does not exist")
+    calls = []
+
+    async def job():
+        calls.append("run")
+
+    workers = [SchedulerLeases(holder=f"host:{i}") for i in range(2)]
+    with patch("services.scheduler_leases.get_supabase", return_value=supabase):
+        for w in workers:
+            w.renew()
+            await w.job("meta_sync", job)()
+
+    assert calls == ["run", "run"]
@@ -0,0 +1,135 @@
+import itertools
+from unittest.mock import MagicMock
+
+from services import scoring_engine
+from services.scoring_engine import (
+    DEFAULT_RULES, CompiledScorer, cached_scorer, get_scorer, rescore_client, validate_rules,
+)
+
+
+def legacy_internal_score(lead_data):
+    """Regras fixas do scorer antigo, para conferir a equivalência das DEFAULT_RULES."""
+    def normalize(s):
+        if not s: return ""
+        return s.lower().replace(" ", "").replace("r$", "").replace(".", "").replace(",", "").replace("-", "").replace("–", "")
+
+    score = 0
+    clt_norm = normalize(lead_data.get("clt_years", ""))
+    if "maisde3" in clt_norm or "acimade3" in clt_norm:
+        score += 30
+    elif "2a3" in clt_norm or "23anos" in clt_norm:
+        score += 15
+    inc_norm = normalize(lead_data.get("income_range", ""))
+    if ("3000" in inc_norm and "5000" in inc_norm) or ("acima" in inc_norm and "5000" in inc_norm) or "maisde5000" in inc_norm:
+        score += 25
+    if normalize(lead_data.get("tried_financing", "")) in ("nao", "não", "nunca"):
+        score += 20
+    if lead_data.get("phone"):
+        score += 10
+    return min(score, 100)
+
+
+ANSWERS = {
+    "clt_years":       ["Mais de 3 anos", "Acima de 3 anos", "2 a 3 anos", "1 a 2 anos", "", None],
+    "income_range":    ["R$3.000 - R$5.000", "Acima de R$5.000", "Mais de R$5.000", "Até R$1.500", ""],
+    "tried_financing": ["Não", "nao", "Nunca", "Sim", ""],
+    "phone":           ["11999990000", ""],
+}
+
+
+def _all_leads():
+    keys = list(ANSWERS)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*ANSWERS.values())]
+
+
+def test_default_rules_match_legacy_scorer():
+    scorer = CompiledScorer(DEFAULT_RULES, options={"clt_years": ANSWERS["clt_years"][:4]})
+    leads = _all_leads()
+
+    expected = [legacy_internal_score(lead) for lead in leads]
+    assert [scorer.score(lead) for lead in leads] == expected
+    assert scorer.score_batch(leads) == expected
+
+
+def test_custom_rules_and_cap():
+    rules = {
+        "fields": {
+            "income_range": [{"op": "contains_any", "values": ["Acima"], "points": 80}],
+            "has_clt":      [{"op": "equals", "values": ["Sim"], "points": 40}],
+        },
+        "max_internal": 100,
+    }
+    scorer = CompiledScorer(rules)
+    rows = [{"income_range": "Acima de R$5.000", "has_clt": "sim"}, {"has_clt": "Não"}, {}]
+    assert scorer.score_batch(rows) == [100, 0, 0]
+
+
+def test_validate_rules():
+    assert validate_rules(DEFAULT_RULES) is None
+    assert validate_rules({"fields": {"x": [{"op": "regex", "values": ["a"], "points": 1}]}})
+    assert validate_rules({"fields": {"x": [{"op": "equals", "points": 1}]}})
+
+
+def test_rescore_client_pages_and_writes_only_changed_scores():
+    scoring_engine._scorers.clear()
+    scoring_engine._options.clear()
+    pages = [
+        [{"id": "a", "phone": "119", "internal_score": 10, "answers": {"tried_financing": "Não"}},
+         {"id": "b", "phone": "119", "internal_score": 10, "answers": {}}],
+        [{"id": "c", "phone": "", "internal_score": 0, "answers": {"clt_years": "Mais de 3 anos"}}],
+    ]
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = []
+    supabase.table.return_value.select.return_value.execute.return_value.data = []
+    applied = []
+
+    def rpc(name, params):
+        result = MagicMock()
+        if name == "get_lead_answers":
+            result.execute.return_value.data = pages.pop(0) if pages else []
+        elif name == "apply_lead_scores":
+            applied.extend(params["p_rows"])
+        return result
+
+    supabase.rpc.side_effect = rpc
+    summary = rescore_client("client-1", supabase, page_size=2)
+
+    assert summary == {"scanned": 3, "updated": 2}
+    assert applied == [{"id": "a", "internal_score": 30}, {"id": "c", "internal_score": 30}]
+
+
+def _rules_supabase(version):
+    supabase = MagicMock()
+    result = supabase.table.return_value.select.return_value.eq.return_value.execute.return_value
+    result.data = [{"rules": DEFAULT_RULES, "version": version}]
+    supabase.table.return_value.select.return_value.execute.return_value.data = []
+    return supabase, result
+
+
+def test_scorer_is_rebuilt_when_rules_version_changes_in_another_worker():
+    scoring_engine._scorers.clear()
+    scoring_engine._options.clear()
+    supabase, result = _rules_supabase(1)
+    first = get_scorer("client-1", supabase)
+    assert cached_scorer("client-1") is first
+
+    # Outro worker salvou a versão 2: passado o intervalo, a conferência recompila
+    scorer, compiled_at, _ = scoring_engine._scorers["client-1"]
+    scoring_engine._scorers["client-1"] = (scorer, compiled_at, compiled_at - scoring_engine.VERSION_CHECK_INTERVAL)
+    assert cached_scorer("client-1") is None
+    result.data = [{"rules": DEFAULT_RULES, "version": 2}]
+    second = get_scorer("client-1", supabase)
+    assert second is not first
+    assert second.version == 2
+
+
+def test_scorer_is_kept_when_rules_version_is_unchanged():
+    scoring_engine._scorers.clear()
+    scoring_engine._options.clear()
+    supabase, _ = _rules_supabase(3)
+    first = get_scorer("client-1", supabase)
+    scorer, compiled_at, _ = scoring_engine._scorers["client-1"]
+    scoring_engine._scorers["client-1"] = (scorer, compiled_at, compiled_at - scoring_engine.VERSION_CHECK_INTERVAL)
+
+    assert get_scorer("client-1", supabase) is first
+    assert cached_scorer("client-1") is first
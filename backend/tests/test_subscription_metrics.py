@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+from unittest.mock import patch, MagicMock
+
+from routes import billing
+from routes.admin.master import get_master_metrics
+
+
+def test_transition_uses_rpc_with_status_and_billing_date():
+    supabase = MagicMock()
+    with patch("routes.billing.get_supabase", return_value=supabase):
+        billing.activate_subscription("sub_1")
+
+    name, params = supabase.rpc.call_args[0]
+    assert name == "apply_subscription_transition"
+    assert params["p_asaas_sub_id"] == "sub_1" and params["p_status"] == "active"
+    assert params["p_next_billing_at"] is not None
+    supabase.table.assert_not_called()
+
+
+def test_transition_fallback_stamps_updated_at():
+    supabase = MagicMock()
+    supabase.rpc.side_effect = Exception("function apply_subscription_transition does not exist")
+    before = datetime.now(timezone.utc)
+    with patch("routes.billing.get_supabase", return_value=supabase):
+        billing.cancel_subscription("sub_2")
+
+    supabase.table.assert_called_with("subscriptions")
+    data = supabase.table.return_value.update.call_args[0][0]
+    assert data["status"] == "cancelled"
+    assert datetime.fromisoformat(data["updated_at"]) >= before
+    supabase.table.return_value.update.return_value.eq.assert_called_with("asaas_sub_id", "sub_2")
+
+
+def test_reconcile_closes_previous_day_by_default_and_swallows_errors():
+    supabase = MagicMock()
+    with patch("routes.billing.get_supabase", return_value=supabase):
+        billing.reconcile_subscription_metrics()
+        # Sem parâmetros: o default da função no banco é CURRENT_DATE - 1
+        supabase.rpc.assert_called_once_with("reconcile_subscription_metrics", {})
+
+        supabase.rpc.side_effect = Exception("timeout")
+        billing.reconcile_subscription_metrics()
+
+
+def test_master_metrics_read_snapshot_and_daily_cancellations():
+    supabase = MagicMock()
+    tables = {}
+
+    def table(name):
+        builder = tables.setdefault(name, MagicMock())
+        if name == "subscription_metrics":
+            builder.select.return_value.eq.return_value.execute.return_value.data = [
+                {"mrr_cents": 30000, "active_count": 9}
+            ]
+        elif name == "subscription_metrics_daily":
+            builder.select.return_value.gte.return_value.order.return_value.execute.return_value.data = [
+                {"day": "2026-10-01", "mrr_cents": 31000, "active_count": 10, "cancellations": 0},
+                {"day": "2026-10-02", "mrr_cents": 30000, "active_count": 9, "cancellations": 1},
+            ]
+        return builder
+
+    supabase.table.side_effect = table
+    with patch("routes.admin.master.get_supabase", return_value=supabase):
+        metrics = get_master_metrics({"role": "master"})
+
+    assert metrics["mrr"] == 300 and metrics["arr"] == 3600
+    assert metrics["churn_rate"] == 10.0
+    assert [p["mrr"] for p in metrics["mrr_history"]] == [310, 300]
+    assert "subscriptions" not in tables
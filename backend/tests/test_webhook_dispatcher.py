@@ -0,0 +1,168 @@
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from services.webhook_dispatcher import CircuitBreaker, WebhookDispatcher, backoff_seconds, lease_seconds
+from utils.url_safety import is_safe_url, resolves_to_safe_address
+
+
+def _row(i, url="https://hook.test/a", attempts=0, batch=False):
+    return {"id": f"row-{i}", "client_id": "client-1", "url": url, "lead_id": f"lead-{i}",
+            "payload": {"event": "lead_created", "lead_id": f"lead-{i}"}, "batch": batch,
+            "attempts": attempts, "created_at": "2026-01-01T00:00:00+00:00"}
+
+
+def test_backoff_grows_exponentially_with_cap():
+    assert 24 <= backoff_seconds(1) <= 36
+    assert 96 <= backoff_seconds(3) <= 144
+    assert backoff_seconds(50) <= 21600 * 1.2
+
+
+def test_breaker_opens_after_threshold_and_closes_on_success():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record("u", False)
+    assert breaker.retry_after("u") == 0
+    breaker.record("u", False)
+    assert breaker.retry_after("u") > 0
+    assert breaker.open_circuits() == ["u"]
+    breaker.record("u", True)
+    assert breaker.retry_after("u") == 0
+
+
+class FakeHttp:
+    """Substitui httpx.AsyncClient (outros testes trocam o módulo httpx por um mock)."""
+
+    def __init__(self, status_code, requests):
+        self.status_code = status_code
+        self.requests = requests
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def post(self, url, json=None):
+        self.requests.append({"url": url, "json": json})
+        return SimpleNamespace(status_code=self.status_code, text="")
+
+
+async def _cycle(dispatcher, rows, status_code):
+    """Executa um ciclo com banco e HTTP falsos; retorna (resultados gravados, requisições)."""
+    requests = []
+
+    async def noop(*a, **kw):
+        return None
+
+    supabase = MagicMock()
+    supabase.rpc.return_value.execute.return_value.data = rows
+    fake_httpx = SimpleNamespace(AsyncClient=lambda **kw: FakeHttp(status_code, requests))
+
+    async def resolve(url):
+        # Sem DNS nos testes: só a validação estática
+        return is_safe_url(url)
+
+    with patch("services.webhook_dispatcher.get_supabase", return_value=supabase), \
+         patch("services.webhook_dispatcher.log_system_event", side_effect=noop), \
+         patch("services.webhook_dispatcher.resolves_to_safe_address", side_effect=resolve), \
+         patch("services.webhook_dispatcher.httpx", fake_httpx):
+        await dispatcher.run_once()
+
+    finish = [c for c in supabase.rpc.call_args_list if c[0][0] == "finish_webhook_deliveries"]
+    results = {r["id"]: r for r in finish[0][0][1]["p_results"]} if finish else {}
+    return results, requests
+
+
+@pytest.mark.asyncio
+async def test_successful_delivery_marks_rows_delivered():
+    dispatcher = WebhookDispatcher()
+    results, requests = await _cycle(dispatcher, [_row(1), _row(2)], 200)
+
+    assert len(requests) == 2
+    assert {r["status"] for r in results.values()} == {"delivered"}
+    assert dispatcher.stats(include_depth=False)["delivered"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failure_reschedules_then_dead_letters():
+    dispatcher = WebhookDispatcher(max_attempts=3)
+    results, _ = await _cycle(dispatcher, [_row(1, attempts=0), _row(2, attempts=2)], 503)
+
+    assert results["row-1"]["status"] == "pending"
+    assert results["row-1"]["attempts"] == 1
+    assert results["row-1"]["next_attempt_at"] is not None
+    assert results["row-2"]["status"] == "dead"
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoints_receive_one_post():
+    dispatcher = WebhookDispatcher()
+    rows = [_row(i, batch=True) for i in range(5)]
+    results, requests = await _cycle(dispatcher, rows, 200)
+
+    assert len(requests) == 1
+    assert len(requests[0]["json"]["events"]) == 5
+    assert len(results) == 5
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_defers_without_requests():
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record("https://hook.test/a", False)
+    dispatcher = WebhookDispatcher(breaker=breaker)
+
+    results, requests = await _cycle(dispatcher, [_row(1, attempts=4)], 200)
+
+    assert requests == []
+    assert results["row-1"]["status"] == "pending"
+    assert results["row-1"]["attempts"] == 4
+
+
+@pytest.mark.asyncio
+async def test_circuit_opening_mid_cycle_defers_remaining_units():
+    dispatcher = WebhookDispatcher(endpoint_concurrency=1, breaker=CircuitBreaker(threshold=2, cooldown=60))
+    results, requests = await _cycle(dispatcher, [_row(i) for i in range(5)], 503)
+
+    assert len(requests) == 2
+    deferred = [r for r in results.values() if r["last_error"] == "circuit open"]
+    assert len(deferred) == 3
+    assert {r["attempts"] for r in deferred} == {0}
+
+
+def test_lease_covers_worst_case_cycle_and_errors_back_off():
+    # 100 entregas, 2 por vez, 10s cada: 500s + margem
+    assert lease_seconds(100, 2, 10) == 530
+    assert lease_seconds(1, 2, 10) == 60
+
+    dispatcher = WebhookDispatcher(poll_interval=2)
+    waits = []
+    for _ in range(8):
+        dispatcher._consecutive_errors += 1
+        waits.append(dispatcher._idle_timeout())
+    assert waits[:3] == [4, 8, 16]
+    assert waits[-1] == 60
+
+
+def test_is_safe_url_rejects_internal_addresses():
+    assert is_safe_url("https://hook.test/a")
+    for url in ("http://localhost:8000/x", "http://127.0.0.1/", "http://169.254.169.254/latest/meta-data",
+                "http://10.0.0.5/hook", "http://192.168.1.1/", "http://[::1]/", "http://0.0.0.0/", "ftp://hook.test/"):
+        assert not is_safe_url(url), url
+
+
+@pytest.mark.asyncio
+async def test_resolved_address_is_checked_before_delivery():
+    async def getaddrinfo(host, port, **kw):
+        return [(2, 1, 6, "", ("10.0.0.7", port))]
+
+    loop = MagicMock(getaddrinfo=getaddrinfo)
+    with patch("utils.url_safety.asyncio.get_running_loop", return_value=loop):
+        assert not await resolves_to_safe_address("https://rebind.test/hook")
+
+    dispatcher = WebhookDispatcher()
+    results, requests = await _cycle(dispatcher, [_row(1, url="http://169.254.169.254/latest")], 200)
+
+    assert requests == []
+    assert results["row-1"]["status"] == "dead"
+    assert dispatcher.stats(include_depth=False)["blocked"] == 1
@@ -0,0 +1,54 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from services import webhook_registry
+from services.webhooks import trigger_webhooks
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    webhook_registry._registry.clear()
+    webhook_registry._loaded_at.clear()
+    yield
+    webhook_registry._registry.clear()
+    webhook_registry._loaded_at.clear()
+
+
+@pytest.mark.asyncio
+async def test_client_without_webhooks_is_cached_as_negative_entry():
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.execute.return_value.data = []
+
+    with patch("services.webhook_registry.get_supabase", return_value=supabase):
+        await trigger_webhooks("lead_created", {"id": "lead-1"}, "client-1")
+        await trigger_webhooks("lead_created", {"id": "lead-2"}, "client-1")
+
+    assert supabase.table.call_count == 1
+    assert webhook_registry.cached_webhooks("client-1") == []
+
+
+def test_invalidation_forces_reload():
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.execute.return_value.data = [
+        {"id": "wh-1", "url": "https://hook.test", "batch_delivery": False}
+    ]
+
+    with patch("services.webhook_registry.get_supabase", return_value=supabase):
+        assert webhook_registry.get_active_webhooks("client-1")[0]["id"] == "wh-1"
+        assert webhook_registry.get_active_webhooks("client-1")[0]["id"] == "wh-1"
+        webhook_registry.invalidate_webhooks("client-1")
+        assert webhook_registry.cached_webhooks("client-1") is None
+        webhook_registry.get_active_webhooks("client-1")
+
+    assert supabase.table.call_count == 2
+
+
+def test_lookup_errors_are_not_cached():
+    supabase = MagicMock()
+    supabase.table.side_effect = Exception("down")
+
+    with patch("services.webhook_registry.get_supabase", return_value=supabase):
+        assert webhook_registry.get_active_webhooks("client-1") is None
+
+    assert webhook_registry.cached_webhooks("client-1") is None
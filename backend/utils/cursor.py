@@ -0,0 +1,23 @@
+import base64
+import uuid
+from datetime import datetime
+from typing import Tuple
+from fastapi import HTTPException
+
+# Cursores opacos para paginação keyset sobre (created_at, id).
+# O conteúdo vai direto para o filtro or_() do PostgREST, então só valores que
+# passam por datetime/UUID (re-serializados no formato canônico) são aceitos.
+
+
+def encode_cursor(created_at: str, row_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        parsed_at = datetime.fromisoformat(created_at)
+        parsed_id = uuid.UUID(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return parsed_at.isoformat(), str(parsed_id)
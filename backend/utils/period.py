@@ -0,0 +1,16 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+def period_start(period: Optional[str]) -> Optional[datetime]:
+    """
+    Converte o filtro de período dos dashboards em data inicial.
+    'today' | 'week' (7 dias) | 'month' (30 dias); qualquer outro valor = sem filtro.
+    """
+    now = datetime.now()
+    if period == "today":
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif period == "week":
+        return now - timedelta(days=7)
+    elif period == "month":
+        return now - timedelta(days=30)
+    return None
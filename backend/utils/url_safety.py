@@ -0,0 +1,65 @@
+import asyncio
+import ipaddress
+import socket
+from urllib.parse import urlparse
+
+# Proteção contra SSRF para URLs informadas por clientes (proxy de captura, webhooks).
+
+
+def _is_blocked_ip(ip) -> bool:
+    return ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved \
+        or ip.is_multicast or ip.is_unspecified
+
+
+def is_safe_url(url: str) -> bool:
+    """Valida se a URL é segura para requisições do servidor (evita SSRF)"""
+    try:
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https'):
+            return False
+
+        hostname = parsed.hostname
+        if not hostname:
+            return False
+
+        # Check IP address
+        try:
+            ip = ipaddress.ip_address(hostname)
+            if _is_blocked_ip(ip):
+                return False
+        except ValueError:
+            # Not an IP, check localhost
+            if hostname.rstrip('.').lower() in ('localhost', 'localhost.localdomain') or hostname.endswith('.localhost'):
+                return False
+
+        return True
+    except Exception:
+        return False
+
+
+async def resolves_to_safe_address(url: str) -> bool:
+    """
+    is_safe_url + resolução DNS no momento do envio: o nome pode passar a apontar
+    para um endereço interno depois da validação no cadastro.
+    """
+    if not is_safe_url(url):
+        return False
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        return False
+    if not infos:
+        return False
+    for info in infos:
+        try:
+            ip = ipaddress.ip_address(info[4][0].split('%', 1)[0])
+        except ValueError:
+            return False
+        # IPv4 mapeado em IPv6 (::ffff:10.0.0.1)
+        if getattr(ip, 'ipv4_mapped', None):
+            ip = ip.ipv4_mapped
+        if _is_blocked_ip(ip):
+            return False
+    return True
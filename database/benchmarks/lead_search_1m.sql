@@ -0,0 +1,68 @@
+-- Benchmark da busca de leads com 1M de linhas (psql, banco de desenvolvimento).
+-- Tudo roda em uma transação desfeita ao final; nenhuma tabela real é alterada.
+--
+--   psql "$DATABASE_URL" -f database/benchmarks/lead_search_1m.sql
+--
+-- Compare o "Execution Time" dos planos antes (ilike, Seq Scan) e depois
+-- (Bitmap Index Scan em idx_bench_name_trgm / idx_bench_phone_digits_trgm).
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TEMP TABLE bench_leads (
+    id           UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    client_id    UUID NOT NULL,
+    name         TEXT,
+    phone        TEXT,
+    phone_digits TEXT GENERATED ALWAYS AS (regexp_replace(COALESCE(phone, ''), '\D', '', 'g')) STORED,
+    created_at   TIMESTAMPTZ DEFAULT NOW()
+) ON COMMIT DROP;
+
+-- 1M leads em 20 clientes; o cliente alvo tem 50k
+INSERT INTO bench_leads (client_id, name, phone, created_at)
+SELECT
+    ('00000000-0000-0000-0000-' || lpad((i % 20)::text, 12, '0'))::uuid,
+    (ARRAY['Ana','Bruno','Carla','Diego','Elaine','Fábio','Gisele','Hugo','Iara','João'])[1 + i % 10]
+        || ' ' ||
+    (ARRAY['Silva','Souza','Oliveira','Santos','Pereira','Lima','Costa','Ribeiro','Almeida','Carvalho'])[1 + (i / 10) % 10]
+        || ' ' || i,
+    format('(%s) 9%s-%s', 11 + i % 80, lpad((i % 10000)::text, 4, '0'), lpad(((i * 7) % 10000)::text, 4, '0')),
+    NOW() - (i || ' seconds')::interval
+FROM generate_series(1, 1000000) AS i;
+
+CREATE INDEX idx_bench_client_created ON bench_leads (client_id, created_at DESC);
+ANALYZE bench_leads;
+
+\echo '--- antes: ilike em name/phone'
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT * FROM bench_leads
+WHERE client_id = '00000000-0000-0000-0000-000000000007'
+  AND (name ILIKE '%oliveira 4242%' OR phone ILIKE '%oliveira 4242%')
+ORDER BY created_at DESC LIMIT 50;
+
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT * FROM bench_leads
+WHERE client_id = '00000000-0000-0000-0000-000000000007'
+  AND (name ILIKE '%1898%' OR phone ILIKE '%1898%')
+ORDER BY created_at DESC LIMIT 50;
+
+CREATE INDEX idx_bench_name_trgm ON bench_leads USING gin (name gin_trgm_ops);
+CREATE INDEX idx_bench_phone_digits_trgm ON bench_leads USING gin (phone_digits gin_trgm_ops);
+ANALYZE bench_leads;
+
+\echo '--- depois: trigram em name'
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT * FROM bench_leads
+WHERE client_id = '00000000-0000-0000-0000-000000000007'
+  AND name ILIKE '%oliveira 4242%'
+ORDER BY created_at DESC LIMIT 50;
+
+\echo '--- depois: trigram em dígitos do telefone'
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT * FROM bench_leads
+WHERE client_id = '00000000-0000-0000-0000-000000000007'
+  AND phone_digits LIKE '%1898%'
+ORDER BY created_at DESC LIMIT 50;
+
+ROLLBACK;
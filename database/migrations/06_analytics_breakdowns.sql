@@ -0,0 +1,43 @@
+-- Analytics: breakdowns de /analytics/full calculados no banco
+
+CREATE INDEX IF NOT EXISTS idx_leads_client_created ON leads(client_id, created_at);
+
+-- Abandono por dispositivo e leads por plataforma de origem (utm_source normalizado)
+-- em uma única varredura indexada por (client_id, created_at).
+CREATE OR REPLACE FUNCTION get_lead_breakdowns(
+    p_client_id UUID,
+    p_since     TIMESTAMPTZ DEFAULT NULL
+) RETURNS JSONB AS $$
+    WITH scoped AS (
+        SELECT
+            status,
+            device_type,
+            CASE
+                WHEN lower(utm_source) LIKE '%facebook%'
+                  OR lower(utm_source) LIKE '%instagram%'
+                  OR lower(utm_source) IN ('fb', 'ig', 'meta') THEN 'meta'
+                WHEN lower(utm_source) LIKE '%google%' THEN 'google'
+                ELSE 'other'
+            END AS platform
+        FROM leads
+        WHERE client_id = p_client_id
+          AND (p_since IS NULL OR created_at >= p_since)
+    )
+    SELECT jsonb_build_object(
+        'abandonment_by_device', jsonb_build_object(
+            'mobile',  count(*) FILTER (WHERE status = 'abandoned' AND device_type = 'mobile'),
+            'desktop', count(*) FILTER (WHERE status = 'abandoned' AND device_type = 'desktop')
+        ),
+        'platform_comparison', jsonb_build_object(
+            'meta',   count(*) FILTER (WHERE platform = 'meta'),
+            'google', count(*) FILTER (WHERE platform = 'google')
+        )
+    )
+    FROM scoped;
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION get_lead_breakdowns(UUID, TIMESTAMPTZ) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_lead_breakdowns(UUID, TIMESTAMPTZ) TO service_role;
@@ -0,0 +1,41 @@
+-- /creatives: score médio e volume de leads por criativo agregados no banco
+
+CREATE INDEX IF NOT EXISTS idx_leads_creative    ON leads(creative_id) WHERE creative_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_leads_client_utm  ON leads(client_id, utm_content) WHERE utm_content IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_creatives_external ON creatives(client_id, external_id);
+
+-- Leads vinculados por creative_id; se o criativo não tiver nenhum,
+-- usa os leads cujo utm_content é o external_id do anúncio.
+CREATE OR REPLACE FUNCTION get_creative_lead_stats(p_client_id UUID)
+RETURNS TABLE (
+    creative_id     UUID,
+    leads_generated BIGINT,
+    avg_score       NUMERIC
+) AS $$
+    WITH by_id AS (
+        SELECT l.creative_id, count(*) AS total, avg(l.internal_score) AS avg_score
+        FROM leads l
+        WHERE l.client_id = p_client_id AND l.creative_id IS NOT NULL
+        GROUP BY l.creative_id
+    ),
+    by_utm AS (
+        SELECT l.utm_content, count(*) AS total, avg(l.internal_score) AS avg_score
+        FROM leads l
+        WHERE l.client_id = p_client_id AND l.utm_content IS NOT NULL
+        GROUP BY l.utm_content
+    )
+    SELECT
+        c.id,
+        COALESCE(i.total, u.total, 0),
+        CASE WHEN i.total IS NOT NULL THEN i.avg_score ELSE u.avg_score END
+    FROM creatives c
+    LEFT JOIN by_id  i ON i.creative_id = c.id
+    LEFT JOIN by_utm u ON u.utm_content = c.external_id
+    WHERE c.client_id = p_client_id;
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION get_creative_lead_stats(UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_creative_lead_stats(UUID) TO service_role;
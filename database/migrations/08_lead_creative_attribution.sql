@@ -0,0 +1,64 @@
+-- Atribuição lead -> criativo persistida na ingestão (leads.creative_id)
+
+-- Backfill: vincula leads antigos cujo utm_content é o external_id ou o nome de um
+-- criativo (external_id tem prioridade; nomes repetidos no cliente são ignorados), a
+-- mesma regra de services/attribution.py.
+-- p_client_id NULL processa todos os clientes. Retorna a quantidade de leads atualizados.
+CREATE OR REPLACE FUNCTION backfill_lead_creatives(p_client_id UUID DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    WITH keys AS (
+        SELECT client_id, external_id AS utm, id, 0 AS prio
+        FROM creatives
+        WHERE external_id IS NOT NULL
+          AND (p_client_id IS NULL OR client_id = p_client_id)
+        UNION ALL
+        SELECT client_id, name, (array_agg(id))[1], 1
+        FROM creatives
+        WHERE name IS NOT NULL
+          AND (p_client_id IS NULL OR client_id = p_client_id)
+        GROUP BY client_id, name
+        HAVING count(*) = 1
+    ), best AS (
+        SELECT DISTINCT ON (client_id, utm) client_id, utm, id
+        FROM keys
+        ORDER BY client_id, utm, prio
+    )
+    UPDATE leads l
+    SET creative_id = b.id
+    FROM best b
+    WHERE l.creative_id IS NULL
+      AND l.utm_content IS NOT NULL
+      AND b.client_id = l.client_id
+      AND b.utm = l.utm_content
+      AND (p_client_id IS NULL OR l.client_id = p_client_id);
+
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+-- Com a atribuição persistida, /creatives passa a ser um agregado simples por creative_id
+-- (idx_leads_creative, migration 07).
+CREATE OR REPLACE FUNCTION get_creative_lead_stats(p_client_id UUID)
+RETURNS TABLE (
+    creative_id     UUID,
+    leads_generated BIGINT,
+    avg_score       NUMERIC
+) AS $$
+    SELECT l.creative_id, count(*), avg(l.internal_score)
+    FROM leads l
+    WHERE l.client_id = p_client_id AND l.creative_id IS NOT NULL
+    GROUP BY l.creative_id;
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION backfill_lead_creatives(UUID) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION get_creative_lead_stats(UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION backfill_lead_creatives(UUID) TO service_role;
+GRANT EXECUTE ON FUNCTION get_creative_lead_stats(UUID) TO service_role;
@@ -0,0 +1,63 @@
+-- /links/{id}/analytics em uma única chamada com contagens agrupadas
+
+CREATE INDEX IF NOT EXISTS idx_funnel_events_link_type ON funnel_events(link_id, event_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_vsessions_link_created  ON visitor_sessions(link_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_clicks_link_created     ON clicks(link_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_leads_link_created      ON leads(link_id, created_at);
+
+-- Retorna NULL se o link não existir ou não pertencer ao cliente.
+-- p_since NULL = histórico completo.
+CREATE OR REPLACE FUNCTION get_link_analytics(
+    p_link_id   UUID,
+    p_client_id UUID,
+    p_since     TIMESTAMPTZ DEFAULT NULL
+) RETURNS JSONB AS $$
+    WITH link AS (
+        SELECT id, name, funnel_type
+        FROM links
+        WHERE id = p_link_id AND client_id = p_client_id
+    ),
+    events AS (
+        SELECT event_type, step, field_key
+        FROM funnel_events
+        WHERE link_id = p_link_id
+          AND (p_since IS NULL OR created_at >= p_since)
+    )
+    SELECT jsonb_build_object(
+        'link', to_jsonb(link),
+        'clicks', (
+            SELECT count(*) FROM clicks
+            WHERE link_id = p_link_id AND (p_since IS NULL OR created_at >= p_since)
+        ),
+        'sessions', (
+            SELECT count(*) FROM visitor_sessions
+            WHERE link_id = p_link_id AND (p_since IS NULL OR created_at >= p_since)
+        ),
+        'converted', (
+            SELECT count(*) FROM leads
+            WHERE link_id = p_link_id AND (p_since IS NULL OR created_at >= p_since)
+        ),
+        'event_breakdown', COALESCE((
+            SELECT jsonb_object_agg(event_type, total)
+            FROM (SELECT event_type, count(*) AS total FROM events
+                  WHERE event_type IS NOT NULL GROUP BY event_type) t
+        ), '{}'::jsonb),
+        'field_abandons', COALESCE((
+            SELECT jsonb_object_agg(field_key, total)
+            FROM (SELECT field_key, count(*) AS total FROM events
+                  WHERE event_type = 'form_abandon' AND field_key IS NOT NULL GROUP BY field_key) t
+        ), '{}'::jsonb),
+        'step_completion', COALESCE((
+            SELECT jsonb_object_agg(step::text, total)
+            FROM (SELECT step, count(*) AS total FROM events
+                  WHERE event_type = 'step_complete' AND step IS NOT NULL AND step <> 0 GROUP BY step) t
+        ), '{}'::jsonb)
+    )
+    FROM link;
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION get_link_analytics(UUID, UUID, TIMESTAMPTZ) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_link_analytics(UUID, UUID, TIMESTAMPTZ) TO service_role;
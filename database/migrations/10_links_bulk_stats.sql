@@ -0,0 +1,48 @@
+-- /links?with_stats=true: contagens de todos os links da página em uma consulta agrupada
+-- (usa os índices (link_id, created_at) da migration 09)
+
+CREATE OR REPLACE FUNCTION get_links_stats(
+    p_client_id UUID,
+    p_link_ids  UUID[]
+) RETURNS TABLE (
+    link_id   UUID,
+    clicks    BIGINT,
+    sessions  BIGINT,
+    leads     BIGINT,
+    converted BIGINT
+) AS $$
+    WITH owned AS (
+        SELECT id FROM links
+        WHERE client_id = p_client_id AND id = ANY(p_link_ids)
+    ),
+    c AS (
+        SELECT link_id, count(*) AS total FROM clicks
+        WHERE link_id IN (SELECT id FROM owned) GROUP BY link_id
+    ),
+    s AS (
+        SELECT link_id, count(*) AS total FROM visitor_sessions
+        WHERE link_id IN (SELECT id FROM owned) GROUP BY link_id
+    ),
+    l AS (
+        SELECT link_id,
+               count(*) AS total,
+               count(*) FILTER (WHERE status = 'converted') AS converted
+        FROM leads
+        WHERE link_id IN (SELECT id FROM owned) GROUP BY link_id
+    )
+    SELECT o.id,
+           COALESCE(c.total, 0),
+           COALESCE(s.total, 0),
+           COALESCE(l.total, 0),
+           COALESCE(l.converted, 0)
+    FROM owned o
+    LEFT JOIN c ON c.link_id = o.id
+    LEFT JOIN s ON s.link_id = o.id
+    LEFT JOIN l ON l.link_id = o.id;
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION get_links_stats(UUID, UUID[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_links_stats(UUID, UUID[]) TO service_role;
@@ -0,0 +1,3 @@
+-- Alocação de slug por insert + retry em conflito depende da unicidade garantida no banco.
+-- (bancos criados por schema.sql/complete_schema.sql já têm UNIQUE; este índice cobre os demais)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_links_slug_unique ON links(slug);
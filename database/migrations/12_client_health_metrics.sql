@@ -0,0 +1,25 @@
+-- Master: erros recentes de todos os clientes da página em uma consulta agrupada
+
+CREATE INDEX IF NOT EXISTS idx_logs_client_level_created ON logs(client_id, level, created_at);
+
+CREATE OR REPLACE FUNCTION get_client_health_metrics(
+    p_since      TIMESTAMPTZ,
+    p_client_ids UUID[] DEFAULT NULL
+) RETURNS TABLE (
+    client_id     UUID,
+    recent_errors BIGINT
+) AS $$
+    SELECT l.client_id, count(*)
+    FROM logs l
+    WHERE l.level = 'error'
+      AND l.created_at >= p_since
+      AND l.client_id IS NOT NULL
+      AND (p_client_ids IS NULL OR l.client_id = ANY(p_client_ids))
+    GROUP BY l.client_id;
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION get_client_health_metrics(TIMESTAMPTZ, UUID[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_client_health_metrics(TIMESTAMPTZ, UUID[]) TO service_role;
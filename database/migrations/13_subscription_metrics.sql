@@ -0,0 +1,127 @@
+-- Master: MRR/ARR e churn mantidos incrementalmente pelas transições de assinatura
+
+-- Sem default na criação: as linhas existentes ficam com NULL em vez do horário da migration
+-- (senão todo cancelamento antigo contaria como "de hoje"); só as novas recebem NOW().
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+ALTER TABLE subscriptions ALTER COLUMN updated_at SET DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS idx_subscriptions_status ON subscriptions(status);
+
+-- Snapshot atual (linha única)
+CREATE TABLE IF NOT EXISTS subscription_metrics (
+    id           SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    mrr_cents    BIGINT  NOT NULL DEFAULT 0,
+    active_count INTEGER NOT NULL DEFAULT 0,
+    updated_at   TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Série diária para tendências (valores de fechamento + movimentos do dia)
+CREATE TABLE IF NOT EXISTS subscription_metrics_daily (
+    day           DATE PRIMARY KEY,
+    mrr_cents     BIGINT  NOT NULL DEFAULT 0,
+    active_count  INTEGER NOT NULL DEFAULT 0,
+    activations   INTEGER NOT NULL DEFAULT 0,
+    cancellations INTEGER NOT NULL DEFAULT 0,
+    updated_at    TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Aplica a mudança de status e ajusta o snapshot pelo delta, na mesma transação.
+CREATE OR REPLACE FUNCTION apply_subscription_transition(
+    p_asaas_sub_id    TEXT,
+    p_status          TEXT,
+    p_next_billing_at TIMESTAMPTZ DEFAULT NULL
+) RETURNS void AS $$
+DECLARE
+    v_old_status TEXT;
+    v_mrr        INTEGER;
+    v_delta      INTEGER;
+    v_cancelled  INTEGER;
+BEGIN
+    SELECT status, COALESCE(mrr_cents, 0) INTO v_old_status, v_mrr
+    FROM subscriptions WHERE asaas_sub_id = p_asaas_sub_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    UPDATE subscriptions
+    SET status          = p_status,
+        next_billing_at = COALESCE(p_next_billing_at, next_billing_at),
+        updated_at      = NOW()
+    WHERE asaas_sub_id = p_asaas_sub_id;
+
+    v_delta := (CASE WHEN p_status = 'active' THEN 1 ELSE 0 END)
+             - (CASE WHEN v_old_status = 'active' THEN 1 ELSE 0 END);
+    v_cancelled := CASE WHEN p_status = 'cancelled' AND v_old_status IS DISTINCT FROM 'cancelled' THEN 1 ELSE 0 END;
+
+    IF v_delta <> 0 THEN
+        INSERT INTO subscription_metrics (id, mrr_cents, active_count)
+        VALUES (1, v_delta * v_mrr, v_delta)
+        ON CONFLICT (id) DO UPDATE SET
+            mrr_cents    = subscription_metrics.mrr_cents + EXCLUDED.mrr_cents,
+            active_count = subscription_metrics.active_count + EXCLUDED.active_count,
+            updated_at   = NOW();
+    END IF;
+
+    IF v_delta <> 0 OR v_cancelled <> 0 THEN
+        INSERT INTO subscription_metrics_daily (day, mrr_cents, active_count, activations, cancellations)
+        SELECT CURRENT_DATE, m.mrr_cents, m.active_count, GREATEST(v_delta, 0), v_cancelled
+        FROM subscription_metrics m WHERE m.id = 1
+        ON CONFLICT (day) DO UPDATE SET
+            mrr_cents     = EXCLUDED.mrr_cents,
+            active_count  = EXCLUDED.active_count,
+            activations   = subscription_metrics_daily.activations + EXCLUDED.activations,
+            cancellations = subscription_metrics_daily.cancellations + EXCLUDED.cancellations,
+            updated_at    = NOW();
+    END IF;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+-- Reconciliação noturna: recalcula o snapshot a partir de subscriptions (corrige desvios
+-- de alterações feitas fora do billing) e fecha p_day, por padrão o dia anterior (o job
+-- roda às 03:00). A linha do dia fechado mantém o MRR/ativos gravados pelas transições;
+-- o snapshot atual só entra se o dia não teve nenhuma.
+DROP FUNCTION IF EXISTS reconcile_subscription_metrics();
+CREATE OR REPLACE FUNCTION reconcile_subscription_metrics(p_day DATE DEFAULT CURRENT_DATE - 1) RETURNS void AS $$
+BEGIN
+    INSERT INTO subscription_metrics (id, mrr_cents, active_count)
+    SELECT 1, COALESCE(sum(mrr_cents), 0), count(*)
+    FROM subscriptions WHERE status = 'active'
+    ON CONFLICT (id) DO UPDATE SET
+        mrr_cents    = EXCLUDED.mrr_cents,
+        active_count = EXCLUDED.active_count,
+        updated_at   = NOW();
+
+    INSERT INTO subscription_metrics_daily (day, mrr_cents, active_count, cancellations)
+    SELECT p_day, m.mrr_cents, m.active_count,
+           (SELECT count(*) FROM subscriptions
+            WHERE status = 'cancelled'
+              AND updated_at >= p_day AND updated_at < p_day + 1)
+    FROM subscription_metrics m WHERE m.id = 1
+    ON CONFLICT (day) DO UPDATE SET
+        cancellations = GREATEST(subscription_metrics_daily.cancellations, EXCLUDED.cancellations),
+        updated_at    = NOW();
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+-- Semente: só o snapshot atual; a série diária começa pelas transições a partir daqui
+INSERT INTO subscription_metrics (id, mrr_cents, active_count)
+SELECT 1, COALESCE(sum(mrr_cents), 0), count(*)
+FROM subscriptions WHERE status = 'active'
+ON CONFLICT (id) DO UPDATE SET
+    mrr_cents    = EXCLUDED.mrr_cents,
+    active_count = EXCLUDED.active_count,
+    updated_at   = NOW();
+
+-- Sem políticas: só o backend (service_role, que ignora RLS) acessa estas tabelas
+ALTER TABLE subscription_metrics ENABLE ROW LEVEL SECURITY;
+ALTER TABLE subscription_metrics_daily ENABLE ROW LEVEL SECURITY;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION apply_subscription_transition(TEXT, TEXT, TIMESTAMPTZ) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION reconcile_subscription_metrics(DATE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_subscription_transition(TEXT, TEXT, TIMESTAMPTZ) TO service_role;
+GRANT EXECUTE ON FUNCTION reconcile_subscription_metrics(DATE) TO service_role;
@@ -0,0 +1,93 @@
+-- Logs: paginação por cursor e retenção em camadas
+
+-- Hot path de /logs: filtro por cliente, ordenação (created_at, id) desc
+CREATE INDEX IF NOT EXISTS idx_logs_client_created ON logs(client_id, created_at DESC, id DESC);
+
+-- Arquivo diário por cliente. entries é TOAST-comprimido pelo Postgres (lz4 quando disponível).
+CREATE TABLE IF NOT EXISTS logs_archive (
+    id         UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    client_id  UUID,
+    day        DATE NOT NULL,
+    total      INTEGER NOT NULL DEFAULT 0,
+    errors     INTEGER NOT NULL DEFAULT 0,
+    entries    JSONB NOT NULL DEFAULT '[]'::jsonb,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_archive_client_day
+    ON logs_archive ((COALESCE(client_id, '00000000-0000-0000-0000-000000000000'::uuid)), day);
+
+DO $$
+BEGIN
+    ALTER TABLE logs_archive ALTER COLUMN entries SET COMPRESSION lz4;
+EXCEPTION WHEN OTHERS THEN
+    NULL; -- Postgres < 14 ou sem lz4: mantém pglz
+END $$;
+
+-- Remove corpos grandes (payload/response de webhooks) de logs mais antigos que p_days.
+CREATE OR REPLACE FUNCTION strip_log_metadata(p_days INTEGER, p_limit INTEGER DEFAULT 5000)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE logs
+    SET metadata = (metadata - 'payload' - 'response') || '{"bodies_stripped": true}'::jsonb
+    WHERE id IN (
+        SELECT id FROM logs
+        WHERE created_at < NOW() - make_interval(days => p_days)
+          AND (metadata ? 'payload' OR metadata ? 'response')
+        LIMIT p_limit
+    );
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+-- Move até p_limit logs mais antigos que p_days para logs_archive (agrupados por cliente/dia).
+CREATE OR REPLACE FUNCTION archive_old_logs(p_days INTEGER, p_limit INTEGER DEFAULT 5000)
+RETURNS INTEGER AS $$
+DECLARE
+    v_moved INTEGER;
+BEGIN
+    WITH moved AS (
+        DELETE FROM logs
+        WHERE id IN (
+            SELECT id FROM logs
+            WHERE created_at < NOW() - make_interval(days => p_days)
+            ORDER BY created_at
+            LIMIT p_limit
+        )
+        RETURNING *
+    ),
+    grouped AS (
+        INSERT INTO logs_archive (client_id, day, total, errors, entries)
+        SELECT client_id,
+               created_at::date,
+               count(*),
+               count(*) FILTER (WHERE level = 'error'),
+               jsonb_agg(to_jsonb(moved) ORDER BY created_at)
+        FROM moved
+        GROUP BY client_id, created_at::date
+        ON CONFLICT ((COALESCE(client_id, '00000000-0000-0000-0000-000000000000'::uuid)), day)
+        DO UPDATE SET
+            total   = logs_archive.total + EXCLUDED.total,
+            errors  = logs_archive.errors + EXCLUDED.errors,
+            entries = logs_archive.entries || EXCLUDED.entries
+        RETURNING 1
+    )
+    SELECT count(*) INTO v_moved FROM moved;
+
+    RETURN v_moved;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+-- Sem políticas: só o backend (service_role, que ignora RLS) acessa estas tabelas
+ALTER TABLE logs_archive ENABLE ROW LEVEL SECURITY;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION strip_log_metadata(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION archive_old_logs(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION strip_log_metadata(INTEGER, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION archive_old_logs(INTEGER, INTEGER) TO service_role;
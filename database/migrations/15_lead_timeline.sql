@@ -0,0 +1,86 @@
+-- /leads/{id} em uma única chamada: lead, respostas e timeline (events + logs) já
+-- mesclada e ordenada no banco, paginada por (created_at, id).
+
+CREATE INDEX IF NOT EXISTS idx_events_lead_created ON events(lead_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_logs_lead_created   ON logs(lead_id, created_at DESC, id DESC);
+
+-- Retorna NULL se o lead não existir ou não pertencer ao cliente.
+-- A timeline traz até p_limit + 1 itens: o item extra indica que há próxima página.
+CREATE OR REPLACE FUNCTION get_lead_timeline(
+    p_lead_id    UUID,
+    p_client_id  UUID,
+    p_limit      INTEGER DEFAULT 100,
+    p_before     TIMESTAMPTZ DEFAULT NULL,
+    p_before_id  UUID DEFAULT NULL
+) RETURNS JSONB AS $$
+    WITH lead AS (
+        SELECT l.*
+        FROM leads l
+        WHERE l.id = p_lead_id AND l.client_id = p_client_id
+    ),
+    items AS (
+        (
+            SELECT e.id, e.created_at,
+                   to_jsonb(e) AS item
+            FROM events e
+            WHERE e.lead_id = p_lead_id
+              AND (p_before IS NULL OR (e.created_at, e.id) < (p_before, p_before_id))
+            ORDER BY e.created_at DESC, e.id DESC
+            LIMIT p_limit + 1
+        )
+        UNION ALL
+        (
+            SELECT g.id, g.created_at,
+                   jsonb_build_object(
+                       'id',         g.id,
+                       'event_type', 'log_' || g.level,
+                       'created_at', g.created_at,
+                       'metadata',   jsonb_build_object(
+                           'source',  g.source,
+                           'message', g.message,
+                           'details', g.metadata
+                       ),
+                       'is_log',     true
+                   ) AS item
+            FROM logs g
+            WHERE g.lead_id = p_lead_id
+              AND (p_before IS NULL OR (g.created_at, g.id) < (p_before, p_before_id))
+            ORDER BY g.created_at DESC, g.id DESC
+            LIMIT p_limit + 1
+        )
+    ),
+    page AS (
+        SELECT item, created_at, id
+        FROM items
+        ORDER BY created_at DESC, id DESC
+        LIMIT p_limit + 1
+    )
+    SELECT jsonb_build_object(
+        'lead', to_jsonb(lead) || jsonb_build_object(
+            'creatives', (
+                SELECT jsonb_build_object('name', c.name, 'thumbnail_url', c.thumbnail_url)
+                FROM creatives c WHERE c.id = lead.creative_id
+            )
+        ),
+        'responses', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'response_value', r.response_value,
+                'form_fields',    CASE WHEN f.id IS NULL THEN NULL
+                                       ELSE jsonb_build_object('label', f.label_default) END
+            ))
+            FROM lead_responses r
+            LEFT JOIN form_fields f ON f.id = r.field_id
+            WHERE r.lead_id = p_lead_id
+        ), '[]'::jsonb),
+        'timeline', COALESCE((
+            SELECT jsonb_agg(item ORDER BY created_at DESC, id DESC) FROM page
+        ), '[]'::jsonb)
+    )
+    FROM lead;
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION get_lead_timeline(UUID, UUID, INTEGER, TIMESTAMPTZ, UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_lead_timeline(UUID, UUID, INTEGER, TIMESTAMPTZ, UUID) TO service_role;
@@ -0,0 +1,83 @@
+-- Kanban: top N leads por coluna + contagens em uma única consulta agrupada,
+-- e atualização de status em massa em um único UPDATE.
+
+CREATE INDEX IF NOT EXISTS idx_leads_client_status_created ON leads(client_id, status, created_at DESC);
+
+-- Coluna do board para um lead (mesmo mapeamento do frontend/admin/kanban.js)
+CREATE OR REPLACE FUNCTION kanban_column(p_status TEXT, p_consent_given BOOLEAN, p_name TEXT)
+RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN p_status = 'cold' AND NOT COALESCE(p_consent_given, false) AND p_name IS NOT NULL THEN 'abandoned'
+        WHEN p_status = 'started' THEN 'abandoned'
+        WHEN p_status IN ('hot', 'warm', 'cold', 'abandoned', 'negotiation', 'converted', 'trash') THEN p_status
+        ELSE 'cold'
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION get_kanban_board(
+    p_client_id   UUID,
+    p_per_column  INTEGER DEFAULT 50
+) RETURNS JSONB AS $$
+    WITH ranked AS (
+        SELECT
+            kanban_column(l.status, l.consent_given, l.name) AS board_column,
+            row_number() OVER (
+                PARTITION BY kanban_column(l.status, l.consent_given, l.name)
+                ORDER BY l.created_at DESC
+            ) AS rn,
+            count(*) OVER (PARTITION BY kanban_column(l.status, l.consent_given, l.name)) AS total,
+            jsonb_build_object(
+                'id',             l.id,
+                'name',           l.name,
+                'phone',          l.phone,
+                'status',         l.status,
+                'internal_score', l.internal_score,
+                'external_score', l.external_score,
+                'serasa_score',   l.serasa_score,
+                'step_reached',   l.step_reached,
+                'device_type',    l.device_type,
+                'utm_content',    l.utm_content,
+                'consent_given',  l.consent_given,
+                'created_at',     l.created_at
+            ) AS card
+        FROM leads l
+        WHERE l.client_id = p_client_id
+    )
+    SELECT jsonb_build_object(
+        'counts', COALESCE((
+            SELECT jsonb_object_agg(board_column, total)
+            FROM (SELECT DISTINCT board_column, total FROM ranked) c
+        ), '{}'::jsonb),
+        'columns', COALESCE((
+            SELECT jsonb_object_agg(board_column, cards)
+            FROM (
+                SELECT board_column, jsonb_agg(card ORDER BY rn) AS cards
+                FROM ranked
+                WHERE rn <= p_per_column
+                GROUP BY board_column
+            ) c
+        ), '{}'::jsonb)
+    );
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- p_moves: [{"lead_id": "...", "status": "..."}]. Retorna os leads atualizados.
+CREATE OR REPLACE FUNCTION bulk_update_lead_status(
+    p_client_id UUID,
+    p_moves     JSONB
+) RETURNS SETOF leads AS $$
+    UPDATE leads l
+    SET status = m.status
+    FROM jsonb_to_recordset(p_moves) AS m(lead_id UUID, status TEXT)
+    WHERE l.id = m.lead_id
+      AND l.client_id = p_client_id
+    RETURNING l.*;
+$$ LANGUAGE sql SECURITY DEFINER
+SET search_path = public;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION get_kanban_board(UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION bulk_update_lead_status(UUID, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_kanban_board(UUID, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION bulk_update_lead_status(UUID, JSONB) TO service_role;
@@ -0,0 +1,18 @@
+-- Busca de leads por índice em vez de ilike '%termo%' com varredura sequencial.
+-- name: GIN pg_trgm (atende ilike '%termo%' a partir de 3 caracteres)
+-- phone: coluna gerada só com dígitos + GIN pg_trgm (atende like '%dígitos%', ex. os
+--        últimos 4 dígitos do telefone)
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE leads ADD COLUMN IF NOT EXISTS phone_digits TEXT
+    GENERATED ALWAYS AS (regexp_replace(COALESCE(phone, ''), '\D', '', 'g')) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_leads_name_trgm
+    ON leads USING gin (name gin_trgm_ops);
+
+-- O btree de prefixo só atendia like 'dígitos%'; o trigram cobre prefixo e substring
+DROP INDEX IF EXISTS idx_leads_client_phone_digits;
+
+CREATE INDEX IF NOT EXISTS idx_leads_phone_digits_trgm
+    ON leads USING gin (phone_digits gin_trgm_ops);
@@ -0,0 +1,108 @@
+-- Outbox persistente de webhooks: os eventos são gravados aqui na origem e entregues
+-- por um dispatcher em background com retentativas (backoff exponencial).
+
+ALTER TABLE webhooks ADD COLUMN IF NOT EXISTS batch_delivery BOOLEAN DEFAULT false;
+
+CREATE TABLE IF NOT EXISTS webhook_outbox (
+    id               UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    client_id        UUID REFERENCES clients(id) ON DELETE CASCADE,
+    webhook_id       UUID REFERENCES webhooks(id) ON DELETE CASCADE,
+    url              TEXT NOT NULL,
+    event            TEXT NOT NULL,
+    lead_id          UUID,
+    payload          JSONB NOT NULL,
+    batch            BOOLEAN DEFAULT false,
+    status           TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'delivered', 'dead')),
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_status_code INTEGER,
+    last_error       TEXT,
+    created_at       TIMESTAMPTZ DEFAULT NOW(),
+    delivered_at     TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_due
+    ON webhook_outbox(next_attempt_at) WHERE status = 'pending';
+
+-- Reserva até p_limit entregas vencidas. As linhas ficam "alugadas" por p_lease_seconds:
+-- se o worker morrer antes de registrar o resultado, voltam a ficar disponíveis.
+-- SKIP LOCKED permite vários workers/instâncias consumindo em paralelo.
+CREATE OR REPLACE FUNCTION claim_webhook_outbox(p_limit INTEGER DEFAULT 100, p_lease_seconds INTEGER DEFAULT 60)
+RETURNS SETOF webhook_outbox AS $$
+    UPDATE webhook_outbox o
+    SET next_attempt_at = NOW() + make_interval(secs => p_lease_seconds)
+    WHERE o.id IN (
+        SELECT id FROM webhook_outbox
+        WHERE status = 'pending' AND next_attempt_at <= NOW()
+        ORDER BY next_attempt_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING o.*;
+$$ LANGUAGE sql SECURITY DEFINER
+SET search_path = public;
+
+-- p_results: [{"id", "status", "attempts", "next_attempt_at", "last_status_code", "last_error"}]
+CREATE OR REPLACE FUNCTION finish_webhook_deliveries(p_results JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE webhook_outbox o
+    SET status           = r.status,
+        attempts         = r.attempts,
+        next_attempt_at  = COALESCE(r.next_attempt_at, o.next_attempt_at),
+        last_status_code = r.last_status_code,
+        last_error       = r.last_error,
+        delivered_at     = CASE WHEN r.status = 'delivered' THEN NOW() ELSE o.delivered_at END
+    FROM jsonb_to_recordset(p_results) AS r(
+        id UUID, status TEXT, attempts INTEGER, next_attempt_at TIMESTAMPTZ,
+        last_status_code INTEGER, last_error TEXT
+    )
+    WHERE o.id = r.id;
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+CREATE OR REPLACE FUNCTION webhook_outbox_depth()
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'pending', count(*) FILTER (WHERE status = 'pending'),
+        'due',     count(*) FILTER (WHERE status = 'pending' AND next_attempt_at <= NOW()),
+        'dead',    count(*) FILTER (WHERE status = 'dead'),
+        'oldest_pending', min(created_at) FILTER (WHERE status = 'pending')
+    )
+    FROM webhook_outbox
+    WHERE status <> 'delivered';
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- Remove entregas concluídas há mais de p_days dias
+CREATE OR REPLACE FUNCTION purge_webhook_outbox(p_days INTEGER DEFAULT 7)
+RETURNS INTEGER AS $$
+DECLARE
+    v_deleted INTEGER;
+BEGIN
+    DELETE FROM webhook_outbox
+    WHERE status IN ('delivered', 'dead') AND created_at < NOW() - make_interval(days => p_days);
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+    RETURN v_deleted;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+-- Sem políticas: só o backend (service_role, que ignora RLS) acessa estas tabelas
+ALTER TABLE webhook_outbox ENABLE ROW LEVEL SECURITY;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION claim_webhook_outbox(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION finish_webhook_deliveries(JSONB) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION webhook_outbox_depth() FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION purge_webhook_outbox(INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_webhook_outbox(INTEGER, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION finish_webhook_deliveries(JSONB) TO service_role;
+GRANT EXECUTE ON FUNCTION webhook_outbox_depth() TO service_role;
+GRANT EXECUTE ON FUNCTION purge_webhook_outbox(INTEGER) TO service_role;
@@ -0,0 +1,43 @@
+-- Sync incremental da Meta: marca d'água por conta de anúncio e atualização de
+-- métricas de criativos em lote (sem reenviar os dados cadastrais do anúncio).
+
+CREATE TABLE IF NOT EXISTS meta_sync_state (
+    ad_account_id     UUID REFERENCES ad_accounts(id) ON DELETE CASCADE,
+    account_id        TEXT NOT NULL,            -- act_<id> na Meta
+    synced_until      TIMESTAMPTZ NOT NULL,     -- início do último sync bem-sucedido
+    last_full_sync_at TIMESTAMPTZ,
+    stats             JSONB DEFAULT '{}'::jsonb,
+    updated_at        TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (ad_account_id, account_id)
+);
+
+-- p_rows: [{"external_id", "spend_cents", "clicks", "impressions", "ctr"}]
+CREATE OR REPLACE FUNCTION apply_creative_insights(p_client_id UUID, p_rows JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE creatives c
+    SET spend_cents       = r.spend_cents,
+        clicks            = r.clicks,
+        impressions       = r.impressions,
+        ctr               = r.ctr,
+        last_metrics_sync = NOW()
+    FROM jsonb_to_recordset(p_rows) AS r(
+        external_id TEXT, spend_cents INTEGER, clicks INTEGER, impressions INTEGER, ctr NUMERIC
+    )
+    WHERE c.external_id = r.external_id
+      AND c.client_id = p_client_id;
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+-- Sem políticas: só o backend (service_role, que ignora RLS) acessa estas tabelas
+ALTER TABLE meta_sync_state ENABLE ROW LEVEL SECURITY;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION apply_creative_insights(UUID, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_creative_insights(UUID, JSONB) TO service_role;
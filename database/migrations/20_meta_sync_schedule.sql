@@ -0,0 +1,85 @@
+-- Agenda do sync Meta por cliente: cada cliente tem seu próximo horário (espalhado ao
+-- longo do intervalo) e é reservado por um único worker/instância por vez.
+
+CREATE TABLE IF NOT EXISTS meta_sync_schedule (
+    client_id        UUID PRIMARY KEY REFERENCES clients(id) ON DELETE CASCADE,
+    next_run_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_by        TEXT,
+    locked_until     TIMESTAMPTZ,
+    last_started_at  TIMESTAMPTZ,
+    last_finished_at TIMESTAMPTZ,
+    last_duration_ms INTEGER,
+    last_status      TEXT,
+    last_error       TEXT,
+    last_summary     JSONB
+);
+
+CREATE INDEX IF NOT EXISTS idx_meta_sync_schedule_due ON meta_sync_schedule(next_run_at);
+
+-- Inclui clientes novos com ad_accounts Meta (primeira execução em um ponto aleatório
+-- dos próximos p_spread_seconds) e reserva até p_limit clientes vencidos por
+-- p_lease_seconds. SKIP LOCKED + lease impedem que dois workers sincronizem o mesmo
+-- cliente; se o worker morrer, o cliente volta a ficar disponível ao fim do lease.
+CREATE OR REPLACE FUNCTION claim_meta_syncs(
+    p_worker TEXT,
+    p_limit INTEGER DEFAULT 4,
+    p_lease_seconds INTEGER DEFAULT 3600,
+    p_spread_seconds INTEGER DEFAULT 14400
+)
+RETURNS SETOF meta_sync_schedule AS $$
+BEGIN
+    INSERT INTO meta_sync_schedule (client_id, next_run_at)
+    SELECT DISTINCT a.client_id, NOW() + random() * make_interval(secs => p_spread_seconds)
+    FROM ad_accounts a
+    WHERE a.platform = 'meta' AND a.client_id IS NOT NULL
+    ON CONFLICT (client_id) DO NOTHING;
+
+    RETURN QUERY
+    UPDATE meta_sync_schedule s
+    SET locked_by       = p_worker,
+        locked_until    = NOW() + make_interval(secs => p_lease_seconds),
+        last_started_at = NOW()
+    WHERE s.client_id IN (
+        SELECT client_id FROM meta_sync_schedule
+        WHERE next_run_at <= NOW() AND (locked_until IS NULL OR locked_until < NOW())
+        ORDER BY next_run_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING s.*;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+CREATE OR REPLACE FUNCTION finish_meta_sync(
+    p_client_id UUID,
+    p_worker TEXT,
+    p_status TEXT,
+    p_duration_ms INTEGER,
+    p_next_run_at TIMESTAMPTZ,
+    p_error TEXT DEFAULT NULL,
+    p_summary JSONB DEFAULT NULL
+)
+RETURNS VOID AS $$
+    UPDATE meta_sync_schedule
+    SET next_run_at      = p_next_run_at,
+        locked_by        = NULL,
+        locked_until     = NULL,
+        last_finished_at = NOW(),
+        last_duration_ms = p_duration_ms,
+        last_status      = p_status,
+        last_error       = p_error,
+        last_summary     = p_summary
+    WHERE client_id = p_client_id AND locked_by = p_worker;
+$$ LANGUAGE sql SECURITY DEFINER
+SET search_path = public;
+
+-- Sem políticas: só o backend (service_role, que ignora RLS) acessa estas tabelas
+ALTER TABLE meta_sync_schedule ENABLE ROW LEVEL SECURITY;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION claim_meta_syncs(TEXT, INTEGER, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION finish_meta_sync(UUID, TEXT, TEXT, INTEGER, TIMESTAMPTZ, TEXT, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_meta_syncs(TEXT, INTEGER, INTEGER, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION finish_meta_sync(UUID, TEXT, TEXT, INTEGER, TIMESTAMPTZ, TEXT, JSONB) TO service_role;
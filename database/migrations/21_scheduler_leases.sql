@@ -0,0 +1,74 @@
+-- Eleição de líder para os jobs do APScheduler: cada job tem um lease que só um
+-- worker/instância mantém por vez. O dono renova o lease periodicamente; se morrer,
+-- o lease expira e outro worker assume no heartbeat seguinte.
+
+CREATE TABLE IF NOT EXISTS scheduler_leases (
+    job              TEXT PRIMARY KEY,
+    holder           TEXT NOT NULL,
+    acquired_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at       TIMESTAMPTZ NOT NULL,
+    last_run_at      TIMESTAMPTZ,
+    last_run_by      TEXT,
+    last_duration_ms INTEGER,
+    last_status      TEXT,
+    last_error       TEXT
+);
+
+-- Adquire (livres ou expirados) ou renova (já do p_holder) os leases de p_jobs.
+-- Retorna os jobs que ficaram com p_holder.
+CREATE OR REPLACE FUNCTION renew_scheduler_leases(p_holder TEXT, p_jobs TEXT[], p_ttl_seconds INTEGER DEFAULT 60)
+RETURNS SETOF TEXT AS $$
+    INSERT INTO scheduler_leases AS l (job, holder, acquired_at, expires_at)
+    SELECT j, p_holder, NOW(), NOW() + make_interval(secs => p_ttl_seconds)
+    FROM unnest(p_jobs) AS j
+    ON CONFLICT (job) DO UPDATE
+    SET holder      = EXCLUDED.holder,
+        acquired_at = CASE WHEN l.holder = EXCLUDED.holder THEN l.acquired_at ELSE NOW() END,
+        expires_at  = EXCLUDED.expires_at
+    WHERE l.holder = EXCLUDED.holder OR l.expires_at < NOW()
+    RETURNING job;
+$$ LANGUAGE sql SECURITY DEFINER
+SET search_path = public;
+
+-- Libera os leases no shutdown para o failover não esperar a expiração
+CREATE OR REPLACE FUNCTION release_scheduler_leases(p_holder TEXT)
+RETURNS INTEGER AS $$
+DECLARE
+    v_released INTEGER;
+BEGIN
+    UPDATE scheduler_leases SET expires_at = NOW() WHERE holder = p_holder;
+    GET DIAGNOSTICS v_released = ROW_COUNT;
+    RETURN v_released;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+CREATE OR REPLACE FUNCTION record_scheduler_run(
+    p_job TEXT,
+    p_holder TEXT,
+    p_status TEXT,
+    p_duration_ms INTEGER,
+    p_error TEXT DEFAULT NULL
+)
+RETURNS VOID AS $$
+    UPDATE scheduler_leases
+    SET last_run_at      = NOW(),
+        last_run_by      = p_holder,
+        last_duration_ms = p_duration_ms,
+        last_status      = p_status,
+        last_error       = p_error
+    WHERE job = p_job;
+$$ LANGUAGE sql SECURITY DEFINER
+SET search_path = public;
+
+-- Sem políticas: só o backend (service_role, que ignora RLS) acessa estas tabelas
+ALTER TABLE scheduler_leases ENABLE ROW LEVEL SECURITY;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION renew_scheduler_leases(TEXT, TEXT[], INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION release_scheduler_leases(TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION record_scheduler_run(TEXT, TEXT, TEXT, INTEGER, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION renew_scheduler_leases(TEXT, TEXT[], INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION release_scheduler_leases(TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION record_scheduler_run(TEXT, TEXT, TEXT, INTEGER, TEXT) TO service_role;
@@ -0,0 +1,56 @@
+-- Regras de pontuação por cliente (services.scoring_engine) e repontuação em lote
+-- dos leads quando as regras mudam.
+
+CREATE TABLE IF NOT EXISTS client_scoring_rules (
+    client_id  UUID PRIMARY KEY REFERENCES clients(id) ON DELETE CASCADE,
+    rules      JSONB NOT NULL,
+    version    INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Respostas de cada lead como objeto {field_key: valor}, paginado por id (keyset)
+CREATE OR REPLACE FUNCTION get_lead_answers(p_client_id UUID, p_after UUID DEFAULT NULL, p_limit INTEGER DEFAULT 5000)
+RETURNS TABLE (id UUID, phone TEXT, internal_score INTEGER, answers JSONB) AS $$
+    SELECT l.id, l.phone, l.internal_score,
+           COALESCE(a.answers, '{}'::jsonb)
+    FROM leads l
+    LEFT JOIN LATERAL (
+        SELECT jsonb_object_agg(f.field_key, r.response_value ORDER BY r.created_at) AS answers
+        FROM lead_responses r
+        JOIN form_fields f ON f.id = r.field_id
+        WHERE r.lead_id = l.id
+    ) a ON true
+    WHERE l.client_id = p_client_id
+      AND (p_after IS NULL OR l.id > p_after)
+    ORDER BY l.id
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE SECURITY DEFINER
+SET search_path = public;
+
+-- p_rows: [{"id", "internal_score"}]
+CREATE OR REPLACE FUNCTION apply_lead_scores(p_client_id UUID, p_rows JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE leads l
+    SET internal_score = r.internal_score
+    FROM jsonb_to_recordset(p_rows) AS r(id UUID, internal_score INTEGER)
+    WHERE l.id = r.id
+      AND l.client_id = p_client_id
+      AND l.internal_score IS DISTINCT FROM r.internal_score;
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER
+SET search_path = public;
+
+-- Sem políticas: só o backend (service_role, que ignora RLS) acessa estas tabelas
+ALTER TABLE client_scoring_rules ENABLE ROW LEVEL SECURITY;
+
+-- SECURITY DEFINER ignora RLS e o Supabase concede EXECUTE a anon/authenticated por
+-- padrão: só o backend (service_role) pode chamar estas funções.
+REVOKE EXECUTE ON FUNCTION get_lead_answers(UUID, UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION apply_lead_scores(UUID, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_lead_answers(UUID, UUID, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION apply_lead_scores(UUID, JSONB) TO service_role;
@@ -0,0 +1,13 @@
+-- Configuração pública do formulário pré-renderizada por cliente (services.form_config).
+-- Reconstruída quando o cliente salva o formulário ou altera nome/marca/plano; o
+-- endpoint público lê uma linha por chave primária em vez do join com form_fields.
+
+CREATE TABLE IF NOT EXISTS public_form_configs (
+    client_id  UUID PRIMARY KEY REFERENCES clients(id) ON DELETE CASCADE,
+    payload    JSONB NOT NULL,
+    etag       TEXT NOT NULL,
+    built_at   TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Sem políticas: só o backend (service_role, que ignora RLS) acessa estas tabelas
+ALTER TABLE public_form_configs ENABLE ROW LEVEL SECURITY;
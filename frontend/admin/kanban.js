@@ -19,7 +19,8 @@ const STATUS_COLORS = {
     'trash': '#4B5563'
 };
 
-function renderKanbanBoard(leads) {
+// counts (opcional): totais por coluna vindos de /leads/board, quando cada coluna traz só os primeiros N leads
+function renderKanbanBoard(leads, columnCounts) {
     const board = document.getElementById("kanban-board");
     if (!board) return;
 
@@ -81,6 +82,7 @@ function renderKanbanBoard(leads) {
     });
 
     // Atualiza contadores na UI
+    if (columnCounts) KANBAN_COLUMNS.forEach(s => counts[s] = columnCounts[s] || 0);
     KANBAN_COLUMNS.forEach(s => {
         const el = document.getElementById(`count-${s}`);
         if (el) el.innerText = counts[s];
@@ -133,7 +135,8 @@ function renderKanbanBoard(leads) {
 
     // Atualiza contador total
     const totalEl = document.getElementById('kanban-total');
-    if (totalEl) totalEl.textContent = `${leads.length} lead${leads.length !== 1 ? 's' : ''}`;
+    const total = columnCounts ? KANBAN_COLUMNS.reduce((sum, s) => sum + counts[s], 0) : leads.length;
+    if (totalEl) totalEl.textContent = `${total} lead${total !== 1 ? 's' : ''}`;
 }
 
 function createKanbanCard(lead) {
@@ -199,21 +202,42 @@ function updateCount(status, change) {
     }
 }
 
-async function updateLeadStatus(leadId, newStatus) {
-    const session = await Auth.checkAuth();
-    if (!session) throw new Error("No session");
-
-    const res = await fetch(`${Auth.API_URL}/leads/${leadId}`, {
-        method: "PATCH",
-        headers: {
-            "Content-Type": "application/json",
-            "Authorization": `Bearer ${session.access_token}`
-        },
-        body: JSON.stringify({ status: newStatus })
+// Movimentos do Kanban são agrupados por alguns ms e enviados em uma única requisição
+const pendingMoves = [];
+let movesTimer = null;
+
+function updateLeadStatus(leadId, newStatus) {
+    return new Promise((resolve, reject) => {
+        pendingMoves.push({ lead_id: leadId, status: newStatus, resolve, reject });
+        clearTimeout(movesTimer);
+        movesTimer = setTimeout(flushLeadMoves, 300);
     });
+}
+
+async function flushLeadMoves() {
+    const batch = pendingMoves.splice(0);
+    if (!batch.length) return;
+
+    try {
+        const session = await Auth.checkAuth();
+        if (!session) throw new Error("No session");
 
-    if (!res.ok) throw new Error("API Error");
-    return await res.json();
+        const res = await fetch(`${Auth.API_URL}/leads/bulk-status`, {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json",
+                "Authorization": `Bearer ${session.access_token}`
+            },
+            body: JSON.stringify({ moves: batch.map(m => ({ lead_id: m.lead_id, status: m.status })) })
+        });
+
+        if (!res.ok) throw new Error("API Error");
+        const json = await res.json();
+        const updated = new Set(json.updated || []);
+        batch.forEach(m => updated.has(m.lead_id) ? m.resolve(json) : m.reject(new Error("Lead não atualizado")));
+    } catch (e) {
+        batch.forEach(m => m.reject(e));
+    }
 }
 
 function fireConfetti() {
@@ -19,10 +19,39 @@
         referrer: document.referrer
     };
 
-    // Função de envio (Beacon / Fetch Keepalive)
+    // Eventos são agrupados e enviados em lote (um beacon por janela de FLUSH_MS)
+    const FLUSH_MS = 2000;
+    const MAX_BATCH = 50;
+    let queue = [];
+    let flushTimer = null;
+
+    function flush() {
+        if (flushTimer) {
+            clearTimeout(flushTimer);
+            flushTimer = null;
+        }
+        while (queue.length) {
+            const events = queue.splice(0, MAX_BATCH);
+            const body = JSON.stringify({ client_id: CLIENT_ID, events: events });
+
+            // Tenta Beacon primeiro
+            if (navigator.sendBeacon) {
+                const blob = new Blob([body], { type: 'application/json' });
+                if (navigator.sendBeacon(`${API_URL}/scanner/events`, blob)) continue;
+            }
+
+            // Fallback Fetch Keepalive
+            fetch(`${API_URL}/scanner/events`, {
+                method: 'POST',
+                body: body,
+                headers: { 'Content-Type': 'application/json' },
+                keepalive: true
+            }).catch(() => {});
+        }
+    }
+
     function sendEvent(type, meta = {}) {
-        const payload = {
-            client_id: CLIENT_ID,
+        queue.push({
             event_type: type,
             page_url: STATE.url,
             metadata: {
@@ -32,23 +61,13 @@
                 screen_width: window.screen.width,
                 ...meta
             }
-        };
+        });
 
-        const blob = new Blob([JSON.stringify(payload)], { type: 'application/json' });
-
-        // Tenta Beacon primeiro
-        if (navigator.sendBeacon) {
-            const success = navigator.sendBeacon(`${API_URL}/scanner/event`, blob);
-            if (success) return;
+        if (queue.length >= MAX_BATCH) {
+            flush();
+        } else if (!flushTimer) {
+            flushTimer = setTimeout(flush, FLUSH_MS);
         }
-
-        // Fallback Fetch Keepalive
-        fetch(`${API_URL}/scanner/event`, {
-            method: 'POST',
-            body: JSON.stringify(payload),
-            headers: { 'Content-Type': 'application/json' },
-            keepalive: true
-        }).catch(() => {});
     }
 
     // 1. Page View
@@ -89,6 +108,8 @@
     document.addEventListener("visibilitychange", () => {
         if (document.visibilityState === 'hidden') {
             sendEvent("time_on_page");
+            // A página pode ser descartada: envia o lote agora
+            flush();
         }
     });
 
@@ -98,6 +119,7 @@
             // leadData: { email, phone, name ... }
             // Opcional: enviar evento específico ou chamar API de lead
             sendEvent("lead_capture", leadData);
+            flush();
         }
     };
 